@@ -0,0 +1,85 @@
+"""Benchmark: peak memory of mixing looped background music, aloop vs. -stream_loop.
+
+Usage:
+    python benchmarks/bench_music_memory.py [--duration S] [--music S] [--repeat N]
+
+Renders the audio track of a timeline (avatar audio, loudness
+normalization, looped music with fade-out) to a null output and reports
+the peak resident set size of the FFmpeg process. The baseline loops the
+music with aloop=loop=-1:size=2e+09, which keeps every decoded sample of
+the track in memory; the current graph re-reads the file with
+-stream_loop -1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+from ugckit.audio import build_audio_graph
+from ugckit.graph import FilterGraph
+from ugckit.models import Config, Timeline, TimelineEntry
+
+
+def make_audio(path: Path, duration: float, freq: int) -> Path:
+    cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=f={freq}:r=48000:d={duration}"]
+    cmd += ["-ac", "2", "-c:a", "aac", str(path)]
+    subprocess.run(cmd, capture_output=True, check=True)
+    return path
+
+
+def aloop_graph(graph: FilterGraph) -> FilterGraph:
+    """The previous music loop: a plain input looped in the graph with aloop."""
+    for inp in graph.inputs:
+        if inp.options == ("-stream_loop", "-1"):
+            inp.options = ()
+            for node in graph.readers(inp.audio):
+                loop = graph.filter("aloop", "loop=-1:size=2e+09", [inp.audio])
+                node.inputs = [loop if pad is inp.audio else pad for pad in node.inputs]
+    return graph
+
+
+def peak_rss_mb(cmd: list[str]) -> float:
+    """Run cmd and return the peak resident set size of the process in MiB."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    if status != 0:
+        raise subprocess.CalledProcessError(status, cmd)
+    return usage.ru_maxrss / 1024  # KiB on Linux
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=600.0, help="render length (s)")
+    parser.add_argument("--music", type=float, default=240.0, help="music track length (s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config = Config()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        avatar = make_audio(tmp_path / "avatar.m4a", args.duration, 440)
+        music = make_audio(tmp_path / "music.m4a", args.music, 220)
+        entries = [
+            TimelineEntry(start=0, end=args.duration, type="avatar", file=avatar, parent_segment=1)
+        ]
+        timeline = Timeline(script_id="BENCH", total_duration=args.duration, entries=entries)
+
+        for name in ("aloop", "stream_loop"):
+            graph = build_audio_graph(timeline, config, [True], music_file=music)
+            if name == "aloop":
+                graph = aloop_graph(graph)
+            cmd = (
+                ["ffmpeg", "-nostdin"]
+                + graph.input_args()
+                + ["-filter_complex", graph.to_string(), "-map", "[aout]", "-f", "null", "-"]
+            )
+            peak = max(peak_rss_mb(cmd) for _ in range(args.repeat))
+            print(f"{name:>11}: peak RSS {peak:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
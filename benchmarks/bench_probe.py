@@ -0,0 +1,77 @@
+"""Benchmark: MP4 container reader vs. ffprobe subprocess.
+
+Usage:
+    python benchmarks/bench_probe.py [VIDEO ...] [--repeat N]
+
+Without arguments, generates a few synthetic 1080x1920 clips with ffmpeg.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from ugckit.composer import _run_ffprobe
+from ugckit.mp4 import read_mp4
+
+
+def make_clip(path: Path, duration: float) -> Path:
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=s=1080x1920:r=30:d={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        "sine=f=440:r=48000",
+        "-t",
+        str(duration),
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-c:a",
+        "aac",
+        str(path),
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+    return path
+
+
+def time_calls(fn, paths: list[Path], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        for path in paths:
+            start = time.perf_counter()
+            fn(path)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("videos", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.videos or [make_clip(Path(tmp) / f"clip{i}.mp4", 8.0) for i in range(3)]
+
+        for name, fn in [("mp4 reader", read_mp4), ("ffprobe", _run_ffprobe)]:
+            samples = time_calls(fn, paths, args.repeat)
+            print(
+                f"{name:>10}: median {statistics.median(samples) * 1000:8.3f} ms"
+                f"  p95 {sorted(samples)[int(len(samples) * 0.95)] * 1000:8.3f} ms"
+                f"  ({len(samples)} probes)"
+            )
+
+
+if __name__ == "__main__":
+    main()
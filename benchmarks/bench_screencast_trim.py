@@ -0,0 +1,108 @@
+"""Benchmark: input-trimmed screencasts vs. full-length screencast decode.
+
+Usage:
+    python benchmarks/bench_screencast_trim.py [--overlays N] [--duration S] [--repeat N]
+
+Builds a timeline with one long avatar clip and N short overlays, each cut
+from a screencast as long as the whole video, and times the render with
+the current command (screencasts trimmed at the input) against the same
+command with trimming removed, where FFmpeg decodes every screencast from
+the start of the output.
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from ugckit.composer import compose_video
+from ugckit.models import Config, Timeline, TimelineEntry
+
+
+def make_clip(path: Path, duration: float, size: str, audio: bool) -> Path:
+    cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=s={size}:r=30:d={duration}"]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", "sine=f=440:r=48000", "-t", str(duration), "-c:a", "aac"]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", str(path)]
+    subprocess.run(cmd, capture_output=True, check=True)
+    return path
+
+
+def untrimmed(cmd: list[str]) -> list[str]:
+    """Strip input-level trimming so screencasts decode from t=0 (old behavior)."""
+    out = []
+    skip = 0
+    for i, arg in enumerate(cmd):
+        if skip:
+            skip -= 1
+            continue
+        if arg == "-t" and i + 2 < len(cmd) and cmd[i + 2] == "-i":
+            skip = 1
+            continue
+        out.append(arg)
+    fc = out.index("-filter_complex") + 1
+    out[fc] = re.sub(r"setpts=PTS-STARTPTS\+[0-9.]+/TB,", "", out[fc])
+    return out
+
+
+def time_render(cmd: list[str], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--overlays", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=40.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        avatar = make_clip(tmp_path / "avatar.mp4", args.duration, "540x960", audio=True)
+        window = args.duration / args.overlays
+        entries = [
+            TimelineEntry(start=0, end=args.duration, type="avatar", file=avatar, parent_segment=1)
+        ]
+        for i in range(args.overlays):
+            screencast = make_clip(tmp_path / f"sc{i}.mp4", args.duration, "1280x720", audio=False)
+            start = i * window + window * 0.25
+            entries.append(
+                TimelineEntry(
+                    start=start,
+                    end=start + window * 0.5,
+                    type="screencast",
+                    file=screencast,
+                    parent_segment=1,
+                )
+            )
+        timeline = Timeline(
+            script_id="BENCH",
+            total_duration=args.duration,
+            entries=entries,
+            output_path=tmp_path / "out.mp4",
+        )
+        config = Config()
+        config.output.preset = "ultrafast"
+        config.output.resolution = (540, 960)
+        cmd = compose_video(timeline, config, dry_run=True)
+
+        for name, variant in [("trimmed", cmd), ("untrimmed", untrimmed(cmd))]:
+            samples = time_render(variant, args.repeat)
+            print(
+                f"{name:>10}: median {statistics.median(samples):7.2f} s"
+                f"  ({args.overlays} overlays, {args.duration:g} s output)"
+            )
+
+
+if __name__ == "__main__":
+    main()
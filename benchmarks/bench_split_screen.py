@@ -0,0 +1,131 @@
+"""Benchmark: split-screen graph throughput, per-interval vs. chained overlays.
+
+Usage:
+    python benchmarks/bench_split_screen.py [--screencasts 1 5 20] [--duration S] [--repeat N]
+
+Builds split-mode timelines with one avatar clip and N short screencasts
+and measures filtering throughput (frames per second, no encoding) of the
+current graph against the previous layout, which split the full-frame
+base once per screencast and overlaid the stacked frame back over it with
+an enable expression for the whole duration. As in that layout, its
+screencasts are decoded from the start of the output.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from ugckit.composer import (
+    _build_audio_pipeline,
+    _build_avatar_base,
+    _finalize_filter,
+    build_ffmpeg_filter_split,
+    probe_many,
+)
+from ugckit.graph import FilterGraph, optimize
+from ugckit.models import CompositionMode, Config, Timeline, TimelineEntry
+
+
+def make_clip(path: Path, duration: float, size: str, audio: bool) -> Path:
+    cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=s={size}:r=30:d={duration}"]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", "sine=f=440:r=48000", "-t", str(duration), "-c:a", "aac"]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", str(path)]
+    subprocess.run(cmd, capture_output=True, check=True)
+    return path
+
+
+def chained_split_graph(timeline: Timeline, config: Config) -> FilterGraph:
+    """The previous split-mode layout: one full-frame split + overlay per screencast."""
+    graph = FilterGraph()
+    w, h = config.output.resolution
+    avatar_w = int(w * config.composition.split.split_ratio)
+    avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
+    screencast_entries = [e for e in timeline.entries if e.type == "screencast"]
+
+    avatar_inputs = [graph.add_input(e.file, offset=e.start) for e in avatar_entries]
+    sc_sources = [graph.add_input(e.file).video for e in screencast_entries]
+    current = _build_avatar_base(graph, avatar_inputs, (w, h))
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, [True], timeline.total_duration
+    )
+    for i, entry in enumerate(screencast_entries):
+        screencast = graph.chain(sc_sources[i], f"scale={w - avatar_w}:{h}", "setsar=1")
+        avatar = graph.chain(current, f"crop={avatar_w}:{h}:0:0")
+        stacked = graph.filter("hstack", "inputs=2", [avatar, screencast])
+        enable = f"between(t,{entry.start:.2f},{entry.end:.2f})"
+        current = graph.filter("overlay", f"0:0:enable='{enable}'", [current, stacked])
+    return _finalize_filter(graph, current, audio, config)
+
+
+def filter_cmd(graph: FilterGraph) -> list[str]:
+    return (
+        ["ffmpeg", "-nostdin"]
+        + graph.input_args()
+        + ["-filter_complex", graph.to_string(), "-map", "[vout]", "-map", "[aout]"]
+        + ["-f", "null", "-"]
+    )
+
+
+def time_render(cmd: list[str], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--screencasts", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--duration", type=float, default=40.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config = Config()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        avatar = make_clip(tmp_path / "avatar.mp4", args.duration, "1080x1920", audio=True)
+        screencast = make_clip(tmp_path / "sc.mp4", args.duration, "1280x720", audio=False)
+        media = probe_many([avatar, screencast])
+        frames = args.duration * config.output.fps
+
+        for count in args.screencasts:
+            window = args.duration / count
+            entries = [
+                TimelineEntry(
+                    start=0, end=args.duration, type="avatar", file=avatar, parent_segment=1
+                )
+            ]
+            for i in range(count):
+                start = i * window + window * 0.25
+                entries.append(
+                    TimelineEntry(
+                        start=start,
+                        end=start + window * 0.5,
+                        type="screencast",
+                        file=screencast,
+                        parent_segment=1,
+                        composition_mode=CompositionMode.SPLIT,
+                    )
+                )
+            timeline = Timeline(script_id="BENCH", total_duration=args.duration, entries=entries)
+
+            variants = [
+                ("chained", chained_split_graph(timeline, config)),
+                ("interval", build_ffmpeg_filter_split(timeline, config, [True])),
+            ]
+            for name, graph in variants:
+                samples = time_render(filter_cmd(optimize(graph, media)), args.repeat)
+                fps = frames / statistics.median(samples)
+                print(f"{count:>3} screencasts {name:>9}: {fps:7.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
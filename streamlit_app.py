@@ -14,6 +14,8 @@ from ugckit.composer import (
     compose_video_with_progress,
     format_ffmpeg_cmd,
     format_timeline,
+    progressive_path,
+    render_frame,
 )
 from ugckit.config import load_config
 from ugckit.models import CompositionMode, Position
@@ -1089,6 +1091,11 @@ with col_settings:
         "H.264 — быстрое кодирование и широкая совместимость.</p></div>",
         unsafe_allow_html=True,
     )
+    watch_progressive = st.checkbox(
+        "Смотреть во время рендера",
+        value=cfg.output.progressive is not None,
+        help="Фрагментированный MP4: начало видео доступно, пока идёт кодирование.",
+    )
 
     # Audio target volume
     st.markdown(
@@ -1204,6 +1211,7 @@ with col_settings:
     # Apply global settings to config
     cfg.output.crf = crf
     cfg.output.codec = codec
+    cfg.output.progressive = "fmp4" if watch_progressive else None
     cfg.audio.normalize = normalize_audio
     cfg.audio.target_loudness = target_loudness
     if enable_subtitles:
@@ -1384,7 +1392,7 @@ with col_output:
             script_to_use = selected_script
             if enable_sync:
                 with st.spinner(f"Whisper ({whisper_model}) синхронизация..."):
-                    synced = apply_sync(selected_script, matched_avatars, whisper_model)
+                    synced = apply_sync(selected_script, matched_avatars, whisper_model, cfg)
                     if synced is not selected_script:
                         script_to_use = synced
                     else:
@@ -1403,6 +1411,27 @@ with col_output:
                     st.code(format_timeline(timeline))
                     cmd = compose_video(timeline, cfg, dry_run=True)
                     st.code(format_ffmpeg_cmd(cmd), language="bash")
+                    if st.button("Быстрое превью", use_container_width=True):
+                        preview_cfg = cfg.model_copy(deep=True)
+                        preview_cfg.preview.enabled = True
+                        preview_path = OUTPUT_DIR / f"{script_to_use.script_id}_preview.mp4"
+                        with st.spinner("Рендеринг превью..."):
+                            st.session_state["last_output"] = compose_video(
+                                timeline.model_copy(update={"output_path": preview_path}),
+                                preview_cfg,
+                                music_file=music_path,
+                            )
+                    frame_time = st.slider(
+                        "Кадр (сек)",
+                        min_value=0.0,
+                        max_value=max(0.0, timeline.total_duration - 0.1),
+                        value=0.0,
+                        step=0.1,
+                    )
+                    if st.button("Показать кадр", use_container_width=True):
+                        with st.spinner("Рендеринг кадра..."):
+                            frame = render_frame(timeline, cfg, frame_time)
+                        st.image(str(frame), caption=f"{frame_time:.1f} с")
             except (ValueError, FFmpegError) as e:
                 st.error(str(e))
                 timeline = None
@@ -1446,19 +1475,28 @@ with col_output:
                         st.warning("Субтитры не удалось сгенерировать.")
 
                 progress_bar = st.progress(0.0, text="Рендеринг...")
+                live_video = st.empty()
+                live_path = progressive_path(timeline.output_path, cfg)
+                live_shown = [0.0]
+
+                def on_progress(p: float) -> None:
+                    progress_bar.progress(p, text=f"Рендеринг... {p:.0%}")
+                    # Refresh the partial video every 20% of the render
+                    if live_path and p - live_shown[0] >= 0.2 and live_path.exists():
+                        live_shown[0] = p
+                        live_video.video(live_path.read_bytes())
+
                 result_path = compose_video_with_progress(
                     timeline,
                     cfg,
-                    progress_callback=lambda p: progress_bar.progress(
-                        p,
-                        text=f"Рендеринг... {p:.0%}",
-                    ),
+                    progress_callback=on_progress,
                     head_videos=head_videos,
                     transparent_avatars=transparent_avatars,
                     subtitle_file=subtitle_file,
                     music_file=music_path,
                 )
 
+                live_video.empty()
                 st.session_state["last_output"] = result_path
                 file_size_mb = result_path.stat().st_size / 1024 / 1024
                 st.success(f"Готово! {result_path.name} ({file_size_mb:.1f} МБ)")
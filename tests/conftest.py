@@ -3,11 +3,19 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import List
 
 import pytest
 
 from ugckit.config import load_config
-from ugckit.models import Config
+from ugckit.models import Config, Timeline, TimelineEntry
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep on-disk caches inside the test's temporary directory."""
+    monkeypatch.setenv("UGCKIT_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
 
 
 @pytest.fixture
@@ -83,3 +91,42 @@ def scripts_dir(tmp_dir: Path, sample_script_md: Path) -> Path:
     # Copy script into directory
     (d / "T1.md").write_text(sample_script_md.read_text())
     return d
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Replace FFmpeg with a stub that writes each command's output file.
+
+    Call it with the module under test: fake_ffmpeg(module) patches
+    module.run_ffmpeg and returns the list of commands run. Cached
+    transcodes (ugckit.cache.cached_transcode) run through ugckit.composer.
+    """
+
+    def install(module) -> List[List[str]]:
+        commands = []
+
+        def run(cmd, duration, progress_callback=None, stall_timeout=None, cancel=None):
+            Path(cmd[-1]).write_bytes(b"ffmpeg output")
+            commands.append(cmd)
+
+        monkeypatch.setattr(module, "run_ffmpeg", run)
+        return commands
+
+    return install
+
+
+@pytest.fixture
+def shared_file_timeline(tmp_dir: Path) -> Timeline:
+    """Two avatars sharing one file, plus a screencast (placeholder inputs)."""
+    for name in ("a.mp4", "sc.mp4"):
+        (tmp_dir / name).write_bytes(name.encode())
+    entries = [
+        TimelineEntry(start=0, end=8, type="avatar", file=tmp_dir / "a.mp4", parent_segment=1),
+        TimelineEntry(start=8, end=16, type="avatar", file=tmp_dir / "a.mp4", parent_segment=2),
+        TimelineEntry(
+            start=9, end=12, type="screencast", file=tmp_dir / "sc.mp4", parent_segment=2
+        ),
+    ]
+    return Timeline(
+        script_id="T1", total_duration=16.0, entries=entries, output_path=tmp_dir / "T1.mp4"
+    )
@@ -0,0 +1,129 @@
+"""Tests for ugckit.audio."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from ugckit import composer
+from ugckit.audio import audio_key, build_audio_cmd, build_audio_graph, render_audio
+from ugckit.composer import MediaInfo
+from ugckit.models import CompositionMode, Config, Timeline, TimelineEntry
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+
+def make_timeline(tmp_path: Path, mode: CompositionMode = CompositionMode.OVERLAY) -> Timeline:
+    """Two avatar clips and a screencast."""
+    for name in ("a0.mp4", "a1.mp4", "sc.mp4", "m.mp3"):
+        if not (tmp_path / name).exists():
+            (tmp_path / name).write_bytes(name.encode())
+    entries = [
+        TimelineEntry(start=0, end=4, type="avatar", file=tmp_path / "a0.mp4", parent_segment=1),
+        TimelineEntry(start=4, end=8, type="avatar", file=tmp_path / "a1.mp4", parent_segment=2),
+        TimelineEntry(
+            start=1,
+            end=3,
+            type="screencast",
+            file=tmp_path / "sc.mp4",
+            parent_segment=1,
+            composition_mode=mode,
+        ),
+    ]
+    return Timeline(
+        script_id="A1", total_duration=8.0, entries=entries, output_path=tmp_path / "A1.mp4"
+    )
+
+
+def media_for(tl: Timeline) -> dict:
+    return {e.file: MediaInfo(duration=4.0, video_streams=1) for e in tl.entries}
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestAudioKey:
+    def test_ignores_video_only_changes(self, tmp_path):
+        cfg = Config()
+        key = audio_key(make_timeline(tmp_path), cfg, [True, True])
+
+        assert audio_key(make_timeline(tmp_path, CompositionMode.SPLIT), cfg, [True, True]) == key
+        (tmp_path / "sc.mp4").write_bytes(b"edited")
+        cfg.output.crf = 18
+        cfg.composition.overlay.scale = 0.5
+        assert audio_key(make_timeline(tmp_path), cfg, [True, True]) == key
+
+    def test_tracks_audio_inputs_and_settings(self, tmp_path):
+        tl = make_timeline(tmp_path)
+        cfg = Config()
+        key = audio_key(tl, cfg, [True, True])
+
+        assert audio_key(tl, cfg, [True, False]) != key
+        assert audio_key(tl, cfg, [True, True], music_file=tmp_path / "m.mp3") != key
+
+        cfg.audio.target_loudness = -16
+        assert audio_key(tl, cfg, [True, True]) != key
+
+        (tmp_path / "a1.mp4").write_bytes(b"edited")
+        assert audio_key(make_timeline(tmp_path), Config(), [True, True]) != key
+
+    def test_music_settings_only_with_music(self, tmp_path):
+        tl = make_timeline(tmp_path)
+        cfg = Config()
+        key = audio_key(tl, cfg, [True, True])
+        with_music = audio_key(tl, cfg, [True, True], music_file=tmp_path / "m.mp3")
+
+        cfg.music.volume = 0.5
+        assert audio_key(tl, cfg, [True, True]) == key
+        assert audio_key(tl, cfg, [True, True], music_file=tmp_path / "m.mp3") != with_music
+
+
+class TestBuildAudioGraph:
+    def test_audio_only(self, tmp_path):
+        graph = build_audio_graph(make_timeline(tmp_path), Config(), [True, False])
+        fc = graph.to_string()
+        assert [inp.path.name for inp in graph.inputs] == ["a0.mp4"]
+        assert "[0:a]aresample=48000" in fc
+        assert "anullsrc" in fc
+        assert fc.endswith("loudnorm=I=-14:TP=-1.5:LRA=11[aout]")
+        assert "overlay" not in fc
+
+    def test_gain_and_music(self, tmp_path):
+        graph = build_audio_graph(
+            make_timeline(tmp_path),
+            Config(),
+            [True, True],
+            music_file=tmp_path / "m.mp3",
+            gain_db=-2.5,
+        )
+        fc = graph.to_string()
+        assert "volume=-2.50dB" in fc
+        assert "loudnorm" not in fc
+        assert "amix=inputs=2" in fc
+
+    def test_cmd_encodes_aout(self, tmp_path):
+        graph = build_audio_graph(make_timeline(tmp_path), Config(), [True, True])
+        cmd = build_audio_cmd(graph, tmp_path / "out.m4a", Config())
+        assert cmd[cmd.index("-map") + 1] == "[aout]"
+        assert cmd[cmd.index("-c:a") + 1] == "aac"
+        assert cmd[-4:] == ["-f", "mp4", "-y", str(tmp_path / "out.m4a")]
+
+
+class TestRenderAudio:
+    def test_rendered_once_per_audio_input(self, tmp_path, fake_ffmpeg):
+        rendered = fake_ffmpeg(composer)
+        tl = make_timeline(tmp_path)
+        cfg = Config()
+
+        track = render_audio(tl, cfg, media_for(tl))
+        assert track.exists()
+        assert len(rendered) == 1
+
+        # A video-only change reuses the track
+        (tmp_path / "sc.mp4").write_bytes(b"edited")
+        tl = make_timeline(tmp_path, CompositionMode.SPLIT)
+        assert render_audio(tl, cfg, media_for(tl)) == track
+        assert len(rendered) == 1
+
+        cfg.audio.bitrate = "128k"
+        assert render_audio(tl, cfg, media_for(tl)) != track
+        assert len(rendered) == 2
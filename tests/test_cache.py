@@ -0,0 +1,114 @@
+"""Tests for ugckit.cache."""
+
+from __future__ import annotations
+
+import os
+
+from ugckit.cache import (
+    FileCache,
+    JsonCache,
+    default_cache_dir,
+    file_fingerprint,
+    file_hash,
+    hash_payload,
+)
+
+
+class TestDefaultCacheDir:
+    def test_env_override(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("UGCKIT_CACHE_DIR", str(tmp_path / "c"))
+        assert default_cache_dir() == tmp_path / "c"
+
+
+class TestFileFingerprint:
+    def test_stable(self, tmp_path):
+        f = tmp_path / "a.mp4"
+        f.write_bytes(b"abc")
+        assert file_fingerprint(f) == file_fingerprint(f)
+
+    def test_changes_with_mtime(self, tmp_path):
+        f = tmp_path / "a.mp4"
+        f.write_bytes(b"abc")
+        before = file_fingerprint(f)
+        st = f.stat()
+        os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert file_fingerprint(f) != before
+
+
+class TestHashes:
+    def test_payload_key_order_irrelevant(self):
+        assert hash_payload({"a": 1, "b": [1, 2]}) == hash_payload({"b": [1, 2], "a": 1})
+        assert hash_payload({"a": 1}) != hash_payload({"a": 2})
+
+    def test_file_hash_follows_content(self, tmp_path):
+        a = tmp_path / "a.mp4"
+        b = tmp_path / "b.mp4"
+        a.write_bytes(b"abc")
+        b.write_bytes(b"abc")
+        assert file_hash(a) == file_hash(b)
+        b.write_bytes(b"abd")
+        assert file_hash(a) != file_hash(b)
+
+
+class TestJsonCache:
+    def test_roundtrip(self, tmp_path):
+        cache = JsonCache("probe", root=tmp_path)
+        cache.set("k", {"duration": 1.5})
+        assert cache.get("k") == {"duration": 1.5}
+        assert (tmp_path / "probe" / "k.json").exists()
+
+    def test_miss(self, tmp_path):
+        assert JsonCache("probe", root=tmp_path).get("missing") is None
+
+    def test_corrupt_record_is_miss(self, tmp_path):
+        cache = JsonCache("probe", root=tmp_path)
+        (tmp_path / "probe").mkdir()
+        (tmp_path / "probe" / "k.json").write_text("{not json")
+        assert cache.get("k") is None
+
+    def test_uses_env_root(self, isolated_cache):
+        cache = JsonCache("probe")
+        cache.set("k", [1])
+        assert (isolated_cache / "probe" / "k.json").exists()
+
+
+class TestFileCache:
+    def test_miss(self, tmp_path):
+        assert not FileCache("outputs", 1000, root=tmp_path).fetch("k", tmp_path / "o.mp4")
+
+    def test_store_and_fetch(self, tmp_path):
+        src = tmp_path / "render.mp4"
+        src.write_bytes(b"video")
+        cache = FileCache("outputs", 1000, root=tmp_path)
+        cache.store("k", src)
+        assert (tmp_path / "outputs" / "k.mp4").exists()
+
+        dest = tmp_path / "again" / "out.mp4"
+        assert cache.fetch("k", dest)
+        assert dest.read_bytes() == b"video"
+
+    def test_lru_eviction(self, tmp_path):
+        cache = FileCache("outputs", 10, root=tmp_path)
+        for i, key in enumerate(("a", "b", "c")):
+            src = tmp_path / f"{key}.mp4"
+            src.write_bytes(b"12345")
+            cache.store(key, src)
+            entry = tmp_path / "outputs" / f"{key}.mp4"
+            os.utime(entry, ns=(0, (i + 1) * 1_000_000_000))
+            if key == "b":
+                # Hit on "a" makes "b" the least recently used entry
+                assert cache.fetch("a", tmp_path / "hit.mp4")
+        cache.evict()
+        names = sorted(p.name for p in (tmp_path / "outputs").iterdir())
+        assert names == ["a.mp4", "c.mp4"]
+
+    def test_evict_keeps_pinned_entries(self, tmp_path):
+        cache = FileCache("outputs", 5, root=tmp_path)
+        for key in ("old", "new"):
+            src = tmp_path / f"{key}.mov"
+            src.write_bytes(b"12345")
+            cache.store(key, src, evict=False)
+        os.utime(tmp_path / "outputs" / "old.mov", ns=(0, 0))
+        cache.evict(keep=["old"])
+        assert cache.lookup("old") is not None
+        assert cache.lookup("new") is None
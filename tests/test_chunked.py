@@ -0,0 +1,425 @@
+"""Tests for ugckit.chunked."""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from ugckit import chunked
+from ugckit.chunked import (
+    build_chunk_cmd,
+    build_concat_cmd,
+    build_copy_cmd,
+    can_stream_copy,
+    chunk_manifest,
+    chunk_work_dir,
+    compose_video_chunked,
+    h264_level,
+    split_timeline,
+    threads_per_job,
+    write_concat_list,
+)
+from ugckit.composer import FFmpegError, MediaInfo
+from ugckit.models import CompositionMode, Config, RenditionConfig, Timeline, TimelineEntry
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+
+def make_timeline(tmp_path: Path) -> Timeline:
+    """Two segments (8s + 6s), screencast in the second one."""
+    entries = [
+        TimelineEntry(start=0, end=8, type="avatar", file=tmp_path / "a.mp4", parent_segment=1),
+        TimelineEntry(start=8, end=14, type="avatar", file=tmp_path / "b.mp4", parent_segment=2),
+        TimelineEntry(
+            start=9.5,
+            end=12,
+            type="screencast",
+            file=tmp_path / "sc.mp4",
+            parent_segment=2,
+        ),
+    ]
+    return Timeline(
+        script_id="C1",
+        total_duration=14.0,
+        entries=entries,
+        output_path=tmp_path / "out" / "C1.mp4",
+    )
+
+
+def write_inputs(tmp_path: Path) -> None:
+    for name in ("a.mp4", "b.mp4", "sc.mp4"):
+        (tmp_path / name).write_bytes(name.encode())
+
+
+@pytest.fixture
+def rendered(monkeypatch, fake_ffmpeg) -> list:
+    """Chunk commands run by stubbed FFmpeg (see fake_ffmpeg); audio is stubbed too."""
+    commands = fake_ffmpeg(chunked)
+    monkeypatch.setattr(
+        chunked,
+        "probe_many",
+        lambda paths: {p: MediaInfo(duration=8.0, video_streams=1, audio_streams=1) for p in paths},
+    )
+    monkeypatch.setattr(chunked, "timeline_gain", lambda timeline, media, config: -3.0)
+
+    def render_audio(timeline, config, media, music_file=None, normalized=False):
+        path = timeline.output_path.parent / "audio.m4a"
+        path.write_bytes(b"audio")
+        return path
+
+    monkeypatch.setattr(chunked, "render_audio", render_audio)
+    return commands
+
+
+def chunk_renders(commands: list) -> list:
+    """Names of the chunk files among the outputs of commands."""
+    names = [Path(cmd[-1]).name for cmd in commands]
+    return [name for name in names if name.startswith("chunk_")]
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestSplitTimeline:
+    def test_one_chunk_per_avatar(self, tmp_path):
+        chunks = split_timeline(make_timeline(tmp_path), tmp_path / "work")
+        assert [c.offset for c in chunks] == [0.0, 8.0]
+        assert [c.timeline.total_duration for c in chunks] == [8.0, 6.0]
+        assert chunks[0].path == tmp_path / "work" / "chunk_000.mov"
+
+    def test_screencast_shifted_to_segment_time(self, tmp_path):
+        chunks = split_timeline(make_timeline(tmp_path), tmp_path / "work")
+        assert len(chunks[0].timeline.entries) == 1
+        sc = chunks[1].timeline.entries[1]
+        assert sc.type == "screencast"
+        assert (sc.start, sc.end) == (1.5, 4.0)
+
+    def test_unassigned_screencast_matched_by_time(self, tmp_path):
+        tl = make_timeline(tmp_path)
+        tl.entries[2].parent_segment = None
+        tl.entries[1].parent_segment = None
+        chunks = split_timeline(tl, tmp_path / "work")
+        assert len(chunks[1].timeline.entries) == 2
+
+
+class TestChunkCommands:
+    def test_chunk_cmd_closed_gop_and_pcm(self, tmp_path):
+        cfg = Config()
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, cfg, has_audio=True)
+        assert cmd[cmd.index("-flags") + 1] == "+cgop"
+        assert cmd[cmd.index("-g") + 1] == "60"
+        assert cmd[cmd.index("-c:a") + 1] == "pcm_s16le"
+        assert cmd[-4:-2] == ["-t", "6.000"]
+        fc = cmd[cmd.index("-filter_complex") + 1]
+        assert "loudnorm" not in fc  # normalized once in the concat pass
+        assert "overlay" in fc
+
+    def test_chunk_cmd_pins_h264_profile_and_level(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True)
+        assert cmd[cmd.index("-profile:v") + 1] == "high"
+        assert cmd[cmd.index("-level:v") + 1] == "4.0"
+
+        cfg = Config()
+        cfg.output.codec = "libx265"
+        assert "-profile:v" not in build_chunk_cmd(chunk, cfg, has_audio=True)
+
+    def test_h264_level(self):
+        assert h264_level(1080, 1920, 30) == 40
+        assert h264_level(720, 1280, 30) == 31
+        assert h264_level(1920, 1080, 60) == 42
+
+    def test_chunk_cmd_trims_screencast_input(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True)
+        sc = cmd.index(str(tmp_path / "sc.mp4"))
+        assert cmd[sc - 3 : sc] == ["-t", "2.500", "-i"]
+        fc = cmd[cmd.index("-filter_complex") + 1]
+        assert "[1:v]setpts=PTS-STARTPTS+1.500/TB," in fc
+
+    def test_chunk_cmd_subtitles_offset(self, tmp_path):
+        subs = tmp_path / "subs.ass"
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True, subtitle_file=subs)
+        fc = cmd[cmd.index("-filter_complex") + 1]
+        assert "setpts=PTS+8.000/TB,ass=" in fc
+
+    def test_chunk_cmd_pip_head_input(self, tmp_path):
+        tl = make_timeline(tmp_path)
+        tl.entries[2].composition_mode = CompositionMode.PIP
+        chunk = split_timeline(tl, tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True, head_video=tmp_path / "h.webm")
+        assert str(tmp_path / "h.webm") in cmd
+        assert (
+            "[2:v]setpts=PTS-STARTPTS+0.000/TB,scale=270:270,fps=30"
+            in cmd[cmd.index("-filter_complex") + 1]
+        )
+
+    def test_chunk_cmd_thread_budget(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[0]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True, threads=4)
+        assert cmd[cmd.index("-threads") + 1] == "4"
+        assert cmd[cmd.index("-filter_complex_threads") + 1] == "4"
+        assert cmd.index("-filter_complex_threads") < cmd.index("-i")
+
+    def test_chunk_cmd_no_thread_cap_by_default(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[0]
+        assert "-threads" not in build_chunk_cmd(chunk, Config(), has_audio=True)
+
+    def test_concat_cmd_stream_copies_video(self, tmp_path):
+        cmd = build_concat_cmd(tmp_path / "list.txt", tmp_path / "o.mp4", Config(), 14.0)
+        assert cmd[cmd.index("-f") + 1] == "concat"
+        assert cmd[cmd.index("-c:v") + 1] == "copy"
+        assert "loudnorm" in cmd[cmd.index("-filter_complex") + 1]
+
+    def test_concat_cmd_music(self, tmp_path):
+        cfg = Config()
+        cmd = build_concat_cmd(
+            tmp_path / "list.txt", tmp_path / "o.mp4", cfg, 14.0, music_file=tmp_path / "m.mp3"
+        )
+        assert "amix" in cmd[cmd.index("-filter_complex") + 1]
+
+    def test_chunk_cmd_video_only(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[1]
+        cmd = build_chunk_cmd(chunk, Config(), has_audio=True, audio=False)
+        assert "-an" in cmd
+        assert "[aout]" not in cmd
+        assert "aresample" not in cmd[cmd.index("-filter_complex") + 1]
+
+    def test_concat_cmd_copies_audio_file(self, tmp_path):
+        audio = tmp_path / "audio.m4a"
+        cmd = build_concat_cmd(
+            tmp_path / "list.txt", tmp_path / "o.mp4", Config(), 14.0, audio_file=audio
+        )
+        assert "-filter_complex" not in cmd
+        assert cmd[cmd.index(str(audio)) + 1 :][:6] == ["-map", "0:v", "-map", "1:a", "-c", "copy"]
+
+    def test_concat_list(self, tmp_path):
+        chunks = split_timeline(make_timeline(tmp_path), tmp_path)
+        text = write_concat_list(chunks, tmp_path / "concat.txt").read_text()
+        assert text.count("file '") == 2
+
+    def test_work_dir_default_and_override(self, tmp_path):
+        tl = make_timeline(tmp_path)
+        cfg = Config()
+        assert chunk_work_dir(tl, cfg) == tmp_path / "out" / ".chunks" / "C1"
+        cfg.render.work_dir = tmp_path / "w"
+        assert chunk_work_dir(tl, cfg) == tmp_path / "w" / "C1"
+
+
+def output_ready(duration: float = 8.0, **overrides) -> MediaInfo:
+    """MediaInfo of a clip already in the default output format."""
+    fields = dict(
+        duration=duration,
+        video_streams=1,
+        audio_streams=1,
+        width=1080,
+        height=1920,
+        fps=30.0,
+        pix_fmt="yuv420p",
+        sar="1:1",
+        video_codec="h264",
+        profile="High",
+        level=40,
+    )
+    fields.update(overrides)
+    return MediaInfo(**fields)
+
+
+class TestStreamCopy:
+    def test_plain_matching_segment_copied(self, tmp_path):
+        chunks = split_timeline(make_timeline(tmp_path), tmp_path)
+        cfg = Config()
+        assert can_stream_copy(chunks[0], cfg, output_ready())
+        # Screencast overlay in segment 2
+        assert not can_stream_copy(chunks[1], cfg, output_ready(6.0))
+
+    def test_mismatch_or_extras_encoded(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path)[0]
+        cfg = Config()
+        assert not can_stream_copy(chunk, cfg, output_ready(width=720, height=1280))
+        assert not can_stream_copy(chunk, cfg, output_ready(fps=25.0))
+        assert not can_stream_copy(chunk, cfg, output_ready(video_codec="hevc"))
+        assert not can_stream_copy(chunk, cfg, output_ready(pix_fmt="yuv444p"))
+        assert not can_stream_copy(chunk, cfg, output_ready(pix_fmt="yuvj420p"))
+        assert not can_stream_copy(chunk, cfg, output_ready(color_range="pc"))
+        assert not can_stream_copy(chunk, cfg, output_ready(profile="Main"))
+        assert not can_stream_copy(chunk, cfg, output_ready(level=41))
+        assert can_stream_copy(chunk, cfg, output_ready(color_range="tv"))
+        assert not can_stream_copy(chunk, cfg, output_ready(duration=10.0))
+        assert not can_stream_copy(chunk, cfg, output_ready(), subtitle_file=tmp_path / "s.ass")
+        assert not can_stream_copy(chunk, cfg, output_ready(audio_streams=0))
+        assert can_stream_copy(chunk, cfg, output_ready(audio_streams=0), audio=False)
+
+        cfg.render.stream_copy = False
+        assert not can_stream_copy(chunk, cfg, output_ready())
+
+    def test_unpinned_encoder_never_copied(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path)[0]
+        cfg = Config()
+        cfg.output.codec = "libx265"
+        assert not can_stream_copy(chunk, cfg, output_ready(video_codec="hevc"))
+
+    def test_copy_cmd(self, tmp_path):
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path / "work")[0]
+        cmd = build_copy_cmd(chunk)
+        assert cmd[cmd.index("-c:v") + 1] == "copy"
+        assert cmd[cmd.index("-c:a") + 1] == "pcm_s16le"
+        assert "-filter_complex" not in cmd
+        assert "-an" in build_copy_cmd(chunk, audio=False)
+
+    def test_render_copies_matching_segments(self, tmp_path, monkeypatch, rendered):
+        write_inputs(tmp_path)
+        monkeypatch.setattr(
+            chunked,
+            "probe_many",
+            lambda paths: {p: output_ready() for p in paths},
+        )
+        cfg = Config()
+        cfg.render.chunked = True
+
+        compose_video_chunked(make_timeline(tmp_path), cfg)
+        assert len(chunk_renders(rendered)) == 2
+        copies = [cmd for cmd in rendered if "-filter_complex" not in cmd and "-c:v" in cmd]
+        assert [Path(cmd[-1]).name[:10] for cmd in copies] == ["chunk_000_"]
+
+    def test_failed_chunk_cancels_running_encoders(self, tmp_path, monkeypatch, rendered):
+        write_inputs(tmp_path)
+        cancelled = []
+
+        def run(cmd, duration, progress_callback=None, stall_timeout=None, cancel=None):
+            if "chunk_000_" in cmd[-1]:
+                raise FFmpegError("FFmpeg failed: broken input")
+            # A long encode that only ends when cancelled
+            cancelled.append(cancel.wait(timeout=10))
+            raise FFmpegError("FFmpeg cancelled")
+
+        monkeypatch.setattr(chunked, "run_ffmpeg", run)
+        cfg = Config()
+        cfg.render.jobs = 2
+        with pytest.raises(FFmpegError, match="broken input"):
+            compose_video_chunked(make_timeline(tmp_path), cfg)
+        assert cancelled == [True]
+
+    def test_failed_chunk_leaves_no_partial_file(self, tmp_path, monkeypatch, rendered):
+        write_inputs(tmp_path)
+
+        def run(cmd, duration, progress_callback=None, stall_timeout=None, cancel=None):
+            Path(cmd[-1]).write_bytes(b"half a chunk")
+            raise FFmpegError("FFmpeg failed: disk full")
+
+        monkeypatch.setattr(chunked, "run_ffmpeg", run)
+        cfg = Config()
+        cfg.render.chunked = True
+        with pytest.raises(FFmpegError, match="disk full"):
+            compose_video_chunked(make_timeline(tmp_path), cfg)
+        assert not list(tmp_path.rglob("*.partial.mov"))
+
+    def test_progress_reported_on_calling_thread(self, tmp_path, monkeypatch, rendered):
+        write_inputs(tmp_path)
+
+        def run(cmd, duration, progress_callback=None, stall_timeout=None, cancel=None):
+            if progress_callback:
+                progress_callback(0.5)
+            Path(cmd[-1]).write_bytes(b"chunk")
+
+        monkeypatch.setattr(chunked, "run_ffmpeg", run)
+        reports = []
+        cfg = Config()
+        cfg.render.jobs = 2
+        compose_video_chunked(
+            make_timeline(tmp_path),
+            cfg,
+            progress_callback=lambda p: reports.append((p, threading.current_thread())),
+        )
+        assert {thread for _, thread in reports} == {threading.main_thread()}
+        values = [p for p, _ in reports]
+        assert values == sorted(values)
+        assert values[-1] == 1.0
+
+
+class TestThreadsPerJob:
+    def test_even_split(self):
+        cfg = Config()
+        cfg.render.threads = 32
+        cfg.render.jobs = 4
+        assert threads_per_job(cfg) == 8
+
+    def test_at_least_one(self):
+        cfg = Config()
+        cfg.render.threads = 2
+        cfg.render.jobs = 8
+        assert threads_per_job(cfg) == 1
+
+
+class TestIncrementalRender:
+    def test_manifest_stable(self, tmp_path):
+        write_inputs(tmp_path)
+        chunks = split_timeline(make_timeline(tmp_path), tmp_path)
+        cfg = Config()
+        assert chunk_manifest(chunks[1], cfg) == chunk_manifest(chunks[1], cfg)
+        assert chunk_manifest(chunks[0], cfg) != chunk_manifest(chunks[1], cfg)
+
+    def test_manifest_tracks_content_and_config(self, tmp_path):
+        write_inputs(tmp_path)
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path)[1]
+        cfg = Config()
+        before = chunk_manifest(chunk, cfg)
+
+        cfg.output.crf = 18
+        assert chunk_manifest(chunk, cfg) != before
+        assert chunk_manifest(chunk, Config(), audio=False) != before
+
+        (tmp_path / "sc.mp4").write_bytes(b"edited")
+        assert chunk_manifest(chunk, Config()) != before
+
+        edited = chunk_manifest(chunk, Config())
+        chunk.timeline.entries[0].source_start = 1.0
+        assert chunk_manifest(chunk, Config()) != edited
+
+    def test_manifest_ignores_final_output_settings(self, tmp_path):
+        write_inputs(tmp_path)
+        chunk = split_timeline(make_timeline(tmp_path), tmp_path)[1]
+        before = chunk_manifest(chunk, Config())
+
+        cfg = Config()
+        cfg.output.renditions = [RenditionConfig(name="preview", crf=28)]
+        cfg.output.progressive = "fmp4"
+        cfg.output.fragment_seconds = 4.0
+        assert chunk_manifest(chunk, cfg) == before
+
+    def test_chunks_carry_audio_by_default(self, tmp_path, rendered):
+        write_inputs(tmp_path)
+        cfg = Config()
+        cfg.render.chunked = True
+
+        compose_video_chunked(make_timeline(tmp_path), cfg)
+        assert not (tmp_path / "out" / "audio.m4a").exists()
+        chunk_cmds = [cmd for cmd in rendered if Path(cmd[-1]).name.startswith("chunk_")]
+        assert chunk_cmds and all("-an" not in cmd for cmd in chunk_cmds)
+
+    def test_unchanged_chunks_reused(self, tmp_path, rendered):
+        write_inputs(tmp_path)
+        cfg = Config()
+        cfg.render.chunked = True
+        cfg.audio.separate_track = True
+
+        compose_video_chunked(make_timeline(tmp_path), cfg)
+        assert len(chunk_renders(rendered)) == 2
+        assert (tmp_path / "out" / "audio.m4a").exists()
+
+        # Edit only the screencast in segment 2
+        (tmp_path / "sc.mp4").write_bytes(b"edited")
+        rendered.clear()
+        compose_video_chunked(make_timeline(tmp_path), cfg)
+        renders = chunk_renders(rendered)
+        assert len(renders) == 1
+        assert renders[0].startswith("chunk_001_")
+
+        # Stale chunk from the first render is removed
+        work_dir = chunk_work_dir(make_timeline(tmp_path), cfg)
+        assert len(list(work_dir.glob("chunk_*.mov"))) == 2
+        assert not list(work_dir.glob("*.partial.mov"))
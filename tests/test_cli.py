@@ -179,6 +179,67 @@ class TestCompose:
         assert result.exit_code == 0
         assert "ffmpeg" in result.output
 
+    def test_preview_dry_run(self, runner, setup_workspace, tmp_path):
+        scripts_dir, avatar_dir = setup_workspace
+        make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
+
+        result = runner.invoke(
+            main,
+            [
+                "compose",
+                "-s",
+                "T1",
+                "--avatar-dir",
+                str(avatar_dir),
+                "-d",
+                str(scripts_dir),
+                "-o",
+                str(tmp_path / "result.mp4"),
+                "--preview",
+                "--dry-run",
+            ],
+        )
+        assert result.exit_code == 0
+        assert "scale=360:640" in result.output
+        assert "result_preview.mp4" in result.output
+
+    def test_time_range_dry_run(self, runner, setup_workspace, tmp_path):
+        scripts_dir, avatar_dir = setup_workspace
+        make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
+        make_fake_video(avatar_dir / "seg2.mp4", duration=2.0)
+
+        args = ["compose", "-s", "T1", "--avatar-dir", str(avatar_dir), "-d", str(scripts_dir)]
+        args += ["-o", str(tmp_path / "result.mp4"), "--dry-run"]
+        result = runner.invoke(main, args + ["--from", "2.5", "--to", "3.5"])
+        assert result.exit_code == 0
+        assert "-ss 0.500 -t 1.000" in result.output
+        assert "seg1.mp4" not in result.output.split("FFmpeg command:")[1]
+        assert "result_2.5-3.5.mp4" in result.output
+
+        result = runner.invoke(main, args + ["--from", "3", "--to", "1"])
+        assert result.exit_code != 0
+
+    def test_stream_to_stdout(self, runner, setup_workspace):
+        scripts_dir, avatar_dir = setup_workspace
+        make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
+        make_fake_video(avatar_dir / "seg2.mp4", duration=2.0)
+
+        args = ["compose", "-s", "T1", "--avatar-dir", str(avatar_dir), "-d", str(scripts_dir)]
+        result = runner.invoke(main, args + ["-o", "-"])
+        assert result.exit_code == 0, result.stderr
+        assert result.stdout_bytes[4:8] == b"ftyp"
+        assert "Done! Output: stdout" in result.stderr
+
+    def test_progressive_dry_run(self, runner, setup_workspace, tmp_path):
+        scripts_dir, avatar_dir = setup_workspace
+        make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
+
+        args = ["compose", "-s", "T1", "--avatar-dir", str(avatar_dir), "-d", str(scripts_dir)]
+        args += ["-o", str(tmp_path / "result.mp4"), "--progressive", "hls", "--dry-run"]
+        result = runner.invoke(main, args)
+        assert result.exit_code == 0
+        assert str(tmp_path / "result_hls" / "index.m3u8") in result.output
+
     def test_full_render(self, runner, setup_workspace, tmp_path):
         scripts_dir, avatar_dir = setup_workspace
         make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
@@ -272,6 +333,27 @@ class TestCompose:
         assert "Smart Sync" in result.output
 
 
+# ── snapshot ────────────────────────────────────────────────────────────
+
+
+class TestSnapshot:
+    def test_writes_frame(self, runner, setup_workspace, tmp_path):
+        scripts_dir, avatar_dir = setup_workspace
+        make_fake_video(avatar_dir / "seg1.mp4", duration=2.0)
+        make_fake_video(avatar_dir / "seg2.mp4", duration=2.0)
+        frame = tmp_path / "frame.jpg"
+
+        args = ["snapshot", "-s", "T1", "--avatar-dir", str(avatar_dir), "-d", str(scripts_dir)]
+        result = runner.invoke(main, args + ["-t", "2.5", "-o", str(frame)])
+        assert result.exit_code == 0, result.output
+        assert f"Frame: {frame}" in result.output
+        assert frame.stat().st_size > 0
+
+        result = runner.invoke(main, args + ["-t", "60", "-o", str(frame)])
+        assert result.exit_code != 0
+        assert "outside the timeline" in result.output
+
+
 # ── batch ───────────────────────────────────────────────────────────────
 
 
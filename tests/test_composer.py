@@ -2,18 +2,27 @@
 
 from __future__ import annotations
 
+import json
+import os
 import subprocess
+import threading
+import time
 from pathlib import Path
 
 import pytest
 
+from ugckit import composer
 from ugckit.composer import (
     FFmpegError,
     _detect_composition_mode,  # noqa: F401
+    _screencast_source,
     build_ffmpeg_filter_greenscreen,  # noqa: F401
     build_ffmpeg_filter_overlay,
     build_ffmpeg_filter_split,  # noqa: F401
+    build_frame_cmd,
+    build_renditions_cmd,
     build_timeline,
+    clip_timeline,
     compose_video,
     compose_video_with_progress,
     format_ffmpeg_cmd,
@@ -21,14 +30,20 @@ from ugckit.composer import (
     get_video_duration,
     has_audio_stream,
     position_to_overlay_coords,
+    probe_many,
+    probe_media,
+    render_cache_key,
+    render_frame,
     validate_timeline_files,
     wrap_with_post_processing,  # noqa: F401
 )
+from ugckit.graph import FilterGraph
 from ugckit.models import (
     CompositionMode,
     Config,
     MusicConfig,  # noqa: F401
     Position,
+    RenditionConfig,
     Script,
     Segment,
     Timeline,
@@ -187,7 +202,7 @@ class TestBuildFfmpegFilterOverlay:
     def test_single_avatar(self, tmp_path):
         tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
         cfg = Config()
-        result = build_ffmpeg_filter_overlay(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_overlay(tl, cfg, audio_presence=[True]))
         assert "[av0]copy[base]" in result
         assert "[vout]" in result
         assert "[aout]" in result
@@ -198,7 +213,7 @@ class TestBuildFfmpegFilterOverlay:
             tmp_path / "out.mp4",
         )
         cfg = Config()
-        result = build_ffmpeg_filter_overlay(tl, cfg, audio_presence=[True, True])
+        result = str(build_ffmpeg_filter_overlay(tl, cfg, audio_presence=[True, True]))
         assert "concat=n=2:v=1:a=0[base]" in result
 
     def test_audio_presence_mismatch(self, tmp_path):
@@ -207,6 +222,67 @@ class TestBuildFfmpegFilterOverlay:
         with pytest.raises(ValueError, match="audio_presence length"):
             build_ffmpeg_filter_overlay(tl, cfg, audio_presence=[True, True])
 
+    def test_screencast_starts_at_entry_start(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
+        tl.entries.append(
+            TimelineEntry(start=2.5, end=5.0, type="screencast", file=tmp_path / "sc.mp4")
+        )
+        result = str(build_ffmpeg_filter_overlay(tl, Config(), audio_presence=[True]))
+        assert "[1:v]setpts=PTS-STARTPTS+2.500/TB,scale=432:-1,fps=30[sc0_0]" in result
+
+    def test_no_enable_expressions(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
+        tl.entries.append(
+            TimelineEntry(start=2.5, end=5.0, type="screencast", file=tmp_path / "sc.mp4")
+        )
+        result = str(build_ffmpeg_filter_overlay(tl, Config(), audio_presence=[True]))
+        assert "enable=" not in result
+        assert "[base]fps=30[cfr];[cfr]split=3[cfr_0][cfr_1][cfr_2]" in result
+        # Cut halfway between output frames 75 and 150
+        assert "[cfr_1]trim=start=2.483333:end=4.983333,setpts=PTS-STARTPTS[seg1]" in result
+        assert "[cfr_2]trim=start=4.983333,setpts=PTS-STARTPTS[seg2]" in result
+        assert "[seg0][ov1_0][seg2]concat=n=3:v=1:a=0[layered]" in result
+
+    def test_overlays_only_active_layers(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4", tmp_path / "b.mp4"], tmp_path / "out.mp4")
+        for start, end in [(1.0, 3.0), (5.0, 7.0), (10.0, 12.0)]:
+            tl.entries.append(
+                TimelineEntry(start=start, end=end, type="screencast", file=tmp_path / "sc.mp4")
+            )
+        result = str(build_ffmpeg_filter_overlay(tl, Config(), audio_presence=[True, True]))
+        # One overlay per screencast, each on its own interval
+        assert result.count("overlay=") == 3
+        assert "concat=n=7:v=1:a=0[layered]" in result
+
+    def test_overlapping_layers_stacked(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
+        for start, end in [(1.0, 5.0), (3.0, 7.0)]:
+            tl.entries.append(
+                TimelineEntry(start=start, end=end, type="screencast", file=tmp_path / "sc.mp4")
+            )
+        result = str(build_ffmpeg_filter_overlay(tl, Config(), audio_presence=[True]))
+        # Intervals 0-1, 1-3, 3-5, 5-7, 7-8; both layers shown in 3-5
+        assert "[sc0_0]split=2" in result
+        assert "[sc1_0]split=2" in result
+        assert "[ov2_0][sc1_0t2]overlay" in result
+        assert result.count("overlay=") == 4
+        assert "concat=n=5:v=1:a=0[layered]" in result
+
+    def test_no_screencasts_passes_base_through(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
+        result = str(build_ffmpeg_filter_overlay(tl, Config(), audio_presence=[True]))
+        assert "[base]null[vout]" in result
+        assert "trim" not in result
+
+
+class TestScreencastSource:
+    def test_decodes_only_window(self, tmp_path):
+        entry = TimelineEntry(start=2.5, end=5.0, type="screencast", file=tmp_path / "sc.mp4")
+        graph = FilterGraph()
+        _screencast_source(graph, entry)
+        assert graph.input_args() == ["-t", "2.500", "-i", str(tmp_path / "sc.mp4")]
+        assert graph.inputs[0].offset == 2.5
+
 
 # ── Integration tests (require ffmpeg) ──────────────────────────────────
 
@@ -222,6 +298,122 @@ class TestGetVideoDuration:
             get_video_duration(tmp_path / "nope.mp4")
 
 
+FFPROBE_JSON = {
+    "streams": [
+        {
+            "codec_type": "video",
+            "codec_name": "h264",
+            "width": 1080,
+            "height": 1920,
+            "avg_frame_rate": "30000/1001",
+            "pix_fmt": "yuv420p",
+            "sample_aspect_ratio": "1:1",
+        },
+        {"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2},
+    ],
+    "format": {"duration": "8.008000"},
+}
+
+
+def fake_ffprobe(monkeypatch, payload: dict = FFPROBE_JSON) -> list:
+    """Replace ffprobe with a canned JSON response; returns the list of calls."""
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(payload), stderr="")
+
+    monkeypatch.setattr("ugckit.composer.subprocess.run", run)
+    return calls
+
+
+class TestProbeMedia:
+    def test_parses_all_fields_in_one_call(self, tmp_path, monkeypatch):
+        calls = fake_ffprobe(monkeypatch)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b"x")
+
+        info = probe_media(video)
+        assert len(calls) == 1
+        assert "-show_streams" in calls[0] and "-show_format" in calls[0]
+        assert info.duration == pytest.approx(8.008)
+        assert info.has_video and info.has_audio
+        assert (info.width, info.height) == (1080, 1920)
+        assert info.fps == pytest.approx(29.97, abs=0.01)
+        assert info.pix_fmt == "yuv420p"
+        assert info.sample_rate == 48000
+        assert info.channels == 2
+
+    def test_cached_on_disk(self, tmp_path, monkeypatch):
+        calls = fake_ffprobe(monkeypatch)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b"x")
+
+        assert get_video_duration(video) == pytest.approx(8.008)
+        assert has_audio_stream(video) is True
+        assert len(calls) == 1
+
+    def test_cache_invalidated_on_change(self, tmp_path, monkeypatch):
+        calls = fake_ffprobe(monkeypatch)
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b"x")
+        probe_media(video)
+
+        video.write_bytes(b"longer content")
+        probe_media(video)
+        assert len(calls) == 2
+
+    def test_no_audio(self, tmp_path, monkeypatch):
+        payload = {"streams": FFPROBE_JSON["streams"][:1], "format": {"duration": "2.0"}}
+        fake_ffprobe(monkeypatch, payload)
+        video = tmp_path / "silent.mp4"
+        video.write_bytes(b"x")
+        assert probe_media(video).has_audio is False
+
+    def test_invalid_output(self, tmp_path, monkeypatch):
+        fake_ffprobe(monkeypatch, {"streams": [], "format": {}})
+        video = tmp_path / "bad.mp4"
+        video.write_bytes(b"x")
+        with pytest.raises(FFmpegError, match="Invalid duration"):
+            probe_media(video)
+
+
+class TestProbeMany:
+    def test_probes_each_path_once(self, tmp_path, monkeypatch):
+        calls = fake_ffprobe(monkeypatch)
+        files = []
+        for name in ["a.mp4", "b.mp4", "c.mp4"]:
+            f = tmp_path / name
+            f.write_bytes(name.encode())
+            files.append(f)
+
+        result = probe_many(files + files[:1])
+        assert list(result) == files
+        assert len(calls) == 3
+
+    def test_empty(self):
+        assert probe_many([]) == {}
+
+    def test_missing_file_raises(self, tmp_path, monkeypatch):
+        fake_ffprobe(monkeypatch)
+        ok = tmp_path / "ok.mp4"
+        ok.write_bytes(b"x")
+        with pytest.raises(FFmpegError, match="not found"):
+            probe_many([ok, tmp_path / "missing.mp4"])
+
+    def test_build_timeline_uses_batched_probe(self, tmp_path, monkeypatch):
+        calls = fake_ffprobe(monkeypatch)
+        clips = []
+        for i in range(3):
+            f = tmp_path / f"seg{i}.mp4"
+            f.write_bytes(bytes([i]))
+            clips.append(f)
+
+        tl = build_timeline(make_script(3), clips, tmp_path, tmp_path / "out.mp4")
+        assert len(calls) == 3
+        assert tl.total_duration == pytest.approx(3 * 8.008)
+
+
 class TestHasAudioStream:
     def test_with_audio(self, tmp_path):
         video = make_fake_video(tmp_path / "with_audio.mp4")
@@ -259,6 +451,70 @@ class TestBuildTimeline:
         assert len(tl.entries) == 1  # only 1 clip for 3 segments
 
 
+class TestClipTimeline:
+    def make(self, tmp_path):
+        files = [tmp_path / "a.mp4", tmp_path / "b.mp4", tmp_path / "sc.mp4"]
+        entries = [
+            TimelineEntry(start=0, end=8, type="avatar", file=files[0], parent_segment=1),
+            TimelineEntry(start=8, end=16, type="avatar", file=files[1], parent_segment=2),
+            TimelineEntry(start=9, end=12, type="screencast", file=files[2], parent_segment=2),
+        ]
+        return Timeline(
+            script_id="R", total_duration=16, entries=entries, output_path=tmp_path / "r.mp4"
+        )
+
+    def test_keeps_overlapping_entries_shifted(self, tmp_path):
+        tl = clip_timeline(self.make(tmp_path), 10.0, 14.0)
+        assert tl.total_duration == 4.0
+        assert (tl.offset, tl.full_duration) == (10.0, 16)
+        assert [(e.type, e.start, e.end, e.source_start) for e in tl.entries] == [
+            ("avatar", 0.0, 4.0, 2.0),
+            ("screencast", 0.0, 2.0, 1.0),
+        ]
+
+    def test_nested_clip_accumulates(self, tmp_path):
+        tl = clip_timeline(clip_timeline(self.make(tmp_path), 4.0), 6.0, 7.0)
+        assert tl.offset == 10.0
+        assert tl.full_duration == 16
+        assert tl.entries[0].source_start == 2.0
+
+    def test_invalid_range(self, tmp_path):
+        with pytest.raises(ValueError, match="time range"):
+            clip_timeline(self.make(tmp_path), 5.0, 5.0)
+        with pytest.raises(ValueError, match="time range"):
+            clip_timeline(self.make(tmp_path), 20.0, 30.0)
+
+    def test_seeks_inputs(self, tmp_path):
+        for name in ("a.mp4", "b.mp4", "sc.mp4"):
+            make_fake_video(tmp_path / name, duration=8.0)
+        tl = clip_timeline(self.make(tmp_path), 10.0, 14.0)
+        cmd = compose_video(tl, Config(), dry_run=True)
+        assert cmd[: cmd.index(str(tmp_path / "b.mp4"))][-5:] == [
+            "-ss",
+            "2.000",
+            "-t",
+            "4.000",
+            "-i",
+        ]
+        sc = cmd.index(str(tmp_path / "sc.mp4"))
+        assert cmd[sc - 5 : sc] == ["-ss", "1.000", "-t", "2.000", "-i"]
+        assert str(tmp_path / "a.mp4") not in cmd
+
+    def test_music_follows_range(self, tmp_path):
+        graph = FilterGraph()
+        graph.set_output("aout", graph.filter("anullsrc", kind="a"))
+        wrap_with_post_processing(
+            graph,
+            music_file=tmp_path / "m.mp3",
+            music_config=MusicConfig(fade_out_duration=2.0),
+            total_duration=4.0,
+            music_offset=10.0,
+            full_duration=13.0,
+        )
+        assert graph.inputs[0].options[-2:] == ("-ss", "10.000")
+        assert "afade=t=out:st=1.00:d=2.00" in graph.to_string()
+
+
 class TestComposeVideoDryRun:
     def test_returns_cmd_list(self, tmp_path):
         v1 = make_fake_video(tmp_path / "a.mp4", duration=2.0)
@@ -273,6 +529,98 @@ class TestComposeVideoDryRun:
         assert result[0] == "ffmpeg"
         assert "-filter_complex" in result
 
+    def test_music_probed_with_inputs(self, tmp_path, monkeypatch):
+        v1 = make_fake_video(tmp_path / "a.mp4", duration=2.0)
+        tl = build_timeline(make_script(1), [v1], tmp_path, tmp_path / "out.mp4")
+        music = tmp_path / "m.mp3"
+        music.write_bytes(b"placeholder")
+        probed = []
+        probe = composer.probe_many
+
+        def record(paths, *args, **kwargs):
+            paths = list(paths)
+            probed.append(paths)
+            return probe(paths, *args, **kwargs)
+
+        monkeypatch.setattr(composer, "probe_many", record)
+        # Unreadable music is tolerated in a dry run, but is still probed
+        cmd = compose_video(tl, Config(), dry_run=True, music_file=music)
+        assert str(music) in cmd
+        assert music in probed[-2]
+
+        cfg = Config()
+        cfg.cache.enabled = False
+        with pytest.raises(FFmpegError):
+            compose_video(tl, cfg, music_file=music)
+
+    def test_reused_screencast_decoded_once(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "a.mp4", duration=4.0)
+        sc = make_fake_video(tmp_path / "sc.mp4", duration=2.0)
+        entries = [TimelineEntry(start=0, end=4, type="avatar", file=v1, parent_segment=1)]
+        for start in (0.5, 2.5):
+            entries.append(TimelineEntry(start=start, end=start + 1, type="screencast", file=sc))
+        tl = Timeline(
+            script_id="X", total_duration=4, entries=entries, output_path=tmp_path / "o.mp4"
+        )
+        cmd = compose_video(tl, Config(), dry_run=True)
+        assert cmd.count(str(sc)) == 1
+
+        cfg = Config()
+        cfg.render.shared_decode_mb = 0
+        assert compose_video(tl, cfg, dry_run=True).count(str(sc)) == 2
+
+    def test_renditions_share_one_process(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "a.mp4", duration=2.0)
+        tl = build_timeline(make_script(1), [v1], tmp_path, tmp_path / "out.mp4")
+        cfg = Config()
+        cfg.output.renditions = [
+            RenditionConfig(name="preview", resolution=(720, 1280), crf=28),
+            RenditionConfig(name="poster", format="jpg", poster_time=1.0),
+        ]
+        cmd = compose_video(tl, cfg, dry_run=True)
+        assert cmd.count("ffmpeg") == 1
+        assert cmd[-1] == str(tmp_path / "out_poster.jpg")
+        assert str(tmp_path / "out_preview.mp4") in cmd
+        fc = cmd[cmd.index("-filter_complex") + 1]
+        assert "split=3" in fc and "asplit=2" in fc
+        assert "scale=720:1280,setsar=1[vout_preview]" in fc
+        assert "trim=start=1.000[vout_poster]" in fc
+        crfs = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-crf"]
+        assert crfs == ["23", "28"]
+
+    def test_renditions_from_rendered_file(self, tmp_path):
+        cfg = Config()
+        cfg.output.renditions = [RenditionConfig(name="tiktok", codec="libx265")]
+        cmd = build_renditions_cmd(tmp_path / "o.mp4", tmp_path / "o.mp4", cfg)
+        assert cmd[cmd.index("[vout_tiktok]") + 1 :][:4] == ["-map", "0:a", "-c:a", "copy"]
+        assert cmd[cmd.index("-c:v") + 1] == "libx265"
+        assert cmd[-1] == str(tmp_path / "o_tiktok.mp4")
+
+    def test_progressive_output(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "a.mp4", duration=2.0)
+        tl = build_timeline(make_script(1), [v1], tmp_path, tmp_path / "out.mp4")
+        cfg = Config()
+        cfg.output.progressive = "fmp4"
+        cmd = compose_video(tl, cfg, dry_run=True)
+        assert cmd[-3:] == ["mp4", "-y", str(tmp_path / "out_live.mp4")]
+        assert "+frag_keyframe+empty_moov+default_base_moof" in cmd
+        assert "expr:gte(t,n_forced*2)" in cmd
+
+        cfg.output.progressive = "hls"
+        cmd = compose_video(tl, cfg, dry_run=True)
+        assert cmd[-1] == str(tmp_path / "out_hls" / "index.m3u8")
+        assert cmd[cmd.index("-hls_time") + 1] == "2"
+
+    def test_stream_to_pipe(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "a.mp4", duration=2.0)
+        tl = build_timeline(make_script(1), [v1], tmp_path, tmp_path / "out.mp4")
+        cfg = Config()
+        cfg.output.renditions = [RenditionConfig(name="preview", resolution=(720, 1280))]
+        cmd = compose_video(tl, cfg, dry_run=True, sink=lambda chunk: None)
+        assert cmd[-2:] == ["-y", "pipe:1"]
+        assert "+frag_keyframe+empty_moov+default_base_moof" in cmd
+        assert "[vout_preview]" not in cmd
+
     def test_no_output_path_raises(self):
         tl = Timeline(script_id="X", total_duration=0, entries=[])
         with pytest.raises(ValueError, match="output_path"):
@@ -295,6 +643,250 @@ class TestComposeVideoRender:
         assert output.exists()
         assert output.stat().st_size > 0
 
+    def test_overlapping_screencasts_render(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=3.0)
+        sc = make_fake_video(tmp_path / "sc.mp4", duration=3.0)
+        entries = [TimelineEntry(start=0, end=3, type="avatar", file=v1, parent_segment=1)]
+        for start, end in [(0.5, 2.0), (1.0, 2.5)]:
+            entries.append(
+                TimelineEntry(start=start, end=end, type="screencast", file=sc, parent_segment=1)
+            )
+        output = tmp_path / "result.mp4"
+        tl = Timeline(script_id="T1", total_duration=3.0, entries=entries, output_path=output)
+        cfg = Config()
+        cfg.cache.enabled = False
+        compose_video(tl, cfg)
+        assert get_video_duration(output) == pytest.approx(3.0, abs=0.15)
+
+    def test_split_screen_render(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=3.0)
+        sc = make_fake_video(tmp_path / "sc.mp4", duration=3.0)
+        entries = [
+            TimelineEntry(start=0, end=3, type="avatar", file=v1, parent_segment=1),
+            TimelineEntry(
+                start=1.0,
+                end=2.0,
+                type="screencast",
+                file=sc,
+                parent_segment=1,
+                composition_mode=CompositionMode.SPLIT,
+            ),
+        ]
+        output = tmp_path / "result.mp4"
+        tl = Timeline(script_id="T1", total_duration=3.0, entries=entries, output_path=output)
+        cfg = Config()
+        cfg.cache.enabled = False
+        compose_video(tl, cfg)
+        assert get_video_duration(output) == pytest.approx(3.0, abs=0.15)
+
+    def test_time_range_render(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        v2 = make_fake_video(tmp_path / "seg2.mp4", duration=2.0)
+        output = tmp_path / "range.mp4"
+        tl = build_timeline(make_script(2), [v1, v2], tmp_path, output)
+        cfg = Config()
+        cfg.audio.normalize = False
+        compose_video(tl, cfg, time_range=(1.5, 3.0))
+        assert get_video_duration(output) == pytest.approx(1.5, abs=0.15)
+
+    @pytest.mark.parametrize("mode", ["fmp4", "hls"])
+    def test_progressive_render(self, tmp_path, mode):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        output = tmp_path / "result.mp4"
+        tl = build_timeline(make_script(1), [v1], tmp_path, output)
+        cfg = Config()
+        cfg.audio.normalize = False
+        cfg.output.progressive = mode
+        live = composer.progressive_path(output, cfg)
+
+        seen = []
+        compose_video(tl, cfg, progress_callback=lambda p: seen.append(live.exists()))
+        assert any(seen)
+        assert not live.exists()
+        assert get_video_duration(output) == pytest.approx(2.0, abs=0.15)
+        # Remuxed with the index in front
+        data = output.read_bytes()
+        assert data.index(b"moov") < data.index(b"mdat")
+
+    def test_stream_render(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        output = tmp_path / "result.mp4"
+        tl = build_timeline(make_script(1), [v1], tmp_path, output)
+        cfg = Config()
+        cfg.audio.normalize = False
+
+        chunks = []
+        assert compose_video(tl, cfg, sink=chunks.append) is None
+        assert not output.exists()
+        data = b"".join(chunks)
+        assert data[4:8] == b"ftyp" and b"moof" in data
+        streamed = tmp_path / "streamed.mp4"
+        streamed.write_bytes(data)
+        decode = ["ffmpeg", "-v", "error", "-i", str(streamed), "-f", "null", "-"]
+        assert subprocess.run(decode, capture_output=True).returncode == 0
+
+        # A cached render is streamed from the cache
+        compose_video(tl, cfg)
+        with open(tmp_path / "copy.mp4", "wb") as f:
+            compose_video(tl, cfg, sink=f)
+        assert (tmp_path / "copy.mp4").read_bytes() == output.read_bytes()
+
+    def test_stream_ffmpeg_failure(self):
+        cmd = ["ffmpeg", "-f", "lavfi", "-i", "nosuchsource", "-f", "mp4", "-y", "pipe:1"]
+        with pytest.raises(FFmpegError, match="nosuchsource"):
+            composer.stream_ffmpeg(cmd, lambda chunk: None, 1.0)
+
+    def test_renditions_render(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        output = tmp_path / "result.mp4"
+        tl = build_timeline(make_script(1), [v1], tmp_path, output)
+        cfg = Config()
+        cfg.audio.normalize = False
+        cfg.output.renditions = [
+            RenditionConfig(name="preview", resolution=(360, 640)),
+            RenditionConfig(name="poster", format="jpg"),
+        ]
+        compose_video(tl, cfg)
+        preview = probe_media(tmp_path / "result_preview.mp4")
+        assert (preview.width, preview.height) == (360, 640)
+        assert preview.has_audio
+        assert (tmp_path / "result_poster.jpg").stat().st_size > 0
+
+
+class TestRenderCache:
+    @pytest.fixture(autouse=True)
+    def fixed_ffmpeg_version(self, monkeypatch):
+        monkeypatch.setattr(composer, "ffmpeg_version", lambda: "ffmpeg version test")
+
+    def make_inputs(self, tmp_path):
+        files = []
+        for name in ("a.mp4", "b.mp4"):
+            f = tmp_path / name
+            f.write_bytes(name.encode())
+            files.append(f)
+        return files
+
+    def test_key_stable_and_ignores_output_location(self, tmp_path):
+        files = self.make_inputs(tmp_path)
+        cfg = Config()
+        key = render_cache_key(make_timeline(files, tmp_path / "x.mp4"), cfg)
+        assert key == render_cache_key(make_timeline(files, tmp_path / "y" / "z.mp4"), cfg)
+
+        cfg.cache.max_size_mb = 1
+        assert key == render_cache_key(make_timeline(files, tmp_path / "x.mp4"), cfg)
+
+    def test_key_ignores_runtime_settings(self, tmp_path):
+        tl = make_timeline(self.make_inputs(tmp_path), tmp_path / "x.mp4")
+        key = render_cache_key(tl, Config())
+        cfg = Config()
+        cfg.render.jobs = 8
+        cfg.render.threads = 4
+        cfg.render.stall_timeout = 600
+        cfg.render.work_dir = tmp_path / "work"
+        cfg.mezzanine.max_size_mb = 1
+        assert render_cache_key(tl, cfg) != key  # jobs > 1 renders chunked
+
+        cfg.render.jobs = 1
+        assert render_cache_key(tl, cfg) == key
+        chunked = Config()
+        chunked.render.chunked = True
+        chunked_key = render_cache_key(tl, chunked)
+        assert chunked_key != key
+        chunked.render.jobs = 4
+        assert render_cache_key(tl, chunked) == chunked_key
+
+    def test_key_changes_with_config_and_content(self, tmp_path):
+        files = self.make_inputs(tmp_path)
+        tl = make_timeline(files, tmp_path / "x.mp4")
+        key = render_cache_key(tl, Config())
+
+        cfg = Config()
+        cfg.output.crf = 18
+        assert render_cache_key(tl, cfg) != key
+
+        files[1].write_bytes(b"re-exported")
+        assert render_cache_key(tl, Config()) != key
+
+    def test_identical_render_served_from_cache(self, tmp_path, monkeypatch):
+        files = self.make_inputs(tmp_path)
+        renders = []
+
+        def fake_uncached(timeline, *args):
+            timeline.output_path.parent.mkdir(parents=True, exist_ok=True)
+            timeline.output_path.write_bytes(b"rendered")
+            renders.append(timeline.output_path)
+            return timeline.output_path
+
+        monkeypatch.setattr(composer, "_compose_video_uncached", fake_uncached)
+        compose_video(make_timeline(files, tmp_path / "one.mp4"), Config())
+
+        progress = []
+        second = tmp_path / "out" / "two.mp4"
+        result = compose_video(
+            make_timeline(files, second), Config(), progress_callback=progress.append
+        )
+        assert result == second
+        assert second.read_bytes() == b"rendered"
+        assert len(renders) == 1
+        assert progress == [1.0]
+
+        cfg = Config()
+        cfg.cache.enabled = False
+        compose_video(make_timeline(files, second), cfg)
+        assert len(renders) == 2
+
+
+class TestRenderFrame:
+    def test_frame_cmd_seeks_visible_inputs(self, tmp_path):
+        files = [make_fake_video(tmp_path / n, duration=2.0) for n in ("a.mp4", "b.mp4")]
+        tl = clip_timeline(make_timeline(files, tmp_path / "out.mp4"), 10.0, 10.1)
+        cmd = build_frame_cmd(tl, Config(), tmp_path / "f.png")
+        assert cmd[cmd.index("-ss") + 1] == "2.000"
+        assert cmd.count("-i") == 1
+        assert cmd[-6:] == ["-frames:v", "1", "-update", "1", "-y", str(tmp_path / "f.png")]
+        assert "aout" not in " ".join(cmd)
+
+    def test_rejects_time_outside_timeline(self, tmp_path):
+        tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
+        with pytest.raises(ValueError):
+            render_frame(tl, Config(), 8.0)
+
+    def test_renders_png_and_caches(self, tmp_path, monkeypatch):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        v2 = make_fake_video(tmp_path / "seg2.mp4", duration=2.0)
+        tl = build_timeline(make_script(2), [v1, v2], tmp_path, tmp_path / "result.mp4")
+
+        frame = render_frame(tl, Config(), 3.0)
+        assert frame == tmp_path / "result_3s.png"
+        png = frame.read_bytes()
+        assert png.startswith(b"\x89PNG")
+        # IHDR width and height
+        assert (int.from_bytes(png[16:20], "big"), int.from_bytes(png[20:24], "big")) == (
+            1080,
+            1920,
+        )
+
+        def fail(*args, **kwargs):
+            raise AssertionError("cached frame re-rendered")
+
+        monkeypatch.setattr(composer, "run_ffmpeg", fail)
+        again = render_frame(tl, Config(), 3.0, output_path=tmp_path / "copy.png")
+        assert again.read_bytes() == frame.read_bytes()
+
+    def test_prepares_visible_avatars_on_miss_only(self, tmp_path):
+        v1 = make_fake_video(tmp_path / "seg1.mp4", duration=2.0)
+        v2 = make_fake_video(tmp_path / "seg2.mp4", duration=2.0)
+        tl = build_timeline(make_script(2), [v1, v2], tmp_path, tmp_path / "result.mp4")
+        prepared = []
+
+        def prepare(avatars):
+            prepared.append(avatars)
+            return None, None
+
+        render_frame(tl, Config(), 3.0, prepare_avatars=prepare)
+        render_frame(tl, Config(), 3.0, output_path=tmp_path / "copy.png", prepare_avatars=prepare)
+        assert prepared == [[v2]]
+
 
 class TestComposeVideoWithProgress:
     def test_progress_callback(self, tmp_path):
@@ -317,6 +909,46 @@ class TestComposeVideoWithProgress:
         assert progress_values[-1] == 1.0  # should end at 1.0
 
 
+class TestRunFfmpeg:
+    def test_progressing_run_outlives_stall_timeout(self):
+        cmd = ["ffmpeg", "-f", "lavfi", "-i", "testsrc=s=64x64:r=10", "-vf", "realtime"]
+        cmd += ["-t", "3", "-f", "null", "-"]
+        progress = []
+        composer.run_ffmpeg(cmd, 3.0, progress.append, stall_timeout=1.5)
+        assert progress[-1] == 1.0
+
+    def test_cancel_kills_running_encoder(self):
+        cmd = ["ffmpeg", "-f", "lavfi", "-i", "testsrc=s=64x64:r=10", "-vf", "realtime"]
+        cmd += ["-t", "30", "-f", "null", "-"]
+        cancel = threading.Event()
+        threading.Timer(0.5, cancel.set).start()
+        started = time.monotonic()
+        with pytest.raises(FFmpegError, match="cancelled"):
+            composer.run_ffmpeg(cmd, 30.0, cancel=cancel)
+        assert time.monotonic() - started < 5
+
+    def test_stalled_run_aborted(self, tmp_path):
+        fifo = tmp_path / "never_written"
+        os.mkfifo(fifo)
+        cmd = ["ffmpeg", "-i", str(fifo), "-f", "null", "-"]
+        with pytest.raises(FFmpegError, match="stalled"):
+            composer.run_ffmpeg(cmd, 3.0, stall_timeout=1.0)
+
+    def test_stall_window_scales_with_expected_encode_time(self, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(composer.time, "monotonic", lambda: clock[0])
+        watch = composer._ProgressWatch(600.0, 60.0, None)
+        assert watch.window() == 60.0
+        clock[0] += 10.0
+        assert watch.feed("out_time_us=5000000")  # 0.5x realtime
+        assert not watch.feed("[libx264 @ 0x1] frame I:1 Avg QP:20.00")
+        assert watch.window() == pytest.approx(0.25 * 600 / 0.5)
+        clock[0] += 299.0
+        assert not watch.stalled()
+        clock[0] += 2.0
+        assert watch.stalled()
+
+
 # ── PiP filter builder tests ──────────────────────────────────────────
 
 
@@ -347,7 +979,7 @@ class TestBuildFfmpegFilterPip:
 
         tl = self._make_pip_timeline(tmp_path)
         cfg = Config()
-        result = build_ffmpeg_filter_pip(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_pip(tl, cfg, audio_presence=[True]))
         # PiP mode should scale screencast to fullscreen
         assert "1080:1920" in result  # fullscreen scale
         assert "[vout]" in result
@@ -359,7 +991,7 @@ class TestBuildFfmpegFilterPip:
         tl = self._make_pip_timeline(tmp_path)
         cfg = Config()
         head_vids = [tmp_path / "head_0.webm"]
-        result = build_ffmpeg_filter_pip(tl, cfg, audio_presence=[True], head_videos=head_vids)
+        result = str(build_ffmpeg_filter_pip(tl, cfg, audio_presence=[True], head_videos=head_vids))
         # Should include head overlay
         assert "overlay" in result.lower()
 
@@ -434,30 +1066,42 @@ class TestBuildFfmpegFilterSplit:
     def test_contains_hstack(self, tmp_path):
         tl = self._make_split_timeline(tmp_path)
         cfg = Config()
-        result = build_ffmpeg_filter_split(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_split(tl, cfg, audio_presence=[True]))
         assert "hstack" in result
-        assert "split=2" in result  # stream must be duplicated
         assert "[vout]" in result
         assert "[aout]" in result
 
+    def test_stacks_only_inside_window(self, tmp_path):
+        tl = self._make_split_timeline(tmp_path)
+        cfg = Config()
+        cfg.composition.split.avatar_side = "left"
+        result = str(build_ffmpeg_filter_split(tl, cfg, audio_presence=[True]))
+        # Only the 2-6 s interval is cropped and stacked; no full-frame overlay
+        assert "[seg1]crop=540:1920:0:0[left1_0]" in result
+        assert "[left1_0][sc0_0t1]hstack=inputs=2[hs1_0]" in result
+        assert "[seg0][hs1_0][seg2]concat=n=3" in result
+        assert "overlay" not in result
+        assert "enable=" not in result
+
     def test_avatar_side_left(self, tmp_path):
         tl = self._make_split_timeline(tmp_path)
         cfg = Config()
         cfg.composition.split.avatar_side = "left"
-        result = build_ffmpeg_filter_split(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_split(tl, cfg, audio_presence=[True]))
         assert "hstack" in result
 
     def test_avatar_side_right(self, tmp_path):
         tl = self._make_split_timeline(tmp_path)
         cfg = Config()
         cfg.composition.split.avatar_side = "right"
-        result = build_ffmpeg_filter_split(tl, cfg, audio_presence=[True])
-        assert "hstack" in result
+        result = str(build_ffmpeg_filter_split(tl, cfg, audio_presence=[True]))
+        assert "[seg1]crop=540:1920:540:0[right1_0]" in result
+        assert "[sc0_0t1][right1_0]hstack=inputs=2" in result
 
     def test_no_screencasts(self, tmp_path):
         tl = make_timeline([tmp_path / "a.mp4"], tmp_path / "out.mp4")
         cfg = Config()
-        result = build_ffmpeg_filter_split(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_split(tl, cfg, audio_presence=[True]))
         assert "[base]null[vout]" in result
 
 
@@ -487,7 +1131,7 @@ class TestBuildFfmpegFilterGreenscreen:
     def test_has_overlay(self, tmp_path):
         tl = self._make_gs_timeline(tmp_path)
         cfg = Config()
-        result = build_ffmpeg_filter_greenscreen(tl, cfg, audio_presence=[True])
+        result = str(build_ffmpeg_filter_greenscreen(tl, cfg, audio_presence=[True]))
         assert "overlay" in result.lower()
         assert "[vout]" in result
         assert "[aout]" in result
@@ -496,63 +1140,75 @@ class TestBuildFfmpegFilterGreenscreen:
         tl = self._make_gs_timeline(tmp_path)
         cfg = Config()
         ta = [tmp_path / "ta_0.webm"]
-        result = build_ffmpeg_filter_greenscreen(
-            tl, cfg, audio_presence=[True], transparent_avatars=ta
+        result = str(
+            build_ffmpeg_filter_greenscreen(tl, cfg, audio_presence=[True], transparent_avatars=ta)
         )
-        # Should reference the transparent avatar input
-        assert "ta_" in result
+        # Should reference the transparent avatar input placed at its segment start
+        assert "[2:v]setpts=PTS-STARTPTS+0.000/TB,scale=864:-1,fps=30[sc0_1]" in result
 
 
 # ── Post-processing wrapper tests ──────────────────────────────────
 
 
 class TestWrapWithPostProcessing:
-    def test_no_op_returns_same(self):
-        original = "[0:v]null[vout];[0:a]anull[aout]"
-        result = wrap_with_post_processing(original)
-        assert result == original
+    def _passthrough(self, tmp_path) -> FilterGraph:
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("vout", inp.video)
+        graph.set_output("aout", inp.audio)
+        return graph
+
+    def test_no_op_returns_same(self, tmp_path):
+        result = wrap_with_post_processing(self._passthrough(tmp_path))
+        assert str(result) == "[0:v]null[vout];[0:a]anull[aout]"
 
     def test_subtitles_only(self, tmp_path):
-        original = "[0:v]null[vout];[0:a]anull[aout]"
         sub_file = tmp_path / "subs.ass"
         sub_file.write_text("dummy")
-        result = wrap_with_post_processing(original, subtitle_file=sub_file)
-        assert "[vout_pre]" in result
-        assert "ass=" in result
-        assert "[aout]" in result  # audio unchanged
+        result = str(wrap_with_post_processing(self._passthrough(tmp_path), subtitle_file=sub_file))
+        assert "[0:v]ass=" in result
+        assert "[0:a]anull[aout]" in result  # audio unchanged
 
-    def test_music_only(self):
-        original = "[0:v]null[vout];[0:a]anull[aout]"
+    def test_music_only(self, tmp_path):
         music_cfg = MusicConfig(enabled=True, volume=0.2, fade_out_duration=1.5, loop=True)
-        result = wrap_with_post_processing(
-            original, music_input_index=1, music_config=music_cfg, total_duration=10.0
+        graph = wrap_with_post_processing(
+            self._passthrough(tmp_path),
+            music_file=tmp_path / "m.mp3",
+            music_config=music_cfg,
+            total_duration=10.0,
         )
-        assert "[aout_pre]" in result
-        assert "aloop" in result
-        assert "amix" in result
-        assert "[vout]" in result  # video unchanged
+        result = str(graph)
+        assert graph.input_args()[-4:] == ["-stream_loop", "-1", "-i", str(tmp_path / "m.mp3")]
+        assert "[1:a]atrim=0:10.00" in result
+        assert "aloop" not in result
+        assert "[0:a][music_faded]amix" in result
+        assert "[0:v]null[vout]" in result  # video unchanged
 
-    def test_music_no_loop(self):
-        original = "[0:v]null[vout];[0:a]anull[aout]"
+    def test_music_no_loop(self, tmp_path):
         music_cfg = MusicConfig(enabled=True, volume=0.1, fade_out_duration=2.0, loop=False)
-        result = wrap_with_post_processing(
-            original, music_input_index=2, music_config=music_cfg, total_duration=8.0
+        graph = wrap_with_post_processing(
+            self._passthrough(tmp_path),
+            music_file=tmp_path / "m.mp3",
+            music_config=music_cfg,
+            total_duration=8.0,
         )
-        assert "aloop" not in result
+        result = str(graph)
+        assert "-stream_loop" not in graph.input_args()
         assert "atrim" in result
         assert "amix" in result
 
     def test_both_subtitles_and_music(self, tmp_path):
-        original = "[0:v]null[vout];[0:a]anull[aout]"
         sub_file = tmp_path / "subs.ass"
         sub_file.write_text("dummy")
         music_cfg = MusicConfig(enabled=True, volume=0.15)
-        result = wrap_with_post_processing(
-            original,
-            subtitle_file=sub_file,
-            music_input_index=1,
-            music_config=music_cfg,
-            total_duration=10.0,
+        result = str(
+            wrap_with_post_processing(
+                self._passthrough(tmp_path),
+                subtitle_file=sub_file,
+                music_file=tmp_path / "m.mp3",
+                music_config=music_cfg,
+                total_duration=10.0,
+            )
         )
         assert "ass=" in result
         assert "amix" in result
@@ -635,23 +1291,25 @@ class TestDetectCompositionMode:
 
 
 class TestFinalizeFilter:
-    def test_normalize(self):
+    def _finalize(self, tmp_path, cfg: Config) -> str:
         from ugckit.composer import _finalize_filter
 
-        filters = ["[0:v]null[base]"]
-        cfg = Config()
-        result = _finalize_filter(filters, "base", cfg)
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        base = graph.filter("null", inputs=[inp.video], label="base")
+        audio = graph.filter("anull", inputs=[inp.audio], label="audio")
+        return str(_finalize_filter(graph, base, audio, cfg))
+
+    def test_normalize(self, tmp_path):
+        result = self._finalize(tmp_path, Config())
         assert "[base]null[vout]" in result
-        assert "loudnorm" in result
+        assert "[audio]loudnorm" in result
         assert "[aout]" in result
 
-    def test_no_normalize(self):
-        from ugckit.composer import _finalize_filter
-
-        filters = ["[0:v]null[base]"]
+    def test_no_normalize(self, tmp_path):
         cfg = Config()
         cfg.audio.normalize = False
-        result = _finalize_filter(filters, "base", cfg)
+        result = self._finalize(tmp_path, cfg)
         assert "[base]null[vout]" in result
         assert "[audio]anull[aout]" in result
         assert "loudnorm" not in result
@@ -0,0 +1,266 @@
+"""Tests for ugckit.graph."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from ugckit.composer import MediaInfo
+from ugckit.graph import (
+    FilterGraph,
+    drop_noops,
+    drop_unused,
+    merge_scales,
+    optimize,
+    share_decodes,
+    share_inputs,
+    skip_matching_scales,
+)
+
+
+def media(width: int, height: int) -> MediaInfo:
+    return MediaInfo(duration=5.0, video_streams=1, audio_streams=1, width=width, height=height)
+
+
+class TestSerializer:
+    def test_single_use_links_chained(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("vout", graph.chain(inp.video, "scale=432:-1", "fps=30"))
+        assert graph.to_string() == "[0:v]scale=432:-1,fps=30[vout]"
+
+    def test_labelled_pads_not_chained(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        base = graph.chain(inp.video, "setsar=1", label="base")
+        graph.set_output("vout", graph.filter("null", inputs=[base]))
+        assert graph.to_string() == "[0:v]setsar=1[base];[base]null[vout]"
+
+    def test_multi_input_filter_labels(self, tmp_path):
+        graph = FilterGraph()
+        a, b = graph.add_input(tmp_path / "a.mp4"), graph.add_input(tmp_path / "b.mp4")
+        graph.set_output("vout", graph.filter("concat", "n=2:v=1:a=0", [a.video, b.video]))
+        assert graph.to_string() == "[0:v][1:v]concat=n=2:v=1:a=0[vout]"
+
+    def test_fan_out_inserts_split(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        base = graph.chain(inp.video, "fps=30", label="cfr")
+        first = graph.chain(base, "trim=end=1")
+        second = graph.chain(base, "trim=start=1")
+        graph.set_output("vout", graph.filter("concat", "n=2:v=1:a=0", [first, second]))
+        assert graph.to_string() == (
+            "[0:v]fps=30[cfr];[cfr]split=2[cfr_0][cfr_1];"
+            "[cfr_0]trim=end=1[s1];[cfr_1]trim=start=1[s2];"
+            "[s1][s2]concat=n=2:v=1:a=0[vout]"
+        )
+
+    def test_input_fan_out_uses_asplit(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("a1", graph.filter("volume", "0.5", [inp.audio]))
+        graph.set_output("a2", graph.filter("volume", "2", [inp.audio]))
+        assert graph.to_string().startswith("[0:a]asplit=2[in0a_0][in0a_1];")
+
+    def test_input_mapped_to_output_gets_noop(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("vout", inp.video)
+        graph.set_output("aout", inp.audio)
+        assert graph.to_string() == "[0:v]null[vout];[0:a]anull[aout]"
+
+    def test_labels_unique(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        first = graph.chain(inp.video, "fps=30", label="x")
+        second = graph.chain(first, "setsar=1", label="x")
+        graph.set_output("vout", second)
+        assert graph.to_string() == "[0:v]fps=30[x];[x]setsar=1[vout]"
+        graph.set_output("vout", graph.filter("null", inputs=[second]))
+        assert "[x]setsar=1[x_1];[x_1]null[vout]" in graph.to_string()
+
+    def test_input_args_keep_options(self, tmp_path):
+        graph = FilterGraph()
+        graph.add_input(tmp_path / "a.mp4")
+        graph.add_input(tmp_path / "sc.mp4", ["-t", "2.500"])
+        assert graph.input_args() == [
+            "-i",
+            str(tmp_path / "a.mp4"),
+            "-t",
+            "2.500",
+            "-i",
+            str(tmp_path / "sc.mp4"),
+        ]
+
+
+class TestDropUnused:
+    def test_dead_chain_and_input_removed(self, tmp_path):
+        graph = FilterGraph()
+        a, sc = graph.add_input(tmp_path / "a.mp4"), graph.add_input(tmp_path / "sc.mp4")
+        graph.chain(sc.video, "setpts=PTS-STARTPTS", "scale=432:-1")
+        graph.set_output("vout", graph.chain(a.video, "setsar=1"))
+        drop_unused(graph)
+        assert graph.input_args() == ["-i", str(tmp_path / "a.mp4")]
+        assert graph.to_string() == "[0:v]setsar=1[vout]"
+
+
+class TestDropNoops:
+    def test_removes_copy_and_null(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        base = graph.filter("copy", inputs=[graph.chain(inp.video, "setsar=1")], label="base")
+        graph.set_output("vout", graph.filter("null", inputs=[base]))
+        graph.set_output("aout", graph.filter("anull", inputs=[inp.audio]))
+        drop_noops(graph)
+        # Outputs read straight from an input still get a null filter
+        assert graph.to_string() == "[0:a]anull[aout];[0:v]setsar=1[vout]"
+
+
+class TestMergeScales:
+    def test_consecutive_scales_merged(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("vout", graph.chain(inp.video, "scale=432:-1", "scale=1080:1920"))
+        merge_scales(graph)
+        assert graph.to_string() == "[0:v]scale=1080:1920[vout]"
+
+    def test_aspect_scale_kept(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("vout", graph.chain(inp.video, "scale=1080:1920", "scale=432:-1"))
+        merge_scales(graph)
+        assert graph.to_string().count("scale=") == 2
+
+    def test_shared_scale_kept(self, tmp_path):
+        graph = FilterGraph()
+        inp = graph.add_input(tmp_path / "a.mp4")
+        small = graph.chain(inp.video, "scale=432:-1")
+        graph.set_output("v1", graph.chain(small, "scale=1080:1920"))
+        graph.set_output("v2", graph.chain(small, "fps=30"))
+        merge_scales(graph)
+        assert graph.to_string().count("scale=") == 2
+
+
+class TestSkipMatchingScales:
+    def _graph(self, path: Path, scale: str) -> FilterGraph:
+        graph = FilterGraph()
+        inp = graph.add_input(path, offset=2.0)
+        graph.set_output("vout", graph.chain(inp.video, "setpts=PTS-STARTPTS", scale))
+        return graph
+
+    def test_exact_size_skipped(self, tmp_path):
+        graph = self._graph(tmp_path / "a.mp4", "scale=1080:1920")
+        skip_matching_scales(graph, {tmp_path / "a.mp4": media(1080, 1920)})
+        assert graph.to_string() == "[0:v]setpts=PTS-STARTPTS[vout]"
+
+    def test_aspect_size_skipped(self, tmp_path):
+        graph = self._graph(tmp_path / "a.mp4", "scale=432:-1")
+        skip_matching_scales(graph, {tmp_path / "a.mp4": media(432, 768)})
+        assert "scale" not in graph.to_string()
+
+    def test_other_size_kept(self, tmp_path):
+        graph = self._graph(tmp_path / "a.mp4", "scale=432:-1")
+        skip_matching_scales(graph, {tmp_path / "a.mp4": media(1280, 720)})
+        assert "scale=432:-1" in graph.to_string()
+
+    def test_unprobed_kept(self, tmp_path):
+        graph = self._graph(tmp_path / "a.mp4", "scale=1080:1920")
+        skip_matching_scales(graph, {})
+        assert "scale=1080:1920" in graph.to_string()
+
+
+class TestShareInputs:
+    def test_identical_inputs_decoded_once(self, tmp_path):
+        graph = FilterGraph()
+        a, b = graph.add_input(tmp_path / "a.mp4"), graph.add_input(tmp_path / "a.mp4")
+        graph.set_output("v1", graph.chain(a.video, "fps=30"))
+        graph.set_output("v2", graph.chain(b.video, "fps=25"))
+        share_inputs(graph)
+        assert graph.input_args() == ["-i", str(tmp_path / "a.mp4")]
+        assert graph.to_string().startswith("[0:v]split=2[in0v_0][in0v_1];")
+
+    def test_time_shifted_inputs_kept(self, tmp_path):
+        # Sharing would make split buffer the clip between its two uses
+        graph = FilterGraph()
+        a = graph.add_input(tmp_path / "a.mp4", offset=0.0)
+        b = graph.add_input(tmp_path / "a.mp4", offset=3.0)
+        graph.set_output("vout", graph.filter("concat", "n=2:v=1:a=0", [a.video, b.video]))
+        share_inputs(graph)
+        assert len(graph.inputs) == 2
+
+    def test_different_options_kept(self, tmp_path):
+        graph = FilterGraph()
+        a = graph.add_input(tmp_path / "sc.mp4", ["-t", "1.000"])
+        b = graph.add_input(tmp_path / "sc.mp4", ["-t", "2.000"])
+        graph.set_output("vout", graph.filter("hstack", "inputs=2", [a.video, b.video]))
+        share_inputs(graph)
+        assert len(graph.inputs) == 2
+
+
+class TestShareDecodes:
+    def _graph(self, path: Path, uses, scales=None) -> FilterGraph:
+        graph = FilterGraph()
+        for i, (start, length) in enumerate(uses):
+            inp = graph.add_input(path, ["-t", f"{length:.3f}"], start)
+            placed = graph.chain(inp.video, f"setpts=PTS-STARTPTS+{start:.3f}/TB")
+            scale = scales[i] if scales else "scale=432:-1"
+            graph.set_output(f"v{i}", graph.chain(placed, scale, "fps=30"))
+        return graph
+
+    def test_reused_clip_decoded_once(self, tmp_path):
+        graph = self._graph(tmp_path / "sc.mp4", [(1.0, 2.0), (8.0, 3.0)])
+        share_decodes(graph, {tmp_path / "sc.mp4": media(1280, 720)}, 256)
+        assert graph.input_args() == ["-t", "3.000", "-i", str(tmp_path / "sc.mp4")]
+        assert graph.to_string() == (
+            "[0:v]scale=432:-1[s1];[s1]split=2[s1_0][s1_1];"
+            "[s1_0]trim=duration=2.000,setpts=PTS-STARTPTS+1.000/TB,fps=30[v0];"
+            "[s1_1]setpts=PTS-STARTPTS+8.000/TB,fps=30[v1]"
+        )
+
+    def test_different_filters_split_at_source(self, tmp_path):
+        graph = self._graph(
+            tmp_path / "sc.mp4", [(1.0, 2.0), (8.0, 2.0)], ["scale=432:-1", "scale=1080:1920"]
+        )
+        share_decodes(graph, {tmp_path / "sc.mp4": media(1280, 720)}, 256)
+        result = graph.to_string()
+        assert result.startswith("[0:v]split=2[in0v_0][in0v_1];")
+        assert "[in0v_1]setpts=PTS-STARTPTS+8.000/TB,scale=1080:1920,fps=30[v1]" in result
+
+    def test_over_budget_kept_separate(self, tmp_path):
+        graph = self._graph(
+            tmp_path / "sc.mp4", [(1.0, 20.0), (30.0, 20.0)], ["scale=1080:1920"] * 2
+        )
+        share_decodes(graph, {tmp_path / "sc.mp4": media(1280, 720)}, 256)
+        assert len(graph.inputs) == 2
+
+    def test_other_files_untouched(self, tmp_path):
+        graph = self._graph(tmp_path / "a.mp4", [(1.0, 2.0)])
+        inp = graph.add_input(tmp_path / "b.mp4", ["-t", "2.000"], 5.0)
+        graph.set_output("vb", graph.chain(inp.video, "setpts=PTS-STARTPTS+5.000/TB"))
+        info = media(1280, 720)
+        share_decodes(graph, {tmp_path / "a.mp4": info, tmp_path / "b.mp4": info}, 256)
+        assert len(graph.inputs) == 2
+        assert "split" not in graph.to_string()
+
+    def test_disabled_by_default(self, tmp_path):
+        graph = self._graph(tmp_path / "sc.mp4", [(1.0, 2.0), (8.0, 2.0)])
+        optimize(graph, {tmp_path / "sc.mp4": media(1280, 720)})
+        assert len(graph.inputs) == 2
+
+
+class TestOptimize:
+    def test_composer_graph(self, tmp_path):
+        from ugckit.composer import build_ffmpeg_filter_overlay
+        from ugckit.models import Config, Timeline, TimelineEntry
+
+        tl = Timeline(
+            script_id="T",
+            total_duration=5.0,
+            entries=[TimelineEntry(start=0, end=5, type="avatar", file=tmp_path / "a.mp4")],
+            output_path=tmp_path / "out.mp4",
+        )
+        graph = build_ffmpeg_filter_overlay(tl, Config(), [True])
+        optimize(graph, {tmp_path / "a.mp4": media(1080, 1920)})
+        result = graph.to_string()
+        assert "[0:v]setsar=1[vout]" in result
+        assert "copy" not in result
+        assert "[a0]loudnorm" in result
@@ -0,0 +1,152 @@
+"""Tests for ugckit.loudness."""
+
+from __future__ import annotations
+
+import math
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ugckit import loudness
+from ugckit.composer import MediaInfo, _finalize_audio
+from ugckit.graph import FilterGraph
+from ugckit.loudness import (
+    LoudnessStats,
+    _parse_loudnorm,
+    apply_gain,
+    measure_loudness,
+    timeline_gain,
+)
+from ugckit.models import Config, Timeline, TimelineEntry
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+LOUDNORM_STDERR = """\
+[Parsed_loudnorm_0 @ 0x1]
+{
+\t"input_i" : "-21.81",
+\t"input_tp" : "-17.70",
+\t"input_lra" : "0.00",
+\t"input_thresh" : "-31.81",
+\t"output_i" : "-23.64",
+\t"normalization_type" : "dynamic",
+\t"target_offset" : "0.00"
+}
+[out#0/null @ 0x2] video:0KiB audio:1132KiB subtitle:0KiB other streams:0KiB
+size=N/A time=00:00:03.10 bitrate=N/A speed=41.4x
+"""
+
+
+def make_timeline(tmp_path: Path, count: int = 2) -> Timeline:
+    entries = [
+        TimelineEntry(
+            start=4 * i,
+            end=4 * (i + 1),
+            type="avatar",
+            file=tmp_path / f"a{i}.mp4",
+            parent_segment=i + 1,
+        )
+        for i in range(count)
+    ]
+    return Timeline(script_id="L1", total_duration=4.0 * count, entries=entries)
+
+
+def fake_measurements(monkeypatch, levels: dict) -> None:
+    """Stub measure_many with (integrated, true_peak) per file name."""
+
+    def measure(paths, max_workers=8, stall_timeout=None):
+        return {
+            p: LoudnessStats(*levels[p.name], lra=0.0, threshold=-70.0)
+            for p in dict.fromkeys(paths)
+        }
+
+    monkeypatch.setattr(loudness, "measure_many", measure)
+
+
+def all_audio(tl: Timeline) -> dict:
+    return {e.file: MediaInfo(duration=4.0, audio_streams=1) for e in tl.entries}
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestParseLoudnorm:
+    def test_reads_input_stats(self):
+        stats = _parse_loudnorm(LOUDNORM_STDERR)
+        assert stats == LoudnessStats(integrated=-21.81, true_peak=-17.7, lra=0.0, threshold=-31.81)
+        assert not stats.silent
+
+    def test_silence(self):
+        stderr = LOUDNORM_STDERR.replace('"-21.81"', '"-inf"')
+        assert _parse_loudnorm(stderr).silent
+
+    def test_missing_summary(self):
+        with pytest.raises(ValueError):
+            _parse_loudnorm("size=N/A time=00:00:03.10")
+
+
+class TestMeasureLoudness:
+    def test_measures_once(self, tmp_path, monkeypatch):
+        wav = tmp_path / "tone.wav"
+        cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=f=440:d=2", str(wav)]
+        if subprocess.run(cmd, capture_output=True, timeout=30).returncode != 0:
+            pytest.skip("ffmpeg not available")
+
+        stats = measure_loudness(wav)
+        assert -30 < stats.integrated < -10
+
+        # Second measurement is served from the cache
+        def fail(*args, **kwargs):
+            raise AssertionError("ffmpeg ran again")
+
+        monkeypatch.setattr(loudness, "run_ffmpeg", fail)
+        assert measure_loudness(wav) == stats
+
+
+class TestTimelineGain:
+    def test_energy_weighted_mix(self, tmp_path, monkeypatch):
+        fake_measurements(monkeypatch, {"a0.mp4": (-20.0, -10.0), "a1.mp4": (-10.0, -5.0)})
+        tl = make_timeline(tmp_path)
+        gain = timeline_gain(tl, all_audio(tl), Config())
+        mix = 10 * math.log10((10**-2 + 10**-1) / 2)
+        assert gain == pytest.approx(-14 - mix)
+
+    def test_capped_by_true_peak(self, tmp_path, monkeypatch):
+        fake_measurements(monkeypatch, {"a0.mp4": (-30.0, -3.0), "a1.mp4": (-30.0, -6.0)})
+        tl = make_timeline(tmp_path)
+        assert timeline_gain(tl, all_audio(tl), Config()) == pytest.approx(1.5)
+
+    def test_silent_clips_gated_out(self, tmp_path, monkeypatch):
+        fake_measurements(monkeypatch, {"a0.mp4": (-20.0, -10.0), "a1.mp4": (-math.inf, -math.inf)})
+        tl = make_timeline(tmp_path)
+        assert timeline_gain(tl, all_audio(tl), Config()) == pytest.approx(6.0)
+
+    def test_no_audio(self, tmp_path, monkeypatch):
+        fake_measurements(monkeypatch, {})
+        tl = make_timeline(tmp_path)
+        media = {e.file: MediaInfo(duration=4.0) for e in tl.entries}
+        assert timeline_gain(tl, media, Config()) is None
+
+    def test_measures_with_configured_stall_timeout(self, tmp_path, monkeypatch):
+        timeouts = []
+
+        def measure(paths, max_workers=8, stall_timeout=None):
+            timeouts.append(stall_timeout)
+            return {}
+
+        monkeypatch.setattr(loudness, "measure_many", measure)
+        tl = make_timeline(tmp_path)
+        cfg = Config()
+        cfg.render.stall_timeout = 5.0
+        timeline_gain(tl, {e.file: MediaInfo(duration=4.0) for e in tl.entries}, cfg)
+        assert timeouts == [5.0]
+
+
+class TestApplyGain:
+    def test_replaces_loudnorm(self):
+        graph = FilterGraph()
+        inp = graph.add_input(Path("a.mp4"))
+        _finalize_audio(graph, inp.audio, Config())
+        apply_gain(graph, -3.456)
+        assert graph.to_string() == "[0:a]volume=-3.46dB[aout]"
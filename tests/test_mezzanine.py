@@ -0,0 +1,168 @@
+"""Tests for ugckit.mezzanine."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from ugckit import composer, mezzanine
+from ugckit.composer import MediaInfo, build_ffmpeg_filter_overlay
+from ugckit.mezzanine import (
+    build_mezzanine_cmd,
+    build_variant_cmd,
+    mezzanine_key,
+    prepare_mezzanines,
+    use_screencast_variants,
+    variant_key,
+)
+from ugckit.models import Config
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+
+@pytest.fixture
+def transcoded(monkeypatch, fake_ffmpeg) -> list:
+    """Commands run by stubbed FFmpeg (see fake_ffmpeg); inputs probe as 1280x720."""
+    commands = fake_ffmpeg(composer)
+    monkeypatch.setattr(
+        mezzanine,
+        "probe_many",
+        lambda paths: {
+            p: MediaInfo(duration=8.0, video_streams=1, width=1280, height=720) for p in paths
+        },
+    )
+    return commands
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestMezzanineKey:
+    def test_tracks_content_and_target(self, tmp_path):
+        f = tmp_path / "a.mp4"
+        f.write_bytes(b"abc")
+        cfg = Config()
+        key = mezzanine_key(f, "avatar", cfg)
+        assert key == mezzanine_key(f, "avatar", cfg)
+        assert key != mezzanine_key(f, "screencast", cfg)
+
+        cfg.output.fps = 25
+        assert mezzanine_key(f, "avatar", cfg) != key
+
+    def test_screencast_ignores_output_resolution(self, tmp_path):
+        f = tmp_path / "sc.mp4"
+        f.write_bytes(b"abc")
+        cfg = Config()
+        key = mezzanine_key(f, "screencast", cfg)
+        cfg.output.resolution = (720, 1280)
+        assert mezzanine_key(f, "screencast", cfg) == key
+
+
+class TestBuildMezzanineCmd:
+    def test_avatar_normalized_with_audio(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1, audio_streams=1)
+        cmd = build_mezzanine_cmd(Path("a.mp4"), tmp_path / "m.mov", "avatar", Config(), info)
+        vf = cmd[cmd.index("-vf") + 1]
+        assert vf == "scale=1080:1920,setsar=1,fps=30,format=yuv420p"
+        assert cmd[cmd.index("-g") + 1] == "30"
+        assert "0:a:0" in cmd
+        assert cmd[cmd.index("-ar") + 1] == "48000"
+        assert cmd[cmd.index("-ac") + 1] == "2"
+
+    def test_silent_avatar_gets_audio_track(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1, audio_streams=0)
+        cmd = build_mezzanine_cmd(Path("a.mp4"), tmp_path / "m.mov", "avatar", Config(), info)
+        assert "anullsrc=r=48000:cl=stereo" in cmd
+        assert "1:a" in cmd
+        assert cmd[cmd.index("-t") + 1] == "5.000"
+
+    def test_screencast_keeps_geometry(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1)
+        cmd = build_mezzanine_cmd(Path("s.mp4"), tmp_path / "m.mov", "screencast", Config(), info)
+        assert cmd[cmd.index("-vf") + 1] == "fps=30,format=yuv420p"
+        assert "-an" in cmd
+
+
+class TestPrepareMezzanines:
+    def test_transcodes_once_and_reuses(self, shared_file_timeline, transcoded):
+        tl = shared_file_timeline
+        cfg = Config()
+
+        normalized = prepare_mezzanines(tl, cfg)
+        # Shared avatar file is transcoded once
+        assert len(transcoded) == 2
+        assert normalized.entries[0].file == normalized.entries[1].file
+        assert all(e.file.suffix == ".mov" for e in normalized.entries)
+        assert [e.start for e in normalized.entries] == [e.start for e in tl.entries]
+        assert normalized.output_path == tl.output_path
+
+        prepare_mezzanines(shared_file_timeline, cfg)
+        assert len(transcoded) == 2
+
+    def test_normalized_builder_skips_scaling(self, shared_file_timeline):
+        tl = shared_file_timeline
+        fc = str(build_ffmpeg_filter_overlay(tl, Config(), [True, True], normalized=True))
+        assert "[0:v][1:v]concat=n=2" in fc
+        assert "scale=1080:1920" not in fc
+        assert "aresample" not in fc
+
+
+class TestVariantKey:
+    def test_tracks_content_filters_and_fps(self, tmp_path):
+        f = tmp_path / "sc.mp4"
+        f.write_bytes(b"abc")
+        cfg = Config()
+        key = variant_key(f, "scale=432:-1", "yuv420p", cfg)
+        assert key == variant_key(f, "scale=432:-1", "yuv420p", cfg)
+        assert key != variant_key(f, "scale=540:1920,setsar=1", "yuv420p", cfg)
+        assert key != variant_key(f, "scale=432:-1", "yuv444p", cfg)
+
+        cfg.output.fps = 25
+        assert variant_key(f, "scale=432:-1", "yuv420p", cfg) != key
+
+        f.write_bytes(b"abcd")
+        cfg.output.fps = 30
+        assert variant_key(f, "scale=432:-1", "yuv420p", cfg) != key
+
+
+class TestBuildVariantCmd:
+    def test_bakes_filters(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1)
+        cmd = build_variant_cmd(
+            Path("s.mp4"), tmp_path / "v.mov", "scale=432:-1", "yuv420p", Config(), info
+        )
+        assert cmd[cmd.index("-vf") + 1] == "scale=432:-1,fps=30,format=yuv420p"
+        assert cmd[cmd.index("-crf") + 1] == "12"
+        assert "-an" in cmd
+
+
+class TestUseScreencastVariants:
+    def test_substitutes_and_reuses(self, tmp_path, shared_file_timeline, transcoded):
+        tl = shared_file_timeline
+        cfg = Config()
+
+        graph = build_ffmpeg_filter_overlay(tl, cfg, [True, True])
+        used = use_screencast_variants(graph, [tmp_path / "sc.mp4"], cfg)
+        assert len(used) == 1 and len(transcoded) == 1
+        cmd = transcoded[0]
+        # 1280x720 scaled to 432x243: odd height needs 4:4:4
+        assert cmd[cmd.index("-vf") + 1] == "scale=432:-1,fps=30,format=yuv444p"
+        assert used[0] in [inp.path for inp in graph.inputs]
+        assert "scale=432:-1" not in str(graph)
+
+        graph = build_ffmpeg_filter_overlay(shared_file_timeline, cfg, [True, True])
+        assert use_screencast_variants(graph, [tmp_path / "sc.mp4"], cfg) == used
+        assert len(transcoded) == 1
+
+    def test_even_size_uses_yuv420p(self, tmp_path, shared_file_timeline, transcoded):
+        cfg = Config()
+        cfg.composition.overlay.scale = 0.5  # 540x304
+        graph = build_ffmpeg_filter_overlay(shared_file_timeline, cfg, [True, True])
+        use_screencast_variants(graph, [tmp_path / "sc.mp4"], cfg)
+        assert transcoded[0][transcoded[0].index("-vf") + 1].endswith("format=yuv420p")
+
+    def test_ignores_avatars(self, shared_file_timeline, transcoded):
+        graph = build_ffmpeg_filter_overlay(shared_file_timeline, Config(), [True, True])
+        assert use_screencast_variants(graph, [], Config()) == []
+        assert transcoded == []
@@ -232,3 +232,27 @@ class TestValidation:
             AudioConfig(target_loudness=-80)
         with pt.raises(ValidationError):
             AudioConfig(target_loudness=5)
+
+    def test_output_rendition_names_unique(self):
+        import pytest as pt
+        from pydantic import ValidationError
+
+        from ugckit.models import OutputConfig, RenditionConfig
+
+        with pt.raises(ValidationError):
+            OutputConfig(renditions=[RenditionConfig(name="a"), RenditionConfig(name="a")])
+        with pt.raises(ValidationError):
+            RenditionConfig(name="bad name")
+        assert RenditionConfig(name="poster", format="JPG").is_image
+
+    def test_output_progressive_mode(self):
+        import pytest as pt
+        from pydantic import ValidationError
+
+        from ugckit.models import OutputConfig
+
+        assert OutputConfig(progressive="hls").progressive == "hls"
+        with pt.raises(ValidationError):
+            OutputConfig(progressive="dash")
+        with pt.raises(ValidationError):
+            OutputConfig(fragment_seconds=0)
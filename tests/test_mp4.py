@@ -0,0 +1,184 @@
+"""Tests for ugckit.mp4."""
+
+from __future__ import annotations
+
+import struct
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ugckit.composer import probe_media
+from ugckit.mp4 import Mp4ParseError, read_mp4
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+
+def box(kind: str, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind.encode("latin-1")) + payload
+
+
+def full_box(kind: str, payload: bytes, version: int = 0) -> bytes:
+    return box(kind, bytes([version, 0, 0, 0]) + payload)
+
+
+# avcC of 64x64 libx264 High@4.0 clips; the SPS of the full-range one signals video_full_range_flag
+AVCC_LIMITED = bytes.fromhex(
+    "01640028ffe1001867640028acd94426c044000003000400000300c83c60c65801000668ebe3cb22c0fdf8f800"
+)
+AVCC_FULL_RANGE = bytes.fromhex(
+    "01640028ffe1001867640028acd94426c05b20000003002000000641e30632c001000668ebe3cb22c0fdf8f800"
+)
+
+
+def video_trak(
+    width: int = 1080,
+    height: int = 1920,
+    frames: int = 240,
+    avcc: bytes = b"",
+    extra_boxes: bytes = b"",
+) -> bytes:
+    tkhd = full_box("tkhd", b"\0" * 72 + struct.pack(">II", width << 16, height << 16))
+    mdhd = full_box("mdhd", struct.pack(">IIII", 0, 0, 15360, frames * 512) + b"\0" * 4)
+    hdlr = full_box("hdlr", b"\0" * 4 + b"vide" + b"\0" * 12 + b"\0")
+    avcc = box("avcC", avcc or bytes([1, 100, 0, 40, 0xFF, 0xE0]))
+    avc1 = box(
+        "avc1", b"\0" * 24 + struct.pack(">HH", width, height) + b"\0" * 50 + avcc + extra_boxes
+    )
+    stsd = full_box("stsd", struct.pack(">I", 1) + avc1)
+    stts = full_box("stts", struct.pack(">III", 1, frames, 512))
+    stbl = box("stbl", stsd + stts)
+    return box("trak", tkhd + box("mdia", mdhd + hdlr + box("minf", stbl)))
+
+
+def audio_trak(sample_rate: int = 48000, channels: int = 2) -> bytes:
+    mdhd = full_box("mdhd", struct.pack(">IIII", 0, 0, sample_rate, sample_rate * 8) + b"\0" * 4)
+    hdlr = full_box("hdlr", b"\0" * 4 + b"soun" + b"\0" * 12 + b"\0")
+    mp4a = box(
+        "mp4a",
+        b"\0" * 8 + b"\0" * 8 + struct.pack(">HHHHI", channels, 16, 0, 0, sample_rate << 16),
+    )
+    stsd = full_box("stsd", struct.pack(">I", 1) + mp4a)
+    stbl = box("stbl", stsd)
+    return box("trak", box("mdia", mdhd + hdlr + box("minf", stbl)))
+
+
+def make_mp4(path: Path, with_audio: bool = True, moov_first: bool = False) -> Path:
+    """Write a synthetic 8s MP4 with a video track and optional audio track."""
+    mvhd = full_box("mvhd", struct.pack(">IIII", 0, 0, 1000, 8000) + b"\0" * 80)
+    moov = box("moov", mvhd + video_trak() + (audio_trak() if with_audio else b""))
+    ftyp = box("ftyp", b"isom\0\0\0\0isomavc1")
+    mdat = box("mdat", b"\0" * 4096)
+    path.write_bytes(ftyp + (moov + mdat if moov_first else mdat + moov))
+    return path
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestReadMp4:
+    def test_duration_and_tracks(self, tmp_path):
+        info = read_mp4(make_mp4(tmp_path / "a.mp4"))
+        assert info.duration == pytest.approx(8.0)
+        assert [t.handler for t in info.tracks] == ["vide", "soun"]
+
+    def test_video_params(self, tmp_path):
+        video = read_mp4(make_mp4(tmp_path / "a.mp4")).tracks[0]
+        assert video.codec == "h264"
+        assert (video.width, video.height) == (1080, 1920)
+        assert video.fps == pytest.approx(30.0)
+        assert video.pix_fmt == "yuv420p"
+
+    def test_h264_profile_and_level(self, tmp_path):
+        video = read_mp4(make_mp4(tmp_path / "a.mp4")).tracks[0]
+        assert (video.profile, video.level) == ("High", 40)
+        assert video.color_range is None
+
+    def test_full_range_from_sps(self, tmp_path):
+        mvhd = full_box("mvhd", struct.pack(">IIII", 0, 0, 1000, 8000) + b"\0" * 80)
+        for avcc, pix_fmt, color_range in [
+            (AVCC_LIMITED, "yuv420p", None),
+            (AVCC_FULL_RANGE, "yuvj420p", "pc"),
+        ]:
+            path = tmp_path / "a.mp4"
+            path.write_bytes(box("moov", mvhd + video_trak(avcc=avcc)))
+            video = read_mp4(path).tracks[0]
+            assert (video.pix_fmt, video.color_range) == (pix_fmt, color_range)
+            assert (video.profile, video.level) == ("High", 40)
+
+    def test_full_range_from_colr(self, tmp_path):
+        mvhd = full_box("mvhd", struct.pack(">IIII", 0, 0, 1000, 8000) + b"\0" * 80)
+        for flags, pix_fmt, color_range in [(0x80, "yuvj420p", "pc"), (0, "yuv420p", "tv")]:
+            colr = box("colr", b"nclx" + struct.pack(">HHHB", 1, 1, 1, flags))
+            path = tmp_path / "a.mp4"
+            path.write_bytes(box("moov", mvhd + video_trak(extra_boxes=colr)))
+            video = read_mp4(path).tracks[0]
+            assert (video.pix_fmt, video.color_range) == (pix_fmt, color_range)
+
+    def test_audio_params(self, tmp_path):
+        audio = read_mp4(make_mp4(tmp_path / "a.mp4")).tracks[1]
+        assert audio.codec == "aac"
+        assert audio.sample_rate == 48000
+        assert audio.channels == 2
+
+    def test_moov_before_mdat(self, tmp_path):
+        info = read_mp4(make_mp4(tmp_path / "fast.mp4", moov_first=True))
+        assert info.duration == pytest.approx(8.0)
+
+    def test_64bit_box_size(self, tmp_path):
+        mvhd = full_box("mvhd", struct.pack(">IIII", 0, 0, 1000, 2000) + b"\0" * 80)
+        moov = box("moov", mvhd + video_trak())
+        mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + 64) + b"\0" * 64
+        path = tmp_path / "large.mp4"
+        path.write_bytes(mdat + moov)
+        assert read_mp4(path).duration == pytest.approx(2.0)
+
+    def test_no_moov(self, tmp_path):
+        path = tmp_path / "bad.mp4"
+        path.write_bytes(box("ftyp", b"isom") + box("mdat", b"\0" * 16))
+        with pytest.raises(Mp4ParseError):
+            read_mp4(path)
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "empty.mp4"
+        path.touch()
+        with pytest.raises(Mp4ParseError):
+            read_mp4(path)
+
+    def test_truncated(self, tmp_path):
+        path = make_mp4(tmp_path / "a.mp4", moov_first=True)
+        path.write_bytes(path.read_bytes()[:200])
+        with pytest.raises(Mp4ParseError):
+            read_mp4(path)
+
+
+class TestProbeFastPath:
+    def test_no_subprocess_for_mp4(self, tmp_path, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError("ffprobe should not be called")
+
+        monkeypatch.setattr("ugckit.composer.subprocess.run", fail)
+        info = probe_media(make_mp4(tmp_path / "a.mp4"))
+        assert info.duration == pytest.approx(8.0)
+        assert info.has_audio is True
+        assert (info.width, info.height) == (1080, 1920)
+
+    def test_silent_mp4(self, tmp_path):
+        info = probe_media(make_mp4(tmp_path / "silent.mp4", with_audio=False))
+        assert info.has_audio is False
+        assert info.has_video is True
+
+    def test_falls_back_to_ffprobe(self, tmp_path, monkeypatch):
+        calls = []
+
+        def run(cmd, **kwargs):
+            calls.append(cmd)
+            return subprocess.CompletedProcess(
+                cmd, 0, stdout='{"streams": [], "format": {"duration": "3.0"}}', stderr=""
+            )
+
+        monkeypatch.setattr("ugckit.composer.subprocess.run", run)
+        path = tmp_path / "odd.mp4"
+        path.write_bytes(b"not an mp4")
+        assert probe_media(path).duration == pytest.approx(3.0)
+        assert len(calls) == 1
@@ -0,0 +1,154 @@
+"""Tests for ugckit.preview."""
+
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from ugckit import composer
+from ugckit.composer import MediaInfo, compose_video, probe_media
+from ugckit.models import Config, RenditionConfig, Timeline, TimelineEntry
+from ugckit.preview import build_proxy_cmd, prepare_proxies, preview_config, proxy_key
+
+# ── Helpers ─────────────────────────────────────────────────────────────
+
+
+def make_video(path: Path, size: str, duration: float = 2.0) -> Path:
+    cmd = ["ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=s={size}:r=30:d={duration}"]
+    cmd += ["-f", "lavfi", "-i", "sine=r=48000", "-t", str(duration)]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", str(path)]
+    result = subprocess.run(cmd, capture_output=True, timeout=30)
+    if result.returncode != 0:
+        pytest.skip(f"ffmpeg not available: {result.stderr[:200]}")
+    return path
+
+
+# ── Tests ───────────────────────────────────────────────────────────────
+
+
+class TestPreviewConfig:
+    def test_output_scaled_down(self):
+        cfg = Config()
+        cfg.output.renditions = [RenditionConfig(name="reels")]
+        cfg.mezzanine.enabled = True
+        pv = preview_config(cfg)
+        assert pv.output.resolution == (360, 640)
+        assert (pv.output.fps, pv.output.preset, pv.output.crf) == (15, "ultrafast", 30)
+        assert pv.output.renditions == []
+        assert pv.composition.overlay.margin == round(50 / 3)
+        assert not pv.mezzanine.enabled
+        # The source config is left untouched
+        assert cfg.output.resolution == (1080, 1920)
+
+
+class TestProxyCmd:
+    def test_key_tracks_content_and_preview_settings(self, tmp_path):
+        f = tmp_path / "a.mp4"
+        f.write_bytes(b"abc")
+        cfg = Config()
+        key = proxy_key(f, "avatar", cfg)
+        assert key == proxy_key(f, "avatar", preview_config(cfg))
+        assert key != proxy_key(f, "screencast", cfg)
+
+        cfg.preview.fps = 10
+        assert proxy_key(f, "avatar", cfg) != key
+
+    def test_avatar_proxy(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1, audio_streams=1)
+        cmd = build_proxy_cmd(Path("a.mp4"), tmp_path / "p.mov", "avatar", Config(), info)
+        assert cmd[cmd.index("-vf") + 1] == "scale=360:640,setsar=1,fps=15,format=yuv420p"
+        assert cmd[cmd.index("-preset") + 1] == "ultrafast"
+        assert cmd[cmd.index("-c:a") + 1] == "pcm_s16le"
+
+    def test_screencast_fits_preview_frame(self, tmp_path):
+        info = MediaInfo(duration=5.0, video_streams=1, width=1920, height=1080)
+        cmd = build_proxy_cmd(Path("s.mp4"), tmp_path / "p.mov", "screencast", Config(), info)
+        assert cmd[cmd.index("-vf") + 1].startswith("scale=360:202,")
+        assert "-an" in cmd
+
+        small = MediaInfo(duration=5.0, video_streams=1, width=320, height=240)
+        cmd = build_proxy_cmd(Path("s.mp4"), tmp_path / "p.mov", "screencast", Config(), small)
+        assert cmd[cmd.index("-vf") + 1] == "fps=15,format=yuv420p"
+
+
+class TestPrepareProxies:
+    def test_transcodes_once_and_reuses(self, monkeypatch, fake_ffmpeg, shared_file_timeline):
+        transcoded = fake_ffmpeg(composer)
+        monkeypatch.setattr(
+            "ugckit.mezzanine.probe_many",
+            lambda paths: {p: MediaInfo(duration=8.0, video_streams=1) for p in paths},
+        )
+        tl = shared_file_timeline
+        proxied = prepare_proxies(tl, Config())
+        assert len(transcoded) == 2
+        assert proxied.entries[0].file == proxied.entries[1].file
+        assert [e.start for e in proxied.entries] == [e.start for e in tl.entries]
+
+        prepare_proxies(tl, Config())
+        assert len(transcoded) == 2
+
+
+class TestPreviewRender:
+    def test_dry_run_uses_preview_settings(self, tmp_path):
+        make_video(tmp_path / "a.mp4", "320x240")
+        tl = Timeline(
+            script_id="P",
+            total_duration=2.0,
+            entries=[
+                TimelineEntry(start=0, end=2, type="avatar", file=tmp_path / "a.mp4"),
+            ],
+            output_path=tmp_path / "p.mp4",
+        )
+        cfg = Config()
+        cfg.preview.enabled = True
+        cmd = compose_video(tl, cfg, dry_run=True)
+        assert "scale=360:640" in cmd[cmd.index("-filter_complex") + 1]
+        assert cmd[cmd.index("-r") + 1] == "15"
+
+    def test_render(self, tmp_path):
+        avatar = make_video(tmp_path / "a.mp4", "1080x1920")
+        sc = make_video(tmp_path / "sc.mp4", "1280x720")
+        tl = Timeline(
+            script_id="P",
+            total_duration=2.0,
+            entries=[
+                TimelineEntry(start=0, end=2, type="avatar", file=avatar, parent_segment=1),
+                TimelineEntry(start=0.5, end=1.5, type="screencast", file=sc, parent_segment=1),
+            ],
+            output_path=tmp_path / "p.mp4",
+        )
+        cfg = Config()
+        cfg.preview.enabled = True
+        cfg.audio.normalize = False
+        compose_video(tl, cfg)
+        info = probe_media(tmp_path / "p.mp4")
+        assert (info.width, info.height) == (360, 640)
+        assert info.fps == pytest.approx(15.0)
+        assert info.duration == pytest.approx(2.0, abs=0.15)
+
+    def test_head_overlay_scaled_to_preview(self, tmp_path):
+        from ugckit.composer import build_ffmpeg_filter_pip
+        from ugckit.models import CompositionMode
+
+        tl = Timeline(
+            script_id="P",
+            total_duration=8.0,
+            entries=[
+                TimelineEntry(start=0, end=8, type="avatar", file=tmp_path / "a.mp4"),
+                TimelineEntry(
+                    start=1,
+                    end=5,
+                    type="screencast",
+                    file=tmp_path / "sc.mp4",
+                    composition_mode=CompositionMode.PIP,
+                ),
+            ],
+            output_path=tmp_path / "p.mp4",
+        )
+        head = tmp_path / "head_0.webm"
+        graph = str(build_ffmpeg_filter_pip(tl, preview_config(Config()), head_videos=[head]))
+        # A quarter of the 360px preview width, as 270px is of 1080px
+        assert "scale=90:90" in graph
+        assert "scale=270:270" not in graph
@@ -157,6 +157,33 @@ class TestSyncScreencastTiming:
         assert sc.start == 2.0  # "check this out" starts at 2.0
         assert sc.end == 5.0  # "and that's it" starts at 5.0
 
+    @patch("ugckit.sync.transcribe_audio", return_value=[])
+    def test_passes_stall_timeout(self, mock_transcribe, tmp_path):
+        clip = tmp_path / "avatar.mp4"
+        clip.touch()
+
+        sync_screencast_timing(self._make_script_with_keywords(), [clip], stall_timeout=5.0)
+
+        mock_transcribe.assert_called_once_with(clip, "base", 5.0)
+
+    @patch("ugckit.sync.transcribe_audio", return_value=[])
+    def test_apply_sync_config_optional(self, mock_transcribe, tmp_path):
+        from ugckit.composer import DEFAULT_STALL_TIMEOUT
+        from ugckit.models import Config
+        from ugckit.pipeline import apply_sync
+
+        clip = tmp_path / "avatar.mp4"
+        clip.touch()
+        script = self._make_script_with_keywords()
+
+        apply_sync(script, [clip], "base")
+        mock_transcribe.assert_called_with(clip, "base", DEFAULT_STALL_TIMEOUT)
+
+        cfg = Config()
+        cfg.render.stall_timeout = 5.0
+        apply_sync(script, [clip], "base", cfg)
+        mock_transcribe.assert_called_with(clip, "base", 5.0)
+
     @patch("ugckit.sync.transcribe_audio")
     def test_no_keywords_unchanged(self, mock_transcribe, tmp_path):
         script = self._make_script_without_keywords()
@@ -0,0 +1,169 @@
+"""Cached audio render stage for UGCKit.
+
+The final audio track (avatar concat, loudness normalization and music
+mix) depends only on the avatar clips' audio and the audio and music
+settings, not on anything composited over the video. With
+config.audio.separate_track it is rendered on its own, stored in a
+content-addressed FileCache, and muxed into the video render with stream
+copy. A render that only changes screencasts,
+layout or subtitles reuses the cached track and does no audio work.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Mapping, Optional
+
+from ugckit import __version__
+from ugckit.cache import FileCache, cached_transcode, file_hash, hash_payload
+from ugckit.composer import (
+    MediaInfo,
+    _audio_encode_args,
+    _avatar_input,
+    _build_audio_pipeline,
+    _finalize_audio,
+    ffmpeg_version,
+    wrap_with_post_processing,
+)
+from ugckit.graph import FilterGraph, optimize
+from ugckit.loudness import apply_gain, timeline_gain
+from ugckit.models import Config, Timeline
+
+# Bump when audio stage commands change in ways the key does not capture
+_AUDIO_STAGE_VERSION = 1
+
+
+def audio_cache(config: Config) -> FileCache:
+    """Cache of rendered audio tracks, sized like the output cache."""
+    return FileCache("audio", config.cache.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+def audio_key(
+    timeline: Timeline,
+    config: Config,
+    audio_presence: List[bool],
+    music_file: Optional[Path] = None,
+    normalized: bool = False,
+) -> str:
+    """Content-addressed key of a timeline's final audio track.
+
+    Covers the avatar clips (by content hash and placement), the audio
+    and music settings, the music file and the FFmpeg and UGCKit versions.
+
+    Raises:
+        OSError: If an input file cannot be read.
+    """
+    avatars = [
+        [file_hash(e.file), round(e.start, 3), round(e.end, 3), e.source_start, has_audio]
+        for e, has_audio in zip([e for e in timeline.entries if e.type == "avatar"], audio_presence)
+    ]
+    music = None
+    if music_file is not None:
+        music = {
+            "file": file_hash(music_file),
+            **config.music.model_dump(mode="json", exclude={"enabled", "file"}),
+        }
+    return hash_payload(
+        {
+            "version": __version__,
+            "stage": _AUDIO_STAGE_VERSION,
+            "ffmpeg": ffmpeg_version(),
+            "avatars": avatars,
+            "duration": round(timeline.total_duration, 3),
+            "offset": round(timeline.offset, 3),
+            "full_duration": timeline.full_duration,
+            "normalized": normalized,
+            "audio": config.audio.model_dump(mode="json"),
+            "music": music,
+        }
+    )
+
+
+def build_audio_graph(
+    timeline: Timeline,
+    config: Config,
+    audio_presence: List[bool],
+    music_file: Optional[Path] = None,
+    normalized: bool = False,
+    gain_db: Optional[float] = None,
+) -> FilterGraph:
+    """Audio-only graph producing [aout]: avatar concat, normalization, music.
+
+    gain_db, when given, replaces dynamic loudnorm (see ugckit.loudness).
+    """
+    graph = FilterGraph()
+    avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
+    avatar_inputs = [_avatar_input(graph, e) for e in avatar_entries]
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, audio_presence, timeline.total_duration, normalized
+    )
+    _finalize_audio(graph, audio, config)
+    if gain_db is not None:
+        apply_gain(graph, gain_db)
+    wrap_with_post_processing(
+        graph,
+        music_file=music_file,
+        music_config=config.music if music_file else None,
+        total_duration=timeline.total_duration,
+        music_offset=timeline.offset,
+        full_duration=timeline.full_duration,
+    )
+    return optimize(graph)
+
+
+def build_audio_cmd(graph: FilterGraph, dest: Path, config: Config) -> List[str]:
+    """Build the FFmpeg command encoding an audio graph's [aout] to dest."""
+    return (
+        ["ffmpeg"]
+        + graph.input_args()
+        + ["-filter_complex", graph.to_string(), "-map", "[aout]"]
+        + _audio_encode_args(config)
+        + ["-f", "mp4", "-y", str(dest)]
+    )
+
+
+def render_audio(
+    timeline: Timeline,
+    config: Config,
+    media: Mapping[Path, MediaInfo],
+    music_file: Optional[Path] = None,
+    normalized: bool = False,
+) -> Path:
+    """Return the timeline's final audio track, rendering it on a cache miss.
+
+    Args:
+        timeline: Composition timeline.
+        config: UGCKit configuration.
+        media: Probe results covering the avatar clips.
+        music_file: Background music file to mix in.
+        normalized: Avatar inputs are mezzanines (see ugckit.mezzanine).
+
+    Returns:
+        Path of the cached track (encoded with config.audio settings).
+
+    Raises:
+        FFmpegError: If loudness analysis or the audio render fails.
+    """
+    audio_presence = [media[e.file].has_audio for e in timeline.entries if e.type == "avatar"]
+    key = audio_key(timeline, config, audio_presence, music_file, normalized)
+    cache = audio_cache(config)
+
+    def build_cmd(dest: Path) -> List[str]:
+        gain = None
+        if config.audio.normalize and config.audio.two_pass:
+            gain = timeline_gain(timeline, media, config)
+        graph = build_audio_graph(
+            timeline, config, audio_presence, music_file, normalized, gain_db=gain
+        )
+        return build_audio_cmd(graph, dest, config)
+
+    entry = cached_transcode(
+        cache,
+        key,
+        build_cmd,
+        timeline.total_duration,
+        f"audio track of {timeline.script_id}",
+        config.render.stall_timeout,
+    )
+    cache.evict(keep=[key])
+    return entry
@@ -0,0 +1,274 @@
+"""On-disk caches for UGCKit.
+
+Cached records are keyed by file fingerprints (resolved path, size and
+mtime) or content hashes, so editing or replacing an input invalidates
+its entries. Large artifacts such as rendered videos live in a FileCache
+with size-capped LRU eviction.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional
+
+CACHE_DIR_ENV = "UGCKIT_CACHE_DIR"
+
+# Mirrors ugckit.composer.DEFAULT_STALL_TIMEOUT (composer imports this module)
+_DEFAULT_STALL_TIMEOUT = 60.0
+
+
+def default_cache_dir() -> Path:
+    """Return the cache root: $UGCKIT_CACHE_DIR or ~/.cache/ugckit."""
+    env = os.environ.get(CACHE_DIR_ENV)
+    if env:
+        return Path(env).expanduser()
+    return Path.home() / ".cache" / "ugckit"
+
+
+def hash_payload(payload: Any) -> str:
+    """Return a SHA-256 digest of a JSON-serializable payload in canonical form."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: Path) -> str:
+    """Return a cache key derived from a file's resolved path, size and mtime.
+
+    Raises:
+        OSError: If the file cannot be stat'ed.
+    """
+    st = path.stat()
+    raw = f"{path.resolve()}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class JsonCache:
+    """Directory of small JSON records, one file per key.
+
+    The cache is best-effort: unreadable or corrupt records are treated as
+    misses and write failures are ignored.
+    """
+
+    def __init__(self, namespace: str, root: Optional[Path] = None):
+        self.namespace = namespace
+        self._root = root
+
+    @property
+    def directory(self) -> Path:
+        """Directory holding this cache's records."""
+        return (self._root or default_cache_dir()) / self.namespace
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the record stored under key, or None."""
+        try:
+            with open(self.directory / f"{key}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable record under key (atomic replace)."""
+        directory = self.directory
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp, directory / f"{key}.json")
+        except OSError:
+            pass
+
+
+def link_or_copy(src: Path, dest: Path) -> None:
+    """Place src at dest as a hardlink, falling back to a copy across filesystems.
+
+    dest is replaced atomically, so readers never see a partial file.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".tmp")
+    os.close(fd)
+    os.unlink(tmp)
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class FileCache:
+    """Directory of large files keyed by content hash, evicted LRU by size.
+
+    Entries are hardlinked in and out when possible, so a cache hit costs no
+    copying. Recency is tracked with the entry's mtime, which is bumped on
+    every hit. Like JsonCache, failures are treated as misses.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, root: Optional[Path] = None):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self._root = root
+
+    @property
+    def directory(self) -> Path:
+        """Directory holding this cache's entries."""
+        return (self._root or default_cache_dir()) / self.namespace
+
+    def _entry(self, key: str) -> Optional[Path]:
+        try:
+            return next(self.directory.glob(f"{key}.*"), None)
+        except OSError:
+            return None
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the entry stored under key (marking it recently used), or None."""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            return None
+        return entry
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """Materialize the entry stored under key at dest.
+
+        Returns:
+            True on a cache hit, False if there is no usable entry.
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        try:
+            link_or_copy(entry, dest)
+        except OSError:
+            return False
+        return True
+
+    def store(self, key: str, src: Path, evict: bool = True) -> Optional[Path]:
+        """Add src to the cache under key.
+
+        Args:
+            key: Entry key.
+            src: File to add; it is left in place.
+            evict: Evict down to max_bytes afterwards. Callers storing
+                several entries they are about to use pass False and call
+                evict(keep=...) once done.
+
+        Returns:
+            Path of the new entry, or None if it could not be written.
+        """
+        entry = self.directory / f"{key}{src.suffix or '.bin'}"
+        try:
+            link_or_copy(src, entry)
+        except OSError:
+            return None
+        if evict:
+            self.evict()
+        return entry
+
+    def entries(self) -> List[Path]:
+        """Cache entries, least recently used first."""
+        try:
+            files = [p for p in self.directory.iterdir() if p.is_file() and p.suffix != ".tmp"]
+            return sorted(files, key=lambda p: p.stat().st_mtime_ns)
+        except OSError:
+            return []
+
+    def evict(self, keep: Iterable[str] = ()) -> None:
+        """Remove least recently used entries until the cache fits max_bytes.
+
+        Entries whose key is in keep are never removed.
+        """
+        kept = set(keep)
+        entries = self.entries()
+        sizes = []
+        for entry in entries:
+            try:
+                sizes.append(entry.stat().st_size)
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        for entry, size in zip(entries, sizes):
+            if total <= self.max_bytes:
+                break
+            if entry.name.split(".", 1)[0] in kept:
+                continue
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+def cached_transcode(
+    cache: FileCache,
+    key: str,
+    build_cmd: Callable[[Path], List[str]],
+    duration: float,
+    what: str,
+    stall_timeout: float = _DEFAULT_STALL_TIMEOUT,
+) -> Path:
+    """Return the entry under key, running the FFmpeg command build_cmd(dest) on a miss.
+
+    The command writes dest, a temporary .mov next to the cache (same
+    filesystem, so storing it is a link). The entry is stored without
+    eviction; callers evict once they know which entries they use.
+
+    Args:
+        cache: Cache holding the transcoded files.
+        key: Entry key.
+        build_cmd: Returns the FFmpeg command writing its argument.
+        duration: Output duration in seconds (for the stall watchdog).
+        what: Description of the entry for error messages.
+        stall_timeout: See ugckit.composer.run_ffmpeg.
+
+    Raises:
+        FFmpegError: If FFmpeg fails or the entry cannot be stored.
+    """
+    from ugckit.composer import FFmpegError, run_ffmpeg
+
+    entry = cache.lookup(key)
+    if entry is not None:
+        return entry
+
+    tmp_dir = cache.directory / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work:
+        tmp = Path(work) / f"{key}.mov"
+        run_ffmpeg(build_cmd(tmp), duration, stall_timeout=stall_timeout)
+        entry = cache.store(key, tmp, evict=False)
+    if entry is None:
+        raise FFmpegError(f"Could not store {what}")
+    return entry
+
+
+_hash_cache = JsonCache("hashes")
+
+
+def file_hash(path: Path) -> str:
+    """Return the SHA-256 of a file's content.
+
+    Digests are memoized by fingerprint, so an unchanged file is read once.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    key = file_fingerprint(path)
+    cached = _hash_cache.get(key)
+    if isinstance(cached, str):
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+    _hash_cache.set(key, value)
+    return value
@@ -0,0 +1,620 @@
+"""Segment-chunked rendering for UGCKit.
+
+Each avatar segment, together with the screencasts attached to it, is
+rendered to its own intermediate file with identical encoder settings and
+closed GOPs. Chunks can be encoded by several FFmpeg processes in
+parallel. The final MP4 is assembled with the concat demuxer using stream
+copy for video; audio is normalized and mixed with music once over the
+full concatenated track so loudness stays continuous. With
+``audio.separate_track`` set, that track comes from the cached audio stage
+(see ugckit.audio) and the chunks are video only.
+
+Segments that are a plain avatar clip already in the output's codec,
+geometry, frame rate, pixel format, colour range and H.264 profile and
+level (no screencasts, no subtitles) are not encoded at all: the clip's
+video is stream-copied into its chunk.
+
+Chunk files are named by a manifest hash of everything that affects their
+pixels, so re-running a render only re-encodes segments whose inputs or
+settings changed.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ugckit import __version__
+from ugckit.audio import render_audio
+from ugckit.cache import file_hash, hash_payload
+from ugckit.composer import (
+    _FILTER_BUILDERS,
+    FFmpegError,
+    MediaInfo,
+    _audio_encode_args,
+    _detect_composition_mode,
+    _finalize_audio,
+    _video_encode_args,
+    build_renditions_cmd,
+    probe_many,
+    run_ffmpeg,
+    validate_timeline_files,
+    wrap_with_post_processing,
+)
+from ugckit.graph import FilterGraph, optimize
+from ugckit.loudness import apply_gain, timeline_gain
+from ugckit.models import CompositionMode, Config, Timeline
+
+# Chunk audio is kept as PCM so the final pass can normalize the full track
+_CHUNK_AUDIO_ARGS = ["-c:a", "pcm_s16le", "-ar", "48000", "-ac", "2"]
+
+# Bump when chunk commands change in ways the manifest does not capture
+_CHUNK_FORMAT_VERSION = 1
+_CHUNK_NAME = re.compile(r"chunk_\d{3}_[0-9a-f]{16}\.mov")
+# Output settings that shape encoded chunks; renditions and progressive output only
+# apply to the assembled file
+_CHUNK_OUTPUT_FIELDS = {"fps", "resolution", "codec", "preset", "crf"}
+# Seconds between progress reports while chunks render
+_PROGRESS_POLL = 0.5
+
+# Encoder -> codec_name of the streams it writes (others are assumed to match)
+_ENCODER_CODECS = {
+    "libx264": "h264",
+    "libx265": "hevc",
+    "libvpx-vp9": "vp9",
+    "libaom-av1": "av1",
+    "libsvtav1": "av1",
+}
+
+# H.264 levels as (level_idc, max macroblocks per second, max frame size in macroblocks)
+_H264_LEVELS = [
+    (10, 1485, 99),
+    (11, 3000, 396),
+    (12, 6000, 396),
+    (13, 11880, 396),
+    (21, 19800, 792),
+    (22, 20250, 1620),
+    (30, 40500, 1620),
+    (31, 108000, 3600),
+    (32, 216000, 5120),
+    (40, 245760, 8192),
+    (42, 522240, 8704),
+    (50, 589824, 22080),
+    (51, 983040, 36864),
+    (52, 2073600, 36864),
+    (60, 4177920, 139264),
+    (61, 8355840, 139264),
+    (62, 16711680, 139264),
+]
+
+
+@dataclass
+class Chunk:
+    """One segment of the timeline rendered to its own file."""
+
+    index: int  # Position of the segment's avatar clip in the timeline
+    offset: float  # Segment start in the full timeline
+    timeline: Timeline  # Segment-local timeline starting at 0
+    path: Path
+
+
+def split_timeline(timeline: Timeline, work_dir: Path) -> List[Chunk]:
+    """Split a timeline into one chunk per avatar segment.
+
+    Screencasts are assigned to the avatar with the same parent_segment
+    (or, when unset, the avatar whose window contains the screencast start)
+    and shifted to segment-local time.
+    """
+    avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
+    screencast_entries = [e for e in timeline.entries if e.type == "screencast"]
+
+    chunks = []
+    for i, avatar in enumerate(avatar_entries):
+        duration = avatar.end - avatar.start
+        entries = [avatar.model_copy(update={"start": 0.0, "end": duration})]
+        for sc in screencast_entries:
+            if sc.parent_segment is not None and avatar.parent_segment is not None:
+                belongs = sc.parent_segment == avatar.parent_segment
+            else:
+                belongs = avatar.start <= sc.start < avatar.end
+            if belongs:
+                entries.append(
+                    sc.model_copy(
+                        update={
+                            "start": max(0.0, sc.start - avatar.start),
+                            "end": min(duration, sc.end - avatar.start),
+                        }
+                    )
+                )
+        chunks.append(
+            Chunk(
+                index=i,
+                offset=avatar.start,
+                timeline=Timeline(
+                    script_id=f"{timeline.script_id}_{i:03d}",
+                    total_duration=duration,
+                    entries=entries,
+                    offset=timeline.offset,
+                ),
+                path=work_dir / f"chunk_{i:03d}.mov",
+            )
+        )
+    return chunks
+
+
+def chunk_work_dir(timeline: Timeline, config: Config) -> Path:
+    """Directory for a timeline's intermediate chunk files."""
+    base = config.render.work_dir or timeline.output_path.parent / ".chunks"
+    return base / timeline.script_id
+
+
+def threads_per_job(config: Config) -> int:
+    """Split the CPU budget evenly across parallel chunk encoders."""
+    budget = config.render.threads or os.cpu_count() or 1
+    return max(1, budget // config.render.jobs)
+
+
+def build_chunk_cmd(
+    chunk: Chunk,
+    config: Config,
+    has_audio: bool,
+    head_video: Optional[Path] = None,
+    transparent_avatar: Optional[Path] = None,
+    subtitle_file: Optional[Path] = None,
+    threads: Optional[int] = None,
+    normalized: bool = False,
+    media: Optional[Dict[Path, MediaInfo]] = None,
+    audio: bool = True,
+) -> List[str]:
+    """Build the FFmpeg command rendering one chunk (video + PCM audio).
+
+    threads, when given, caps both filter and encoder threads so several
+    chunk encoders can share the machine. normalized marks inputs that are
+    mezzanines already at output geometry. media (probe results) lets the
+    graph optimizer drop scales of inputs already at the target size. With
+    config.variants enabled, missing screencast variants are encoded here.
+    Without audio, the chunk is video only (audio rendered separately).
+    """
+    tl = chunk.timeline
+    mode = _detect_composition_mode(tl)
+    head_videos = [head_video] if head_video and mode == CompositionMode.PIP else None
+    transparent_avatars = (
+        [transparent_avatar] if transparent_avatar and mode == CompositionMode.GREENSCREEN else None
+    )
+
+    # Loudness is normalized once over the full track in the concat pass
+    chunk_config = config.model_copy(deep=True)
+    chunk_config.audio.normalize = False
+
+    graph = _FILTER_BUILDERS[mode](
+        tl,
+        chunk_config,
+        [has_audio],
+        head_videos=head_videos,
+        transparent_avatars=transparent_avatars,
+        normalized=normalized,
+    )
+    wrap_with_post_processing(
+        graph, subtitle_file=subtitle_file, subtitle_offset=chunk.offset + chunk.timeline.offset
+    )
+    if not audio:
+        del graph.outputs["aout"]
+    if config.variants.enabled:
+        from ugckit.mezzanine import use_screencast_variants
+
+        screencasts = [e.file for e in tl.entries if e.type == "screencast"]
+        variants = use_screencast_variants(graph, screencasts, config)
+        if media is not None:
+            media = {**media, **probe_many(variants)}
+    optimize(graph, media, config.render.shared_decode_mb)
+
+    fps = config.output.fps
+    gop = max(1, round(fps * config.render.gop_seconds))
+    thread_args = ["-threads", str(threads)] if threads else []
+    return (
+        ["ffmpeg"]
+        + (["-filter_complex_threads", str(threads)] if threads else [])
+        + graph.input_args()
+        + ["-filter_complex", graph.to_string(), "-map", "[vout]"]
+        + (["-map", "[aout]"] if audio else [])
+        + _video_encode_args(config)
+        + _chunk_profile_args(config)
+        + thread_args
+        + ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0", "-flags", "+cgop"]
+        + (_CHUNK_AUDIO_ARGS if audio else ["-an"])
+        + ["-t", f"{tl.total_duration:.3f}", "-y", str(chunk.path)]
+    )
+
+
+def h264_level(width: int, height: int, fps: float) -> int:
+    """Lowest H.264 level_idc whose frame size and macroblock rate limits fit the output."""
+    mbs_w, mbs_h = -(-width // 16), -(-height // 16)
+    frame_mbs = mbs_w * mbs_h
+    for level, max_mbps, max_fs in _H264_LEVELS:
+        if (
+            frame_mbs <= max_fs
+            and max(mbs_w, mbs_h) ** 2 <= 8 * max_fs
+            and frame_mbs * fps <= max_mbps
+        ):
+            return level
+    return _H264_LEVELS[-1][0]
+
+
+def _chunk_profile_args(config: Config) -> List[str]:
+    """Pin the H.264 profile and level of encoded chunks so copied clips can be matched."""
+    if config.output.codec != "libx264":
+        return []
+    width, height = config.output.resolution
+    level = h264_level(width, height, config.output.fps)
+    return ["-profile:v", "high", "-level:v", f"{level // 10}.{level % 10}"]
+
+
+def can_stream_copy(
+    chunk: Chunk,
+    config: Config,
+    info: MediaInfo,
+    subtitle_file: Optional[Path] = None,
+    audio: bool = True,
+) -> bool:
+    """Whether a chunk's avatar clip can be copied into the concat unchanged.
+
+    The chunk must hold only its avatar (no screencasts or subtitles), and
+    the clip must already have the output's codec, size, frame rate, pixel
+    format and square pixels and span the whole segment (not a cut of it). Chunks carrying
+    audio also need the clip to have an audio track.
+
+    The clip's H.264 profile and level must equal those pinned on encoded
+    chunks and its colour range must be limited, so the concatenated stream
+    keeps one set of decoder parameters. Only libx264 chunks are pinned;
+    other encoders always re-encode.
+    """
+    if not config.render.stream_copy or subtitle_file is not None:
+        return False
+    if config.output.codec != "libx264":
+        return False
+    if len(chunk.timeline.entries) != 1 or (audio and not info.has_audio):
+        return False
+    if chunk.timeline.entries[0].source_start is not None:
+        return False
+    output = config.output
+    codec = _ENCODER_CODECS.get(output.codec, output.codec)
+    frame = 1.0 / output.fps
+    width, height = output.resolution
+    return (
+        info.video_codec == codec
+        and info.profile == "High"
+        and info.level == h264_level(width, height, output.fps)
+        and info.color_range != "pc"
+        and (info.width, info.height) == tuple(output.resolution)
+        and info.fps is not None
+        and abs(info.fps - output.fps) < 0.01
+        and info.pix_fmt == "yuv420p"
+        and info.sar in (None, "1:1", "0:1")
+        and abs(info.duration - chunk.timeline.total_duration) <= frame
+    )
+
+
+def build_copy_cmd(chunk: Chunk, audio: bool = True) -> List[str]:
+    """Build the FFmpeg command copying a chunk's avatar video without re-encoding.
+
+    Audio, when kept, is converted to the same PCM layout as encoded chunks.
+    """
+    avatar = chunk.timeline.entries[0]
+    return (
+        ["ffmpeg", "-i", str(avatar.file), "-map", "0:v:0", "-c:v", "copy"]
+        + (["-map", "0:a:0"] + _CHUNK_AUDIO_ARGS if audio else ["-an"])
+        + ["-t", f"{chunk.timeline.total_duration:.3f}", "-y", str(chunk.path)]
+    )
+
+
+def build_concat_cmd(
+    concat_list: Path,
+    output_path: Path,
+    config: Config,
+    total_duration: float,
+    music_file: Optional[Path] = None,
+    gain_db: Optional[float] = None,
+    audio_file: Optional[Path] = None,
+    music_offset: float = 0.0,
+    full_duration: Optional[float] = None,
+) -> List[str]:
+    """Build the final pass: stream-copy video, normalize and mix audio once.
+
+    gain_db, when given, replaces dynamic loudnorm (see ugckit.loudness).
+    With an audio_file (see ugckit.audio), both streams are stream-copied.
+    music_offset and full_duration place the music of a partial render
+    (see wrap_with_post_processing).
+    """
+    if audio_file is not None:
+        return (
+            ["ffmpeg", "-f", "concat", "-safe", "0", "-i", str(concat_list)]
+            + ["-i", str(audio_file), "-map", "0:v", "-map", "1:a", "-c", "copy"]
+            + ["-movflags", "+faststart", "-y", str(output_path)]
+        )
+
+    graph = FilterGraph()
+    chunks = graph.add_input(concat_list, ["-f", "concat", "-safe", "0"])
+    _finalize_audio(graph, chunks.audio, config)
+    if gain_db is not None:
+        apply_gain(graph, gain_db)
+    wrap_with_post_processing(
+        graph,
+        music_file=music_file,
+        music_config=config.music if music_file else None,
+        total_duration=total_duration,
+        music_offset=music_offset,
+        full_duration=full_duration,
+    )
+    optimize(graph)
+
+    return (
+        ["ffmpeg"]
+        + graph.input_args()
+        + ["-filter_complex", graph.to_string(), "-map", "0:v", "-map", "[aout]", "-c:v", "copy"]
+        + _audio_encode_args(config)
+        + ["-movflags", "+faststart", "-y", str(output_path)]
+    )
+
+
+def chunk_manifest(
+    chunk: Chunk,
+    config: Config,
+    head_video: Optional[Path] = None,
+    transparent_avatar: Optional[Path] = None,
+    subtitle_file: Optional[Path] = None,
+    audio: bool = True,
+    copy: bool = False,
+) -> dict:
+    """Describe everything that determines a chunk's rendered content.
+
+    Input files are identified by content hash, so renaming or touching a
+    file does not invalidate its chunks but replacing its content does.
+    """
+    entries = []
+    for entry in chunk.timeline.entries:
+        entries.append(
+            {
+                "type": entry.type,
+                "start": round(entry.start, 3),
+                "end": round(entry.end, 3),
+                "mode": entry.composition_mode.value,
+                "file": file_hash(entry.file),
+                "source_start": entry.source_start,
+            }
+        )
+    manifest = {
+        "version": __version__,
+        "format": _CHUNK_FORMAT_VERSION,
+        "entries": entries,
+        "duration": round(chunk.timeline.total_duration, 3),
+        "head_video": file_hash(head_video) if head_video else None,
+        "transparent_avatar": file_hash(transparent_avatar) if transparent_avatar else None,
+        "subtitles": file_hash(subtitle_file) if subtitle_file else None,
+        "subtitle_offset": (
+            round(chunk.offset + chunk.timeline.offset, 3) if subtitle_file else None
+        ),
+        "output": config.output.model_dump(mode="json", include=_CHUNK_OUTPUT_FIELDS),
+        "composition": config.composition.model_dump(mode="json"),
+        "gop_seconds": config.render.gop_seconds,
+    }
+    if config.variants.enabled:
+        manifest["variants"] = config.variants.model_dump(mode="json")
+    if not audio:
+        manifest["audio"] = False
+    if copy:
+        manifest["copy"] = True
+    return manifest
+
+
+def write_concat_list(chunks: List[Chunk], path: Path) -> Path:
+    """Write a concat demuxer list file for the chunk files."""
+    lines = []
+    for chunk in chunks:
+        escaped = str(chunk.path.resolve()).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def compose_video_chunked(
+    timeline: Timeline,
+    config: Config,
+    head_videos: Optional[List[Path]] = None,
+    transparent_avatars: Optional[List[Path]] = None,
+    subtitle_file: Optional[Path] = None,
+    music_file: Optional[Path] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    normalized: bool = False,
+) -> Path:
+    """Render a timeline segment by segment, then concat with stream copy.
+
+    Args:
+        timeline: Composition timeline.
+        config: UGCKit configuration.
+        head_videos: Pre-processed head video files for PiP mode.
+        transparent_avatars: Transparent avatar videos for green screen mode.
+        subtitle_file: ASS subtitle file for overlay.
+        music_file: Background music file path.
+        progress_callback: Called with overall render progress in [0, 1].
+        normalized: Timeline inputs are mezzanines (see ugckit.mezzanine).
+
+    Returns:
+        Path to output video.
+
+    Raises:
+        ValueError: If timeline has no output_path.
+        FFmpegError: If files are missing or FFmpeg fails.
+    """
+    if not timeline.output_path:
+        raise ValueError("Timeline must have output_path set")
+
+    validate_timeline_files(timeline)
+
+    work_dir = chunk_work_dir(timeline, config)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    chunks = split_timeline(timeline, work_dir)
+    if not chunks:
+        raise FFmpegError("Timeline has no avatar segments to render")
+
+    effective_music = music_file or (config.music.file if config.music.enabled else None)
+    music = Path(effective_music) if effective_music else None
+    media = probe_many(e.file for e in timeline.entries)
+
+    # A separate audio track is rendered (or reused) once and chunks are video only
+    audio_file = None
+    if config.audio.separate_track:
+        audio_file = render_audio(timeline, config, media, music, normalized)
+    chunk_audio = audio_file is None
+
+    # Segments already in output format are copied instead of encoded
+    copied = {
+        chunk.index
+        for chunk in chunks
+        if can_stream_copy(
+            chunk, config, media[chunk.timeline.entries[0].file], subtitle_file, chunk_audio
+        )
+    }
+
+    # Name chunks by manifest hash; existing files are reused as-is
+    for chunk in chunks:
+        manifest = chunk_manifest(
+            chunk,
+            config,
+            head_video=_extra_input(head_videos, chunk, CompositionMode.PIP),
+            transparent_avatar=_extra_input(
+                transparent_avatars, chunk, CompositionMode.GREENSCREEN
+            ),
+            subtitle_file=subtitle_file,
+            audio=chunk_audio,
+            copy=chunk.index in copied,
+        )
+        digest = hash_payload(manifest)[:16]
+        chunk.path = work_dir / f"chunk_{chunk.index:03d}_{digest}.mov"
+    dirty = [chunk for chunk in chunks if not chunk.path.exists()]
+
+    jobs = min(config.render.jobs, max(len(dirty), 1))
+    threads = threads_per_job(config) if jobs > 1 else None
+    total = timeline.total_duration or 1.0
+    progress = [0.0 if chunk in dirty else 1.0 for chunk in chunks]
+    lock = threading.Lock()
+
+    # Workers only record progress; the callback runs on the calling thread
+    def record(index: int, fraction: float) -> None:
+        with lock:
+            progress[index] = fraction
+
+    def overall() -> float:
+        with lock:
+            done = sum(p * c.timeline.total_duration / total for p, c in zip(progress, chunks))
+        return min(done, 1.0)
+
+    def render(chunk: Chunk) -> None:
+        avatar = chunk.timeline.entries[0]
+        # Render to a temporary name so an interrupted encode is never reused
+        partial_path = chunk.path.with_suffix(".partial.mov")
+        target = Chunk(chunk.index, chunk.offset, chunk.timeline, partial_path)
+        if chunk.index in copied:
+            cmd = build_copy_cmd(target, audio=chunk_audio)
+        else:
+            cmd = build_chunk_cmd(
+                target,
+                config,
+                has_audio=media[avatar.file].has_audio,
+                head_video=_nth(head_videos, chunk.index),
+                transparent_avatar=_nth(transparent_avatars, chunk.index),
+                subtitle_file=subtitle_file,
+                threads=threads,
+                media=media,
+                normalized=normalized,
+                audio=chunk_audio,
+            )
+        callback = partial(record, chunk.index) if progress_callback else None
+        try:
+            run_ffmpeg(
+                cmd, chunk.timeline.total_duration, callback, config.render.stall_timeout, cancel
+            )
+            os.replace(partial_path, chunk.path)
+        finally:
+            # Failed or cancelled encodes leave no partial file behind
+            partial_path.unlink(missing_ok=True)
+        record(chunk.index, 1.0)
+
+    # Each worker thread drives one FFmpeg process
+    cancel = threading.Event()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(render, chunk) for chunk in dirty]
+        pending = set(futures)
+        reported = None
+        try:
+            while pending:
+                done, pending = wait(pending, _PROGRESS_POLL, FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                current = overall()
+                if progress_callback and current != reported:
+                    progress_callback(current)
+                    reported = current
+        except BaseException:
+            # Drop queued chunks and kill the encoders already running
+            cancel.set()
+            for future in futures:
+                future.cancel()
+            raise
+
+    gain = None
+    if config.audio.normalize and config.audio.two_pass and audio_file is None:
+        gain = timeline_gain(timeline, media, config)
+    concat_list = write_concat_list(chunks, work_dir / "concat.txt")
+    timeline.output_path.parent.mkdir(parents=True, exist_ok=True)
+    run_ffmpeg(
+        build_concat_cmd(
+            concat_list,
+            timeline.output_path,
+            config,
+            timeline.total_duration,
+            music_file=music,
+            gain_db=gain,
+            audio_file=audio_file,
+            music_offset=timeline.offset,
+            full_duration=timeline.full_duration,
+        ),
+        timeline.total_duration,
+        stall_timeout=config.render.stall_timeout,
+    )
+    # Renditions are encoded from the assembled output in one more pass
+    if config.output.renditions:
+        run_ffmpeg(
+            build_renditions_cmd(timeline.output_path, timeline.output_path, config),
+            timeline.total_duration,
+            stall_timeout=config.render.stall_timeout,
+        )
+    if progress_callback:
+        progress_callback(1.0)
+
+    # Drop chunk files from earlier renders that are no longer referenced
+    current = {chunk.path.name for chunk in chunks}
+    for stale in work_dir.glob("chunk_*.mov"):
+        if _CHUNK_NAME.fullmatch(stale.name) and stale.name not in current:
+            stale.unlink(missing_ok=True)
+    return timeline.output_path
+
+
+def _nth(paths: Optional[List[Path]], index: int) -> Optional[Path]:
+    if paths and index < len(paths):
+        return paths[index]
+    return None
+
+
+def _extra_input(
+    paths: Optional[List[Path]], chunk: Chunk, mode: CompositionMode
+) -> Optional[Path]:
+    """Head/transparent video that build_chunk_cmd will actually use for a chunk."""
+    if _detect_composition_mode(chunk.timeline) != mode:
+        return None
+    return _nth(paths, chunk.index)
@@ -3,8 +3,9 @@
 from __future__ import annotations
 
 import sys
+from functools import partial
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 import click
 
@@ -14,6 +15,7 @@ from ugckit.composer import (
     compose_video,
     format_ffmpeg_cmd,
     format_timeline,
+    render_frame,
 )
 from ugckit.config import load_config
 from ugckit.models import CompositionMode, Position
@@ -72,7 +74,7 @@ def main():
     "--output",
     "-o",
     type=click.Path(path_type=Path),
-    help="Output directory or file path",
+    help="Output directory or file path, or - to stream fragmented MP4 to stdout",
 )
 @click.option(
     "--config",
@@ -168,6 +170,53 @@ def main():
     default="base",
     help="Whisper model for subtitle transcription",
 )
+@click.option(
+    "--chunked",
+    is_flag=True,
+    help="Render each segment separately; unchanged segments are reused on re-runs",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Render segments in N parallel FFmpeg workers (implies --chunked)",
+)
+@click.option(
+    "--mezzanine",
+    is_flag=True,
+    help="Normalize inputs once into cached intermediates before rendering",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always re-render instead of reusing an identical earlier output",
+)
+@click.option(
+    "--preview",
+    is_flag=True,
+    help="Quick low-resolution render from cached proxies (written as <name>_preview.mp4)",
+)
+@click.option(
+    "--progressive",
+    type=click.Choice(["fmp4", "hls"]),
+    default=None,
+    help="Also write <name>_live.mp4 or <name>_hls/ playable while rendering",
+)
+@click.option(
+    "--from",
+    "range_from",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Render only from this time in seconds (written as <name>_<from>-<to>.mp4)",
+)
+@click.option(
+    "--to",
+    "range_to",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Render only up to this time in seconds",
+)
 @click.option(
     "--dry-run",
     is_flag=True,
@@ -196,6 +245,14 @@ def compose(
     subtitles: bool,
     subtitle_font_size: int,
     subtitle_model: str,
+    chunked: bool,
+    jobs: Optional[int],
+    mezzanine: bool,
+    no_cache: bool,
+    preview: bool,
+    progressive: Optional[str],
+    range_from: Optional[float],
+    range_to: Optional[float],
     dry_run: bool,
 ):
     """Compose a video from script and avatar clips.
@@ -206,6 +263,11 @@ def compose(
         ugckit compose --script A1 --avatars seg1.mp4 --avatars seg2.mp4
         ugckit compose --script A1 --avatar-dir ./avatars/ --mode pip
     """
+    # With --output - the video goes to stdout, so messages go to stderr
+    to_stdout = output is not None and str(output) == "-"
+    log = partial(click.echo, err=to_stdout)
+    sink = sys.stdout.buffer if to_stdout else None
+
     if not avatars and not avatar_dir:
         click.echo("Error: provide --avatars or --avatar-dir", err=True)
         sys.exit(1)
@@ -240,8 +302,8 @@ def compose(
 
     # Smart Sync: resolve keyword-based screencast timing
     if sync:
-        click.echo("Running Smart Sync (Whisper)...")
-        parsed_script = apply_sync(parsed_script, avatar_list, sync_model)
+        log("Running Smart Sync (Whisper)...")
+        parsed_script = apply_sync(parsed_script, avatar_list, sync_model, cfg)
 
     # Override screencast modes based on --mode
     mode_enum = CompositionMode(mode)
@@ -263,6 +325,19 @@ def compose(
         cfg.music.volume = music_volume
         cfg.music.fade_out_duration = music_fade_out
 
+    if chunked:
+        cfg.render.chunked = True
+    if jobs:
+        cfg.render.jobs = jobs
+    if mezzanine:
+        cfg.mezzanine.enabled = True
+    if no_cache:
+        cfg.cache.enabled = False
+    if preview:
+        cfg.preview.enabled = True
+    if progressive:
+        cfg.output.progressive = progressive
+
     # Subtitle config
     if subtitles:
         cfg.subtitles.enabled = True
@@ -270,13 +345,15 @@ def compose(
         cfg.subtitles.whisper_model = subtitle_model
 
     # Determine output path
-    if output:
+    if output and not to_stdout:
         if output.is_dir():
             output_path = output / f"{parsed_script.script_id}.mp4"
         else:
             output_path = output
     else:
         output_path = cfg.output_path / f"{parsed_script.script_id}.mp4"
+    if preview:
+        output_path = output_path.with_name(f"{output_path.stem}_preview{output_path.suffix}")
 
     # Build timeline
     try:
@@ -290,10 +367,20 @@ def compose(
         click.echo(f"Error building timeline: {e}", err=True)
         sys.exit(1)
 
+    # Partial render of a time range
+    time_range = None
+    if range_from is not None or range_to is not None:
+        time_range = (range_from or 0.0, timeline.total_duration if range_to is None else range_to)
+        if time_range[1] <= time_range[0]:
+            click.echo("Error: --to must be after --from", err=True)
+            sys.exit(1)
+        stem = f"{output_path.stem}_{time_range[0]:g}-{time_range[1]:g}"
+        timeline.output_path = output_path.with_name(stem + output_path.suffix)
+
     # Pre-process for PiP mode
     head_videos = None
     if mode == "pip":
-        click.echo("Generating head videos for PiP mode...")
+        log("Generating head videos for PiP mode...")
         cfg.composition.pip.head_position = Position(head_position)
         cfg.composition.pip.head_scale = head_scale
         head_videos = prepare_pip_videos(avatar_list, cfg)
@@ -303,7 +390,7 @@ def compose(
     # Pre-process for green screen mode
     transparent_avatars = None
     if mode == "greenscreen":
-        click.echo("Generating transparent avatars for green screen mode...")
+        log("Generating transparent avatars for green screen mode...")
         transparent_avatars = prepare_greenscreen_videos(avatar_list, cfg)
         if not transparent_avatars:
             click.echo("Warning: green screen processing failed, using overlay mode", err=True)
@@ -311,16 +398,16 @@ def compose(
     # Generate subtitles
     subtitle_file = None
     if subtitles:
-        click.echo("Generating subtitles (Whisper)...")
+        log("Generating subtitles (Whisper)...")
         subtitle_file = generate_subtitles(timeline, avatar_list, cfg)
 
     # Display timeline
-    click.echo(format_timeline(timeline))
-    click.echo()
+    log(format_timeline(timeline))
+    log()
 
     if dry_run:
-        click.echo("Dry run - no video will be rendered")
-        click.echo()
+        log("Dry run - no video will be rendered")
+        log()
         cmd = compose_video(
             timeline,
             cfg,
@@ -329,13 +416,15 @@ def compose(
             transparent_avatars=transparent_avatars,
             subtitle_file=subtitle_file,
             music_file=music,
+            time_range=time_range,
+            sink=sink,
         )
-        click.echo("FFmpeg command:")
-        click.echo(format_ffmpeg_cmd(cmd))
+        log("FFmpeg command:")
+        log(format_ffmpeg_cmd(cmd))
         return
 
     # Compose video
-    click.echo("Composing video...")
+    log("Composing video...")
     try:
         result_path = compose_video(
             timeline,
@@ -345,13 +434,144 @@ def compose(
             transparent_avatars=transparent_avatars,
             subtitle_file=subtitle_file,
             music_file=music,
+            time_range=time_range,
+            sink=sink,
         )
-        click.echo(f"Done! Output: {result_path}")
+        log(f"Done! Output: {result_path or 'stdout'}")
     except (ValueError, FFmpegError) as e:
         click.echo(f"Error composing video: {e}", err=True)
         sys.exit(1)
 
 
+@main.command()
+@click.option(
+    "--script",
+    "-s",
+    required=True,
+    help="Script ID (e.g., A1_day347) or path to markdown file",
+)
+@click.option(
+    "--avatars",
+    "-a",
+    multiple=True,
+    type=click.Path(exists=True, path_type=Path),
+    help="Avatar video files (one per segment, in order)",
+)
+@click.option(
+    "--avatar-dir",
+    type=click.Path(exists=True, path_type=Path),
+    help="Directory containing avatar .mp4 files (sorted by filename)",
+)
+@click.option(
+    "--screencasts",
+    "-c",
+    type=click.Path(exists=True, path_type=Path),
+    help="Directory containing screencast files",
+)
+@click.option(
+    "--scripts-dir",
+    "-d",
+    type=click.Path(exists=True, path_type=Path),
+    help="Directory containing script markdown files",
+)
+@click.option(
+    "--time",
+    "-t",
+    "frame_time",
+    type=click.FloatRange(min=0),
+    required=True,
+    help="Frame time in seconds",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(path_type=Path),
+    help="Image file (default: <output>/<script>_<time>s.png)",
+)
+@click.option(
+    "--config",
+    type=click.Path(exists=True, path_type=Path),
+    help="Path to config YAML file",
+)
+@click.option(
+    "--mode",
+    "-m",
+    type=click.Choice(["overlay", "pip", "split", "greenscreen"]),
+    default="overlay",
+    help="Composition mode",
+)
+def snapshot(
+    script: str,
+    avatars: Tuple[Path, ...],
+    avatar_dir: Optional[Path],
+    screencasts: Optional[Path],
+    scripts_dir: Optional[Path],
+    frame_time: float,
+    output: Optional[Path],
+    config: Optional[Path],
+    mode: str,
+):
+    """Render a single composited frame to check the layout.
+
+    Only the inputs visible at --time are decoded, so this takes about as
+    long as one frame of the full render.
+
+    Example:
+        ugckit snapshot --script A1 --avatar-dir ./avatars/ --time 12.5
+    """
+    if not avatars and not avatar_dir:
+        click.echo("Error: provide --avatars or --avatar-dir", err=True)
+        sys.exit(1)
+
+    cfg = load_config(config)
+    try:
+        parsed_script = load_script(script, scripts_dir)
+    except (FileNotFoundError, ValueError) as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+    avatar_list = sorted(avatar_dir.glob("*.mp4")) if avatar_dir else list(avatars)
+    if not avatar_list:
+        click.echo(f"Error: no .mp4 files in {avatar_dir}", err=True)
+        sys.exit(1)
+
+    mode_enum = CompositionMode(mode)
+    if mode_enum != CompositionMode.OVERLAY:
+        for seg in parsed_script.segments:
+            for sc in seg.screencasts:
+                sc.mode = mode_enum
+
+    try:
+        timeline = build_timeline(
+            script=parsed_script,
+            avatar_clips=avatar_list,
+            screencasts_dir=screencasts or cfg.screencasts_path,
+            output_path=cfg.output_path / f"{parsed_script.script_id}.mp4",
+        )
+    except (ValueError, FFmpegError) as e:
+        click.echo(f"Error building timeline: {e}", err=True)
+        sys.exit(1)
+
+    # Preprocess only the avatar visible at --time, and only on a cache miss
+    def prepare(clips: List[Path]):
+        if mode == "pip":
+            return prepare_pip_videos(clips, cfg), None
+        return None, prepare_greenscreen_videos(clips, cfg)
+
+    try:
+        frame = render_frame(
+            timeline,
+            cfg,
+            frame_time,
+            output_path=output,
+            prepare_avatars=prepare if mode in ("pip", "greenscreen") else None,
+        )
+    except (ValueError, FFmpegError) as e:
+        click.echo(f"Error rendering frame: {e}", err=True)
+        sys.exit(1)
+    click.echo(f"Frame: {frame}")
+
+
 @main.command()
 @click.option(
     "--scripts-dir",
@@ -453,6 +673,28 @@ def show_script(script: str, scripts_dir: Optional[Path]):
     type=click.Path(exists=True, path_type=Path),
     help="Path to config YAML file",
 )
+@click.option(
+    "--chunked",
+    is_flag=True,
+    help="Render each segment separately; unchanged segments are reused on re-runs",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Render segments in N parallel FFmpeg workers (implies --chunked)",
+)
+@click.option(
+    "--mezzanine",
+    is_flag=True,
+    help="Normalize inputs once into cached intermediates before rendering",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always re-render instead of reusing an identical earlier output",
+)
 @click.option(
     "--dry-run",
     is_flag=True,
@@ -463,6 +705,10 @@ def batch(
     avatar_dir: Path,
     output: Optional[Path],
     config: Optional[Path],
+    chunked: bool,
+    jobs: Optional[int],
+    mezzanine: bool,
+    no_cache: bool,
     dry_run: bool,
 ):
     """Batch compose videos for all scripts with matching avatars.
@@ -473,6 +719,14 @@ def batch(
         ugckit batch --scripts-dir ./scripts/ --avatar-dir ./avatars/ --dry-run
     """
     cfg = load_config(config)
+    if chunked:
+        cfg.render.chunked = True
+    if jobs:
+        cfg.render.jobs = jobs
+    if mezzanine:
+        cfg.mezzanine.enabled = True
+    if no_cache:
+        cfg.cache.enabled = False
     scripts = parse_scripts_directory(scripts_dir)
 
     if not scripts:
@@ -5,20 +5,35 @@ Handles video assembly using FFmpeg filter_complex.
 
 from __future__ import annotations
 
+import json
+import os
+import queue
 import shlex
+import shutil
 import subprocess
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Callable, List, Optional, Tuple, Union
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
+from ugckit import __version__
+from ugckit.cache import FileCache, JsonCache, file_fingerprint, file_hash, hash_payload
+from ugckit.graph import FilterGraph, Input, Pad, optimize
 from ugckit.models import (
     CompositionMode,
     Config,
+    MusicConfig,
     Position,
+    RenditionConfig,
     Script,
     Timeline,
     TimelineEntry,
 )
+from ugckit.mp4 import MP4_SUFFIXES, Mp4ParseError, read_mp4
 
 
 class FFmpegError(Exception):
@@ -27,43 +42,234 @@ class FFmpegError(Exception):
     pass
 
 
-def get_video_duration(video_path: Path) -> float:
-    """Get duration of a video file using ffprobe.
-
-    Args:
-        video_path: Path to video file.
-
-    Returns:
-        Duration in seconds.
-
-    Raises:
-        FFmpegError: If ffprobe fails or returns invalid data.
-    """
-    if not video_path.exists():
-        raise FFmpegError(f"Video file not found: {video_path}")
-
+# Where compose_video(sink=...) streams the video: a callable receiving
+# bytes, a binary file object or a file descriptor
+StreamSink = Union[Callable[[bytes], object], BinaryIO, int]
+# Derives (head_videos, transparent_avatars) from avatar files, e.g. the
+# PiP or green screen preprocessing, for render_frame(prepare_avatars=...)
+AvatarPrep = Callable[[List[Path]], Tuple[Optional[List[Path]], Optional[List[Path]]]]
+# Bytes read from FFmpeg's stdout per write to a stream sink
+STREAM_CHUNK_SIZE = 1 << 16
+# Seconds FFmpeg's output time may stop advancing before a run is aborted
+DEFAULT_STALL_TIMEOUT = 60.0
+# Long runs may also stall for this fraction of their expected encode time
+_STALL_SCALE = 0.25
+# Seconds between watchdog checks while FFmpeg is silent
+_WATCHDOG_POLL = 1.0
+
+
+@dataclass
+class MediaInfo:
+    """Stream layout and key parameters of a media file."""
+
+    duration: float
+    video_streams: int = 0
+    audio_streams: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    pix_fmt: Optional[str] = None
+    sar: Optional[str] = None
+    video_codec: Optional[str] = None
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    color_range: Optional[str] = None
+    audio_codec: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+    @property
+    def has_video(self) -> bool:
+        return self.video_streams > 0
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_streams > 0
+
+
+# Bump when MediaInfo fields change so stale cache records are ignored.
+_PROBE_CACHE_VERSION = 2
+_probe_cache = JsonCache("probe")
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    """Parse an ffprobe rational like "30000/1001" into a float."""
+    if not rate:
+        return None
+    num, _, den = rate.partition("/")
+    try:
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value or None
+
+
+def _media_info_from_ffprobe(data: dict) -> MediaInfo:
+    """Build MediaInfo from ffprobe -show_streams -show_format JSON output."""
+    streams = data.get("streams", [])
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+
+    duration = data.get("format", {}).get("duration")
+    if duration is None and video:
+        duration = video[0].get("duration")
+    if duration is None:
+        raise ValueError("no duration")
+
+    info = MediaInfo(
+        duration=float(duration),
+        video_streams=len(video),
+        audio_streams=len(audio),
+    )
+    if video:
+        v = video[0]
+        info.width = v.get("width")
+        info.height = v.get("height")
+        info.fps = _parse_rate(v.get("avg_frame_rate")) or _parse_rate(v.get("r_frame_rate"))
+        info.pix_fmt = v.get("pix_fmt")
+        info.sar = v.get("sample_aspect_ratio")
+        info.video_codec = v.get("codec_name")
+        info.profile = v.get("profile")
+        info.level = v.get("level")
+        if v.get("color_range") in ("tv", "pc"):
+            info.color_range = v["color_range"]
+    if audio:
+        a = audio[0]
+        info.audio_codec = a.get("codec_name")
+        info.sample_rate = int(a["sample_rate"]) if a.get("sample_rate") else None
+        info.channels = a.get("channels")
+    return info
+
+
+def _media_info_from_mp4(path: Path) -> Optional[MediaInfo]:
+    """Read MediaInfo from the MP4/MOV container directly, or None if unsupported."""
+    if path.suffix.lower() not in MP4_SUFFIXES:
+        return None
+    try:
+        mp4 = read_mp4(path)
+    except (Mp4ParseError, OSError):
+        return None
+
+    video = [t for t in mp4.tracks if t.handler == "vide"]
+    audio = [t for t in mp4.tracks if t.handler == "soun"]
+    info = MediaInfo(duration=mp4.duration, video_streams=len(video), audio_streams=len(audio))
+    if video:
+        v = video[0]
+        info.width = v.width
+        info.height = v.height
+        info.fps = v.fps
+        info.pix_fmt = v.pix_fmt
+        info.sar = v.sar
+        info.video_codec = v.codec
+        info.profile = v.profile
+        info.level = v.level
+        info.color_range = v.color_range
+    if audio:
+        a = audio[0]
+        info.audio_codec = a.codec
+        info.sample_rate = a.sample_rate
+        info.channels = a.channels
+    return info
+
+
+def _run_ffprobe(path: Path) -> MediaInfo:
+    """Probe a media file with a single ffprobe call (no caching)."""
     cmd = [
         "ffprobe",
         "-v",
         "error",
-        "-show_entries",
-        "format=duration",
+        "-show_streams",
+        "-show_format",
         "-of",
-        "default=noprint_wrappers=1:nokey=1",
-        str(video_path),
+        "json",
+        str(path),
     ]
     try:
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
     except subprocess.TimeoutExpired:
-        raise FFmpegError(f"ffprobe timed out for {video_path}")
+        raise FFmpegError(f"ffprobe timed out for {path}")
+    except OSError as e:
+        raise FFmpegError(f"Could not run ffprobe for {path}: {e}") from e
 
     if result.returncode != 0:
-        raise FFmpegError(f"ffprobe failed for {video_path}: {result.stderr}")
+        raise FFmpegError(f"ffprobe failed for {path}: {result.stderr}")
 
     try:
-        return float(result.stdout.strip())
-    except ValueError as e:
-        raise FFmpegError(f"Invalid duration from ffprobe for {video_path}: {result.stdout}") from e
+        return _media_info_from_ffprobe(json.loads(result.stdout))
+    except (ValueError, TypeError, KeyError) as e:
+        raise FFmpegError(f"Invalid duration from ffprobe for {path}: {result.stdout}") from e
+
+
+def probe_media(path: Path) -> MediaInfo:
+    """Probe a media file.
+
+    Plain MP4/MOV files are read directly from their container boxes;
+    anything the container reader cannot handle falls back to a single
+    ffprobe call. Results are cached on disk keyed by path, size and
+    mtime, so repeated probes of an unchanged file do no work.
+
+    Args:
+        path: Path to media file.
+
+    Returns:
+        MediaInfo with duration, stream layout and key stream parameters.
+
+    Raises:
+        FFmpegError: If the file is missing or ffprobe fails or returns invalid data.
+    """
+    if not path.exists():
+        raise FFmpegError(f"Video file not found: {path}")
+
+    key = file_fingerprint(path)
+    cached = _probe_cache.get(key)
+    if cached and cached.pop("version", None) == _PROBE_CACHE_VERSION:
+        try:
+            return MediaInfo(**cached)
+        except TypeError:
+            pass
+
+    info = _media_info_from_mp4(path) or _run_ffprobe(path)
+    _probe_cache.set(key, {"version": _PROBE_CACHE_VERSION, **asdict(info)})
+    return info
+
+
+def probe_many(paths: Iterable[Path], max_workers: int = 8) -> Dict[Path, MediaInfo]:
+    """Probe several media files concurrently on a bounded thread pool.
+
+    Duplicate paths are probed once.
+
+    Args:
+        paths: Media files to probe.
+        max_workers: Maximum number of concurrent ffprobe processes.
+
+    Returns:
+        Mapping of each path to its MediaInfo.
+
+    Raises:
+        FFmpegError: For the first path (in input order) that fails to probe.
+    """
+    unique = list(dict.fromkeys(paths))
+    if not unique:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = {path: pool.submit(probe_media, path) for path in unique}
+    return {path: future.result() for path, future in futures.items()}
+
+
+def get_video_duration(video_path: Path) -> float:
+    """Get duration of a video file.
+
+    Args:
+        video_path: Path to video file.
+
+    Returns:
+        Duration in seconds.
+
+    Raises:
+        FFmpegError: If ffprobe fails or returns invalid data.
+    """
+    return probe_media(video_path).duration
 
 
 def has_audio_stream(video_path: Path) -> bool:
@@ -78,30 +284,7 @@ def has_audio_stream(video_path: Path) -> bool:
     Raises:
         FFmpegError: If ffprobe fails.
     """
-    if not video_path.exists():
-        raise FFmpegError(f"Video file not found: {video_path}")
-
-    cmd = [
-        "ffprobe",
-        "-v",
-        "error",
-        "-select_streams",
-        "a",
-        "-show_entries",
-        "stream=index",
-        "-of",
-        "csv=p=0",
-        str(video_path),
-    ]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-    except subprocess.TimeoutExpired:
-        raise FFmpegError(f"ffprobe timed out for {video_path}")
-
-    if result.returncode != 0:
-        raise FFmpegError(f"ffprobe failed for {video_path}: {result.stderr}")
-
-    return bool(result.stdout.strip())
+    return probe_media(video_path).has_audio
 
 
 def build_timeline(
@@ -131,14 +314,15 @@ def build_timeline(
     entries: List[TimelineEntry] = []
     current_time = 0.0
 
+    # Probe all clips up front; durations are read from the results below
+    media = probe_many(avatar_clips[: len(script.segments)])
+
     for i, segment in enumerate(script.segments):
         if i >= len(avatar_clips):
             break
 
         avatar_clip = avatar_clips[i]
-
-        # Get actual duration from video file
-        duration = get_video_duration(avatar_clip)
+        duration = media[avatar_clip].duration
 
         # Add avatar entry
         entries.append(
@@ -239,18 +423,20 @@ def build_ffmpeg_filter_overlay(
     timeline: Timeline,
     config: Config,
     audio_presence: Optional[List[bool]] = None,
-) -> str:
-    """Build FFmpeg filter_complex string for overlay mode.
+    normalized: bool = False,
+) -> FilterGraph:
+    """Build the filter graph for overlay mode.
 
     Args:
         timeline: Composition timeline.
         config: UGCKit configuration.
         audio_presence: Per-clip audio presence flags.
+        normalized: Avatar inputs are mezzanines already at output geometry.
 
     Returns:
-        FFmpeg filter_complex string.
+        Filter graph with its inputs and [vout]/[aout] outputs.
     """
-    filters = []
+    graph = FilterGraph()
     overlay_cfg = config.composition.overlay
     output_cfg = config.output
 
@@ -262,51 +448,31 @@ def build_ffmpeg_filter_overlay(
     if len(audio_presence) != len(avatar_entries):
         raise ValueError("audio_presence length must match avatar entries")
 
-    # Scale avatars to output resolution
-    for i, _ in enumerate(avatar_entries):
-        filters.append(
-            f"[{i}:v]scale={output_cfg.resolution[0]}:{output_cfg.resolution[1]},"
-            f"setsar=1[av{i}]"
-        )
+    avatar_inputs = [_avatar_input(graph, e) for e in avatar_entries]
+    sc_sources = [_screencast_source(graph, e) for e in screencast_entries]
 
-    # Concatenate avatars
-    if len(avatar_entries) > 1:
-        concat_inputs = "".join(f"[av{i}]" for i in range(len(avatar_entries)))
-        filters.append(f"{concat_inputs}concat=n={len(avatar_entries)}:v=1:a=0[base]")
-    else:
-        filters.append("[av0]copy[base]")
+    # Scale avatars to output resolution and concatenate
+    base = _build_avatar_base(graph, avatar_inputs, output_cfg.resolution, normalized)
 
     # Audio
-    _build_audio_pipeline(filters, avatar_entries, audio_presence, timeline.total_duration)
-
-    # Apply screencast overlays
-    current_base = "base"
-    sc_input_offset = len(avatar_entries)
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, audio_presence, timeline.total_duration, normalized
+    )
 
-    for i, sc_entry in enumerate(screencast_entries):
-        sc_idx = sc_input_offset + i
-        next_base = f"out{i}"
-
-        # Scale screencast
-        scale_w = int(output_cfg.resolution[0] * overlay_cfg.scale)
-        filters.append(f"[{sc_idx}:v]scale={scale_w}:-1[sc{i}]")
-
-        # Get position coordinates
-        x, y = position_to_overlay_coords(
-            overlay_cfg.position,
-            overlay_cfg.margin,
-            "w",
-            "h",
+    # Composite screencast overlays interval by interval
+    scale_w = int(output_cfg.resolution[0] * overlay_cfg.scale)
+    layers = [
+        _Layer(
+            entry=sc_entry,
+            sources=[graph.chain(sc_sources[i], f"scale={scale_w}:-1")],
+            compose=partial(_compose_corner, overlay_cfg.position, overlay_cfg.margin),
         )
-
-        # Overlay with timing
-        enable = f"between(t,{sc_entry.start:.2f},{sc_entry.end:.2f})"
-        filters.append(f"[{current_base}][sc{i}]overlay=x={x}:y={y}:enable='{enable}'[{next_base}]")
-        current_base = next_base
+        for i, sc_entry in enumerate(screencast_entries)
+    ]
+    video = _build_partitioned_video(graph, base, layers, timeline.total_duration, output_cfg.fps)
 
     # Final output
-    final_base = current_base if screencast_entries else "base"
-    return _finalize_filter(filters, final_base, config)
+    return _finalize_filter(graph, video, audio, config)
 
 
 def build_ffmpeg_filter_pip(
@@ -314,8 +480,9 @@ def build_ffmpeg_filter_pip(
     config: Config,
     audio_presence: Optional[List[bool]] = None,
     head_videos: Optional[List[Path]] = None,
-) -> str:
-    """Build FFmpeg filter_complex string for PiP mode.
+    normalized: bool = False,
+) -> FilterGraph:
+    """Build the filter graph for PiP mode.
 
     In PiP mode: screencast goes fullscreen as overlay, head video in corner.
 
@@ -324,12 +491,13 @@ def build_ffmpeg_filter_pip(
         config: UGCKit configuration.
         audio_presence: Per-clip audio presence flags.
         head_videos: Pre-processed head video files (one per avatar clip).
+        normalized: Avatar inputs are mezzanines already at output geometry.
 
     Returns:
-        FFmpeg filter_complex string.
+        Filter graph with its inputs and [vout]/[aout] outputs.
     """
 
-    filters = []
+    graph = FilterGraph()
     output_cfg = config.output
     pip_cfg = config.composition.pip
 
@@ -345,141 +513,350 @@ def build_ffmpeg_filter_pip(
     if len(audio_presence) != len(avatar_entries):
         raise ValueError("audio_presence length must match avatar entries")
 
-    # Input layout:
-    # [0..n-1]: avatar clips
-    # [n..n+sc-1]: screencast clips
-    # [n+sc..]: head videos (if provided)
-    num_avatars = len(avatar_entries)
-    num_screencasts = len(screencast_entries)
-    head_input_offset = num_avatars + num_screencasts
-
-    # Scale avatars to output resolution
-    for i in range(num_avatars):
-        filters.append(
-            f"[{i}:v]scale={output_cfg.resolution[0]}:{output_cfg.resolution[1]},"
-            f"setsar=1[av{i}]"
-        )
+    # Inputs: avatar clips, screencast clips, then head videos as used
+    avatar_inputs = [_avatar_input(graph, e) for e in avatar_entries]
+    sc_sources = [_screencast_source(graph, e) for e in screencast_entries]
 
-    # Concatenate avatars
-    if num_avatars > 1:
-        concat_inputs = "".join(f"[av{i}]" for i in range(num_avatars))
-        filters.append(f"{concat_inputs}concat=n={num_avatars}:v=1:a=0[base]")
-    else:
-        filters.append("[av0]copy[base]")
+    # Scale avatars to output resolution and concatenate
+    base = _build_avatar_base(graph, avatar_inputs, output_cfg.resolution, normalized)
 
     # Audio
-    _build_audio_pipeline(filters, avatar_entries, audio_presence, timeline.total_duration)
-
-    current_base = "base"
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, audio_presence, timeline.total_duration, normalized
+    )
 
-    # Apply overlay-mode screencasts (same as before)
+    # Overlay-mode screencasts are drawn below PiP screencasts
     overlay_cfg = config.composition.overlay
-    for i, sc_entry in enumerate(overlay_screencasts):
-        # Find this screencast's input index
-        sc_idx = num_avatars + screencast_entries.index(sc_entry)
-        next_base = f"ov{i}"
-
-        scale_w = int(output_cfg.resolution[0] * overlay_cfg.scale)
-        filters.append(f"[{sc_idx}:v]scale={scale_w}:-1[osc{i}]")
-
-        x, y = position_to_overlay_coords(overlay_cfg.position, overlay_cfg.margin, "w", "h")
-        enable = f"between(t,{sc_entry.start:.2f},{sc_entry.end:.2f})"
-        filters.append(
-            f"[{current_base}][osc{i}]overlay=x={x}:y={y}:enable='{enable}'[{next_base}]"
+    scale_w = int(output_cfg.resolution[0] * overlay_cfg.scale)
+    layers = []
+    for sc_entry in overlay_screencasts:
+        source = sc_sources[screencast_entries.index(sc_entry)]
+        layers.append(
+            _Layer(
+                entry=sc_entry,
+                sources=[graph.chain(source, f"scale={scale_w}:-1")],
+                compose=partial(_compose_corner, overlay_cfg.position, overlay_cfg.margin),
+            )
         )
-        current_base = next_base
-
-    # Apply PiP screencasts (screencast fullscreen, head in corner)
-    for i, sc_entry in enumerate(pip_screencasts):
-        sc_idx = num_avatars + screencast_entries.index(sc_entry)
 
-        # Scale screencast to fullscreen
-        next_base_sc = f"pip_sc{i}"
-        filters.append(
-            f"[{sc_idx}:v]scale={output_cfg.resolution[0]}:{output_cfg.resolution[1]},"
-            f"setsar=1[psc{i}]"
+    # PiP screencasts: screencast fullscreen, head video in corner. Heads are
+    # scaled to this output's head size (e.g. in previews, see ugckit.preview).
+    head_size = int(output_cfg.resolution[0] * pip_cfg.head_scale)
+    heads: Dict[int, Pad] = {}
+    for sc_entry in pip_screencasts:
+        source = sc_sources[screencast_entries.index(sc_entry)]
+        sources = [
+            graph.chain(
+                source,
+                f"scale={output_cfg.resolution[0]}:{output_cfg.resolution[1]}",
+                "setsar=1",
+            )
+        ]
+
+        # Head video of the avatar this screencast belongs to (if provided)
+        avatar_idx = _parent_avatar_index(sc_entry, avatar_entries)
+        if head_videos and avatar_idx is not None and avatar_idx < len(head_videos):
+            if avatar_idx not in heads:
+                head = _clip_source(graph, head_videos[avatar_idx], avatar_entries[avatar_idx])
+                heads[avatar_idx] = graph.chain(head, f"scale={head_size}:{head_size}")
+            sources.append(heads[avatar_idx])
+
+        layers.append(
+            _Layer(
+                entry=sc_entry,
+                sources=sources,
+                compose=partial(_compose_fullscreen, pip_cfg.head_position, pip_cfg.head_margin),
+            )
         )
 
-        # Overlay fullscreen screencast on base
-        enable = f"between(t,{sc_entry.start:.2f},{sc_entry.end:.2f})"
-        filters.append(f"[{current_base}][psc{i}]overlay=0:0:enable='{enable}'[{next_base_sc}]")
-        current_base = next_base_sc
-
-        # Overlay head video in corner (if head videos provided)
-        if head_videos:
-            # Find which avatar this screencast belongs to
-            seg_id = sc_entry.parent_segment
-            avatar_idx = None
-            for ai, ae in enumerate(avatar_entries):
-                if ae.parent_segment == seg_id:
-                    avatar_idx = ai
-                    break
-
-            if avatar_idx is not None and avatar_idx < len(head_videos):
-                head_idx = head_input_offset + avatar_idx
-                next_base_head = f"pip_h{i}"
-
-                x, y = position_to_overlay_coords(
-                    pip_cfg.head_position, pip_cfg.head_margin, "w", "h"
-                )
-                filters.append(
-                    f"[{current_base}][{head_idx}:v]overlay=x={x}:y={y}:"
-                    f"enable='{enable}'[{next_base_head}]"
-                )
-                current_base = next_base_head
+    video = _build_partitioned_video(graph, base, layers, timeline.total_duration, output_cfg.fps)
 
     # Final output
-    return _finalize_filter(filters, current_base, config)
+    return _finalize_filter(graph, video, audio, config)
+
+
+def _seek_options(entry: TimelineEntry) -> List[str]:
+    """Input options reading only the part of a file an entry shows.
+
+    Empty unless entry.source_start is set (partial renders, see
+    clip_timeline); then the input seeks to it and is cut to the entry.
+    """
+    if entry.source_start is None:
+        return []
+    seek = ["-ss", f"{entry.source_start:.3f}"] if entry.source_start else []
+    return seek + ["-t", f"{entry.end - entry.start:.3f}"]
+
+
+def _avatar_input(graph: FilterGraph, entry: TimelineEntry) -> Input:
+    """Add an avatar clip input placed at entry.start."""
+    return graph.add_input(entry.file, _seek_options(entry), entry.start)
+
+
+def _screencast_source(graph: FilterGraph, entry: TimelineEntry) -> Pad:
+    """Add a screencast input, decoding only the part that is shown.
+
+    The input is cut to the entry's duration and its first frame is moved
+    to entry.start.
+    """
+    options = _seek_options(entry) or ["-t", f"{entry.end - entry.start:.3f}"]
+    inp = graph.add_input(entry.file, options, entry.start)
+    return graph.chain(inp.video, f"setpts=PTS-STARTPTS+{entry.start:.3f}/TB")
+
+
+def _clip_source(graph: FilterGraph, path: Path, avatar: TimelineEntry) -> Pad:
+    """Add a per-avatar clip (head/transparent video) placed at its segment start."""
+    inp = graph.add_input(path, _seek_options(avatar), avatar.start)
+    return graph.chain(inp.video, f"setpts=PTS-STARTPTS+{avatar.start:.3f}/TB")
+
+
+def _parent_avatar_index(
+    sc_entry: TimelineEntry, avatar_entries: List[TimelineEntry]
+) -> Optional[int]:
+    """Index of the avatar entry a screencast belongs to, or None."""
+    for ai, ae in enumerate(avatar_entries):
+        if ae.parent_segment == sc_entry.parent_segment:
+            return ai
+    return None
+
+
+@dataclass
+class _Layer:
+    """A screencast and the streams composited while it is shown.
+
+    sources are streams in timeline time. compose(graph, base, pieces,
+    tag) draws the sources, trimmed to one interval, onto base and returns
+    the resulting stream; tag keeps its labels unique.
+    """
+
+    entry: TimelineEntry
+    sources: List[Pad]
+    compose: Callable[[FilterGraph, Pad, List[Pad], str], Pad]
+
+
+def _compose_corner(
+    position: Position, margin: int, graph: FilterGraph, base: Pad, pieces: List[Pad], tag: str
+) -> Pad:
+    """Overlay a scaled screencast in a corner."""
+    x, y = position_to_overlay_coords(position, margin, "w", "h")
+    return graph.filter("overlay", f"x={x}:y={y}", [base, pieces[0]], label=f"ov{tag}")
+
+
+def _compose_fullscreen(
+    position: Position, margin: int, graph: FilterGraph, base: Pad, pieces: List[Pad], tag: str
+) -> Pad:
+    """Overlay a fullscreen screencast, then the optional avatar clip in a corner."""
+    video = graph.filter("overlay", "0:0", [base, pieces[0]], label=f"fs{tag}")
+    if len(pieces) < 2:
+        return video
+    x, y = position_to_overlay_coords(position, margin, "w", "h")
+    return graph.filter("overlay", f"x={x}:y={y}", [video, pieces[1]], label=f"fsa{tag}")
+
+
+def _compose_split(
+    avatar_side: str,
+    size: Tuple[int, int, int],
+    graph: FilterGraph,
+    base: Pad,
+    pieces: List[Pad],
+    tag: str,
+) -> Pad:
+    """Stack the avatar's side of base next to the screencast.
+
+    size is (output width, output height, avatar width); the stack covers
+    the whole frame, so no overlay onto base is needed.
+    """
+    w, h, avatar_w = size
+    if avatar_side == "left":
+        avatar = graph.chain(base, f"crop={avatar_w}:{h}:0:0", label=f"left{tag}")
+        stack = [avatar, pieces[0]]
+    else:
+        avatar = graph.chain(base, f"crop={avatar_w}:{h}:{w - avatar_w}:0", label=f"right{tag}")
+        stack = [pieces[0], avatar]
+    return graph.filter("hstack", "inputs=2", stack, label=f"hs{tag}")
+
+
+def _time_intervals(
+    layers: List[_Layer], total_duration: float, fps: int
+) -> List[Tuple[int, Optional[int], List[int]]]:
+    """Cut the timeline at layer boundaries, snapped to output frames.
+
+    Returns (first frame, end frame or None for the last interval, active
+    layer indices) per interval; adjacent intervals always differ in their
+    active layers.
+    """
+
+    def frame(t: float) -> int:
+        return round(t * fps)
+
+    total = frame(total_duration)
+    bounds = {0, total}
+    for layer in layers:
+        for f in (frame(layer.entry.start), frame(layer.entry.end)):
+            if 0 < f < total:
+                bounds.add(f)
+    points = sorted(bounds)
+
+    intervals: List[Tuple[int, Optional[int], List[int]]] = []
+    for f0, f1 in zip(points, points[1:]):
+        active = [
+            j
+            for j, layer in enumerate(layers)
+            if frame(layer.entry.start) <= f0 and frame(layer.entry.end) >= f1
+        ]
+        if intervals and intervals[-1][2] == active:
+            intervals[-1] = (intervals[-1][0], f1, active)
+        else:
+            intervals.append((f0, f1, active))
+    if intervals:
+        intervals[-1] = (intervals[-1][0], None, intervals[-1][2])
+    return intervals
+
+
+def _build_partitioned_video(
+    graph: FilterGraph, base: Pad, layers: List[_Layer], total_duration: float, fps: int
+) -> Pad:
+    """Composite layers onto base one time interval at a time.
+
+    The timeline is cut at every layer start and end. Each interval is
+    trimmed out of base, only the layers shown throughout it are drawn on
+    top, and the intervals are concatenated again. Filter cost thus
+    follows the number of visible layers, not the number of screencasts.
+
+    All streams are first converted to the output frame rate and cut
+    halfway between frames, so every interval holds whole frames and the
+    concatenation keeps A/V sync exactly.
+
+    Returns:
+        The composited video stream.
+    """
+    intervals = _time_intervals(layers, total_duration, fps)
+    if not any(active for _, _, active in intervals):
+        return base
+
+    # Streams read by several intervals are split by the serializer
+    base = graph.chain(base, f"fps={fps}", label="cfr")
+    used = {j for _, _, active in intervals for j in active}
+    sources = [
+        (
+            [
+                graph.chain(source, f"fps={fps}", label=f"sc{j}_{s}")
+                for s, source in enumerate(layer.sources)
+            ]
+            if j in used
+            else []
+        )
+        for j, layer in enumerate(layers)
+    ]
+
+    segments = []
+    for k, (f0, f1, active) in enumerate(intervals):
+        bounds = []
+        if f0:
+            bounds.append(f"start={(f0 - 0.5) / fps:.6f}")
+        if f1 is not None:
+            bounds.append(f"end={(f1 - 0.5) / fps:.6f}")
+        trim = f"trim={':'.join(bounds)}"
+
+        current = graph.chain(base, trim, "setpts=PTS-STARTPTS", label=f"seg{k}")
+        for j in active:
+            pieces = [
+                graph.chain(source, trim, "setpts=PTS-STARTPTS", label=f"sc{j}_{s}t{k}")
+                for s, source in enumerate(sources[j])
+            ]
+            current = layers[j].compose(graph, current, pieces, f"{k}_{j}")
+        segments.append(current)
+
+    if len(segments) == 1:
+        return segments[0]
+    return graph.filter("concat", f"n={len(segments)}:v=1:a=0", segments, label="layered")
+
+
+def _build_avatar_base(
+    graph: FilterGraph,
+    avatar_inputs: List[Input],
+    resolution: Tuple[int, int],
+    normalized: bool = False,
+) -> Pad:
+    """Scale avatar clips to the output resolution and concatenate into [base].
+
+    Normalized inputs (see ugckit.mezzanine) already match the output
+    geometry and are concatenated as-is.
+    """
+    w, h = resolution
+    if normalized:
+        clips = [inp.video for inp in avatar_inputs]
+    else:
+        clips = [
+            graph.chain(inp.video, f"scale={w}:{h}", "setsar=1", label=f"av{i}")
+            for i, inp in enumerate(avatar_inputs)
+        ]
+
+    if len(clips) > 1:
+        return graph.filter("concat", f"n={len(clips)}:v=1:a=0", clips, label="base")
+    return graph.filter("copy", inputs=clips, label="base")
 
 
 def _build_audio_pipeline(
-    filters: list,
+    graph: FilterGraph,
+    avatar_inputs: List[Input],
     avatar_entries: list,
     audio_presence: List[bool],
     timeline_total_duration: float,
-) -> None:
+    normalized: bool = False,
+) -> Pad:
     """Build audio concat pipeline (shared across all modes)."""
-    audio_labels = []
+    clips = []
+    resample = [] if normalized else ["aresample=48000"]
     for i, has_audio in enumerate(audio_presence):
-        label = f"a{i}"
         if has_audio:
-            filters.append(f"[{i}:a]aresample=48000,asetpts=PTS-STARTPTS[{label}]")
+            clip = graph.chain(
+                avatar_inputs[i].audio, *resample, "asetpts=PTS-STARTPTS", label=f"a{i}"
+            )
         else:
             duration = avatar_entries[i].end - avatar_entries[i].start
-            filters.append(
-                f"anullsrc=r=48000:cl=stereo,atrim=0:{duration:.2f},"
-                f"asetpts=PTS-STARTPTS[{label}]"
+            clip = graph.chain(
+                graph.filter("anullsrc", "r=48000:cl=stereo", kind="a"),
+                f"atrim=0:{duration:.2f}",
+                "asetpts=PTS-STARTPTS",
+                label=f"a{i}",
             )
-        audio_labels.append(f"[{label}]")
+        clips.append(clip)
+
+    if len(clips) > 1:
+        return graph.filter("concat", f"n={len(clips)}:v=0:a=1", clips, label="audio")
+    elif len(clips) == 1:
+        return graph.filter("anull", inputs=clips, label="audio")
+    silence = graph.filter("anullsrc", "r=48000:cl=stereo", kind="a")
+    return graph.chain(silence, f"atrim=0:{timeline_total_duration:.2f}", label="audio")
 
-    if len(audio_labels) > 1:
-        filters.append(f"{''.join(audio_labels)}concat=n={len(audio_labels)}:v=0:a=1[audio]")
-    elif len(audio_labels) == 1:
-        filters.append(f"{audio_labels[0]}anull[audio]")
-    else:
-        filters.append(f"anullsrc=r=48000:cl=stereo,atrim=0:{timeline_total_duration:.2f}[audio]")
 
+def _finalize_filter(graph: FilterGraph, video: Pad, audio: Pad, config: Config) -> FilterGraph:
+    """Finalize the graph with [vout] and the normalized [aout]."""
+    graph.set_output("vout", graph.filter("null", inputs=[video]))
+    _finalize_audio(graph, audio, config)
+    return graph
 
-def _finalize_filter(filters: list, current_base: str, config: Config) -> str:
-    """Finalize filter chain with video output and audio normalization."""
-    filters.append(f"[{current_base}]null[vout]")
+
+def _finalize_audio(graph: FilterGraph, audio: Pad, config: Config) -> None:
+    """Normalize the audio stream into [aout]."""
     if config.audio.normalize:
-        filters.append(f"[audio]loudnorm=I={config.audio.target_loudness}:TP=-1.5:LRA=11[aout]")
+        loudnorm = f"loudnorm=I={config.audio.target_loudness}:TP=-1.5:LRA=11"
+        graph.set_output("aout", graph.chain(audio, loudnorm))
     else:
-        filters.append("[audio]anull[aout]")
-    return ";".join(filters)
+        graph.set_output("aout", graph.filter("anull", inputs=[audio]))
 
 
 def build_ffmpeg_filter_split(
     timeline: Timeline,
     config: Config,
     audio_presence: Optional[List[bool]] = None,
-) -> str:
-    """Build FFmpeg filter_complex string for split screen mode.
+    normalized: bool = False,
+) -> FilterGraph:
+    """Build the filter graph for split screen mode.
 
     Avatar on one side, screencast on the other (50/50 by default).
     """
-    filters = []
+    graph = FilterGraph()
     output_cfg = config.output
     split_cfg = config.composition.split
 
@@ -494,51 +871,32 @@ def build_ffmpeg_filter_split(
     avatar_w = int(w * split_cfg.split_ratio)
     sc_w = w - avatar_w
 
-    # Scale avatars to output resolution
-    for i in range(len(avatar_entries)):
-        filters.append(f"[{i}:v]scale={w}:{h},setsar=1[av{i}]")
+    avatar_inputs = [_avatar_input(graph, e) for e in avatar_entries]
+    sc_sources = [_screencast_source(graph, e) for e in screencast_entries]
 
-    # Concatenate avatars
-    if len(avatar_entries) > 1:
-        concat_inputs = "".join(f"[av{i}]" for i in range(len(avatar_entries)))
-        filters.append(f"{concat_inputs}concat=n={len(avatar_entries)}:v=1:a=0[base]")
-    else:
-        filters.append("[av0]copy[base]")
+    # Scale avatars to output resolution and concatenate
+    base = _build_avatar_base(graph, avatar_inputs, (w, h), normalized)
 
     # Audio
-    _build_audio_pipeline(filters, avatar_entries, audio_presence, timeline.total_duration)
-
-    # Apply split screen overlays
-    current_base = "base"
-    sc_input_offset = len(avatar_entries)
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, audio_presence, timeline.total_duration, normalized
+    )
 
-    for i, sc_entry in enumerate(screencast_entries):
-        sc_idx = sc_input_offset + i
-        next_base = f"split_{i}"
-
-        # Split current base into two: one for crop, one for overlay
-        crop_label = f"{current_base}_crop{i}"
-        ov_label = f"{current_base}_ov{i}"
-        filters.append(f"[{current_base}]split=2[{crop_label}][{ov_label}]")
-
-        # Crop avatar to left/right portion and scale screencast to remaining
-        if split_cfg.avatar_side == "left":
-            filters.append(f"[{crop_label}]crop={avatar_w}:{h}:0:0[left_{i}]")
-            filters.append(f"[{sc_idx}:v]scale={sc_w}:{h},setsar=1[right_{i}]")
-            filters.append(f"[left_{i}][right_{i}]hstack=inputs=2[hs_{i}]")
-        else:
-            filters.append(f"[{crop_label}]crop={avatar_w}:{h}:{w - avatar_w}:0[right_{i}]")
-            filters.append(f"[{sc_idx}:v]scale={sc_w}:{h},setsar=1[left_{i}]")
-            filters.append(f"[left_{i}][right_{i}]hstack=inputs=2[hs_{i}]")
+    # Crop the avatar and stack it with the screencast only while one is shown
+    compose = partial(_compose_split, split_cfg.avatar_side, (w, h, avatar_w))
+    layers = [
+        _Layer(
+            entry=sc_entry,
+            sources=[graph.chain(sc_sources[i], f"scale={sc_w}:{h}", "setsar=1")],
+            compose=compose,
+        )
+        for i, sc_entry in enumerate(screencast_entries)
+    ]
 
-        # Overlay hstacked frame on base with timing
-        enable = f"between(t,{sc_entry.start:.2f},{sc_entry.end:.2f})"
-        filters.append(f"[{ov_label}][hs_{i}]overlay=0:0:enable='{enable}'[{next_base}]")
-        current_base = next_base
+    video = _build_partitioned_video(graph, base, layers, timeline.total_duration, output_cfg.fps)
 
     # Final output
-    final_base = current_base if screencast_entries else "base"
-    return _finalize_filter(filters, final_base, config)
+    return _finalize_filter(graph, video, audio, config)
 
 
 def build_ffmpeg_filter_greenscreen(
@@ -546,12 +904,13 @@ def build_ffmpeg_filter_greenscreen(
     config: Config,
     audio_presence: Optional[List[bool]] = None,
     transparent_avatars: Optional[List[Path]] = None,
-) -> str:
-    """Build FFmpeg filter_complex string for green screen mode.
+    normalized: bool = False,
+) -> FilterGraph:
+    """Build the filter graph for green screen mode.
 
     Screencast as fullscreen background, transparent avatar overlay.
     """
-    filters = []
+    graph = FilterGraph()
     output_cfg = config.output
     gs_cfg = config.composition.greenscreen
 
@@ -563,117 +922,108 @@ def build_ffmpeg_filter_greenscreen(
         raise ValueError("audio_presence length must match avatar entries")
 
     w, h = output_cfg.resolution
-    num_avatars = len(avatar_entries)
-    num_screencasts = len(screencast_entries)
-    # Input layout: avatars, screencasts, transparent_avatars
-    ta_input_offset = num_avatars + num_screencasts
+    # Inputs: avatars, screencasts, then transparent avatars as used
+    avatar_inputs = [_avatar_input(graph, e) for e in avatar_entries]
+    sc_sources = [_screencast_source(graph, e) for e in screencast_entries]
 
     # Scale avatars to output resolution (used when no screencast active)
-    for i in range(num_avatars):
-        filters.append(f"[{i}:v]scale={w}:{h},setsar=1[av{i}]")
-
-    # Concatenate avatars
-    if num_avatars > 1:
-        concat_inputs = "".join(f"[av{i}]" for i in range(num_avatars))
-        filters.append(f"{concat_inputs}concat=n={num_avatars}:v=1:a=0[base]")
-    else:
-        filters.append("[av0]copy[base]")
+    base = _build_avatar_base(graph, avatar_inputs, (w, h), normalized)
 
     # Audio
-    _build_audio_pipeline(filters, avatar_entries, audio_presence, timeline.total_duration)
-
-    current_base = "base"
+    audio = _build_audio_pipeline(
+        graph, avatar_inputs, avatar_entries, audio_presence, timeline.total_duration, normalized
+    )
 
+    avatar_w = int(w * gs_cfg.avatar_scale)
+    cutouts: Dict[int, Pad] = {}
+    layers = []
     for i, sc_entry in enumerate(screencast_entries):
-        sc_idx = num_avatars + i
-        enable = f"between(t,{sc_entry.start:.2f},{sc_entry.end:.2f})"
-
         # Fullscreen screencast as background
-        filters.append(f"[{sc_idx}:v]scale={w}:{h},setsar=1[bg_{i}]")
-        next_base_sc = f"sc_base_{i}"
-        filters.append(f"[{current_base}][bg_{i}]overlay=0:0:enable='{enable}'[{next_base_sc}]")
-        current_base = next_base_sc
-
-        # Overlay transparent avatar
-        if transparent_avatars:
-            seg_id = sc_entry.parent_segment
-            avatar_idx = None
-            for ai, ae in enumerate(avatar_entries):
-                if ae.parent_segment == seg_id:
-                    avatar_idx = ai
-                    break
-
-            if avatar_idx is not None and avatar_idx < len(transparent_avatars):
-                ta_idx = ta_input_offset + avatar_idx
-                avatar_w = int(w * gs_cfg.avatar_scale)
-
-                x, y = position_to_overlay_coords(
-                    gs_cfg.avatar_position, gs_cfg.avatar_margin, "w", "h"
-                )
-                next_base_ta = f"gs_{i}"
-                filters.append(f"[{ta_idx}:v]scale={avatar_w}:-1[ta_{i}]")
-                filters.append(
-                    f"[{current_base}][ta_{i}]overlay=x={x}:y={y}:"
-                    f"enable='{enable}'[{next_base_ta}]"
+        sources = [graph.chain(sc_sources[i], f"scale={w}:{h}", "setsar=1")]
+
+        # Transparent avatar of the segment on top
+        avatar_idx = _parent_avatar_index(sc_entry, avatar_entries)
+        if transparent_avatars and avatar_idx is not None and avatar_idx < len(transparent_avatars):
+            if avatar_idx not in cutouts:
+                clip = _clip_source(
+                    graph, transparent_avatars[avatar_idx], avatar_entries[avatar_idx]
                 )
-                current_base = next_base_ta
+                cutouts[avatar_idx] = graph.chain(clip, f"scale={avatar_w}:-1")
+            sources.append(cutouts[avatar_idx])
+
+        layers.append(
+            _Layer(
+                entry=sc_entry,
+                sources=sources,
+                compose=partial(_compose_fullscreen, gs_cfg.avatar_position, gs_cfg.avatar_margin),
+            )
+        )
+
+    video = _build_partitioned_video(graph, base, layers, timeline.total_duration, output_cfg.fps)
 
     # Final output
-    return _finalize_filter(filters, current_base, config)
+    return _finalize_filter(graph, video, audio, config)
 
 
 def wrap_with_post_processing(
-    filter_complex: str,
+    graph: FilterGraph,
     subtitle_file: Optional[Path] = None,
-    music_input_index: Optional[int] = None,
+    music_file: Optional[Path] = None,
     music_config: Optional[MusicConfig] = None,
     total_duration: float = 0.0,
-) -> str:
-    """Wrap a filter_complex with subtitle and music post-processing.
-
-    Renames [vout]/[aout] to intermediate labels, then applies subtitle
-    overlay and/or music mixing as needed.
+    subtitle_offset: float = 0.0,
+    music_offset: float = 0.0,
+    full_duration: Optional[float] = None,
+) -> FilterGraph:
+    """Add subtitle and music post-processing to a graph's outputs.
+
+    Burns subtitles into [vout] and/or mixes music (added as a new input)
+    into [aout] as needed. subtitle_offset is the position of this graph's
+    t=0 in the subtitle timeline (for partial renders). Likewise music
+    starts music_offset seconds into the track and fades out at the end of
+    full_duration (default: total_duration + music_offset).
     """
-    has_subs = subtitle_file is not None
-    has_music = music_input_index is not None and music_config is not None
-
-    if not has_subs and not has_music:
-        return filter_complex
-
-    parts = filter_complex
-
-    if has_subs:
-        # Rename [vout] -> [vout_pre], apply ASS subtitles -> [vout]
-        parts = parts.replace("[vout]", "[vout_pre]", 1)
+    if subtitle_file is not None:
         # Escape path for ASS filter (colons, backslashes)
         ass_path = str(subtitle_file).replace("\\", "\\\\").replace(":", "\\:")
-        parts += f";[vout_pre]ass='{ass_path}'[vout]"
+        ass = f"ass='{ass_path}'"
+        video = graph.outputs["vout"]
+        if subtitle_offset:
+            video = graph.chain(
+                video, f"setpts=PTS+{subtitle_offset:.3f}/TB", ass, "setpts=PTS-STARTPTS"
+            )
+        else:
+            video = graph.chain(video, ass)
+        graph.set_output("vout", video)
 
-    if has_music:
-        # Rename [aout] -> [aout_pre], mix with music -> [aout]
-        parts = parts.replace("[aout]", "[aout_pre]", 1)
+    if music_file is not None and music_config is not None:
         dur = total_duration
+        full = total_duration + music_offset if full_duration is None else full_duration
         fade_dur = music_config.fade_out_duration
-        fade_start = max(0.0, dur - fade_dur)
+        fade_start = max(0.0, full - fade_dur) - music_offset
+        if fade_start < 0:
+            # Range starts inside the fade: fade out over what is left of it
+            fade_dur = max(0.0, fade_dur + fade_start)
+            fade_start = 0.0
         vol = music_config.volume
 
-        if music_config.loop:
-            parts += (
-                f";[{music_input_index}:a]aloop=loop=-1:size=2e+09,"
-                f"atrim=0:{dur:.2f},asetpts=PTS-STARTPTS[music_loop]"
-            )
-        else:
-            parts += (
-                f";[{music_input_index}:a]atrim=0:{dur:.2f}," f"asetpts=PTS-STARTPTS[music_loop]"
-            )
-
-        parts += (
-            f";[music_loop]afade=t=out:st={fade_start:.2f}:d={fade_dur:.2f}[music_faded]"
-            f";[aout_pre][music_faded]amix=inputs=2:duration=first:"
-            f"weights=1 {vol:.2f}[aout]"
+        # Loop by re-reading the file (-stream_loop) rather than aloop, which
+        # buffers every sample of the track in memory
+        loop = ["-stream_loop", "-1"] if music_config.loop else []
+        seek = ["-ss", f"{music_offset:.3f}"] if music_offset else []
+        music = graph.add_input(Path(music_file), loop + seek).audio
+        music = graph.chain(music, f"atrim=0:{dur:.2f}", "asetpts=PTS-STARTPTS", label="music_loop")
+        music = graph.chain(
+            music, f"afade=t=out:st={fade_start:.2f}:d={fade_dur:.2f}", label="music_faded"
         )
+        mixed = graph.filter(
+            "amix",
+            f"inputs=2:duration=first:weights=1 {vol:.2f}",
+            [graph.outputs["aout"], music],
+        )
+        graph.set_output("aout", mixed)
 
-    return parts
+    return graph
 
 
 def _detect_composition_mode(timeline: Timeline) -> CompositionMode:
@@ -686,17 +1036,86 @@ def _detect_composition_mode(timeline: Timeline) -> CompositionMode:
 
 
 _FILTER_BUILDERS = {
-    CompositionMode.OVERLAY: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_overlay(tl, cfg, ap),
+    CompositionMode.OVERLAY: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_overlay(
+        tl, cfg, ap, normalized=kw.get("normalized", False)
+    ),
     CompositionMode.PIP: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_pip(
-        tl, cfg, ap, kw.get("head_videos")
+        tl, cfg, ap, kw.get("head_videos"), normalized=kw.get("normalized", False)
+    ),
+    CompositionMode.SPLIT: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_split(
+        tl, cfg, ap, normalized=kw.get("normalized", False)
     ),
-    CompositionMode.SPLIT: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_split(tl, cfg, ap),
     CompositionMode.GREENSCREEN: lambda tl, cfg, ap, **kw: build_ffmpeg_filter_greenscreen(
-        tl, cfg, ap, kw.get("transparent_avatars")
+        tl, cfg, ap, kw.get("transparent_avatars"), normalized=kw.get("normalized", False)
     ),
 }
 
 
+def clip_timeline(timeline: Timeline, start: float, end: Optional[float] = None) -> Timeline:
+    """Cut a timeline down to the time range [start, end).
+
+    Only entries overlapping the range are kept, shifted so the range
+    starts at 0. Each one seeks into its file (source_start) past the part
+    cut off, so rendering the result decodes only the range. offset and
+    full_duration keep subtitles and music aligned with the full render.
+
+    Args:
+        timeline: Composition timeline.
+        start: Range start in seconds.
+        end: Range end in seconds (default: end of the timeline).
+
+    Returns:
+        Timeline of the range.
+
+    Raises:
+        ValueError: If the range is empty or outside the timeline.
+    """
+    end = timeline.total_duration if end is None else min(end, timeline.total_duration)
+    if start < 0 or end <= start:
+        raise ValueError(f"Invalid time range {start:.2f}-{end:.2f}")
+
+    entries = []
+    for entry in timeline.entries:
+        if entry.end <= start or entry.start >= end:
+            continue
+        cut = max(0.0, start - entry.start)
+        entries.append(
+            entry.model_copy(
+                update={
+                    "start": max(entry.start, start) - start,
+                    "end": min(entry.end, end) - start,
+                    "source_start": (entry.source_start or 0.0) + cut,
+                }
+            )
+        )
+    return timeline.model_copy(
+        update={
+            "entries": entries,
+            "total_duration": end - start,
+            "offset": timeline.offset + start,
+            "full_duration": timeline.full_duration or timeline.total_duration + timeline.offset,
+        }
+    )
+
+
+def _clip_inputs(
+    timeline: Timeline,
+    start: float,
+    end: float,
+    head_videos: Optional[List[Path]],
+    transparent_avatars: Optional[List[Path]],
+) -> Tuple[Timeline, Optional[List[Path]], Optional[List[Path]]]:
+    """clip_timeline, keeping the per-avatar input lists aligned with the avatars left."""
+    avatars = [e for e in timeline.entries if e.type == "avatar"]
+    kept = [i for i, e in enumerate(avatars) if e.end > start and e.start < end]
+    timeline = clip_timeline(timeline, start, end)
+    if head_videos:
+        head_videos = [head_videos[i] for i in kept if i < len(head_videos)]
+    if transparent_avatars:
+        transparent_avatars = [transparent_avatars[i] for i in kept if i < len(transparent_avatars)]
+    return timeline, head_videos, transparent_avatars
+
+
 def validate_timeline_files(timeline: Timeline) -> None:
     """Validate all files in timeline exist.
 
@@ -723,10 +1142,31 @@ def compose_video(
     transparent_avatars: Optional[List[Path]] = None,
     subtitle_file: Optional[Path] = None,
     music_file: Optional[Path] = None,
-) -> Union[Path, List[str]]:
+    progress_callback: Optional[Callable[[float], None]] = None,
+    time_range: Optional[Tuple[float, float]] = None,
+    sink: Optional[StreamSink] = None,
+) -> Union[Path, List[str], None]:
     """Compose final video from timeline.
 
-    Automatically selects filter builder based on timeline entries.
+    Automatically selects filter builder based on timeline entries. With
+    ``config.render.chunked`` or ``config.render.jobs > 1`` the render is
+    split per segment (see ugckit.chunked); dry runs always show the
+    single-pass command. With ``config.cache.enabled`` an identical earlier
+    render is hardlinked or copied to the output path instead of re-encoding.
+    With ``config.audio.separate_track`` the audio track is rendered as its
+    own cached stage and muxed in by stream copy (see ugckit.audio). With ``config.mezzanine.enabled``
+    inputs are first replaced by cached normalized intermediates (see
+    ugckit.mezzanine). Each of ``config.output.renditions`` is encoded from
+    the same composite in the same FFmpeg process and written next to the
+    output (see rendition_paths). With ``config.preview.enabled`` the same
+    graph renders at the preview size and frame rate from cached low-res
+    proxies of the inputs (see ugckit.preview). With ``time_range`` only
+    that part of the timeline is rendered (see clip_timeline). With
+    ``config.output.progressive`` a single-pass render is written as
+    fragmented MP4 or HLS to progressive_path, playable while encoding,
+    then remuxed to the faststart output and removed. With ``sink`` the
+    video is not written to disk but streamed to it as fragmented MP4 (see
+    stream_ffmpeg); a cached identical render is streamed from the cache.
 
     Args:
         timeline: Composition timeline.
@@ -736,107 +1176,932 @@ def compose_video(
         transparent_avatars: Transparent avatar videos for green screen mode.
         subtitle_file: ASS subtitle file for overlay.
         music_file: Background music file path.
+        progress_callback: Called with render progress in [0, 1].
+        time_range: (start, end) in seconds of the part to render.
+        sink: Callable receiving the video bytes, binary file object or file
+            descriptor to stream the video to instead of output_path.
 
     Returns:
-        Path to output video, or command list if dry_run.
+        Path to output video, command list if dry_run, or None if streamed
+        to sink.
 
     Raises:
-        ValueError: If timeline has no output_path.
+        ValueError: If timeline has no output_path (and no sink) or
+            time_range is empty.
         FFmpegError: If files are missing or FFmpeg fails.
     """
+    if sink is not None:
+        return _compose_video_stream(
+            timeline,
+            config,
+            sink,
+            dry_run,
+            head_videos,
+            transparent_avatars,
+            subtitle_file,
+            music_file,
+            progress_callback,
+            time_range,
+        )
     if not timeline.output_path:
         raise ValueError("Timeline must have output_path set")
 
+    if time_range is not None:
+        timeline, head_videos, transparent_avatars = _clip_inputs(
+            timeline, *time_range, head_videos, transparent_avatars
+        )
+
+    if config.preview.enabled:
+        from ugckit.preview import preview_config
+
+        config = preview_config(config)
+
+    if dry_run or not config.cache.enabled:
+        return _compose_video_uncached(
+            timeline,
+            config,
+            dry_run,
+            head_videos,
+            transparent_avatars,
+            subtitle_file,
+            music_file,
+            progress_callback,
+        )
+
     validate_timeline_files(timeline)
+    effective_music = music_file or (config.music.file if config.music.enabled else None)
+    key = render_cache_key(
+        timeline,
+        config,
+        head_videos=head_videos,
+        transparent_avatars=transparent_avatars,
+        subtitle_file=subtitle_file,
+        music_file=Path(effective_music) if effective_music else None,
+    )
+    # Renditions are cached alongside the main output, under derived keys
+    outputs = {key: timeline.output_path}
+    for rendition, path in zip(
+        config.output.renditions, rendition_paths(timeline.output_path, config)
+    ):
+        outputs[hash_payload([key, rendition.name])] = path
+    cache = output_cache(config)
+    if all(cache.fetch(k, path) for k, path in outputs.items()):
+        if progress_callback:
+            progress_callback(1.0)
+        return timeline.output_path
+
+    result = _compose_video_uncached(
+        timeline,
+        config,
+        False,
+        head_videos,
+        transparent_avatars,
+        subtitle_file,
+        music_file,
+        progress_callback,
+    )
+    for k, path in outputs.items():
+        cache.store(k, path)
+    return result
+
+
+def _compose_video_stream(
+    timeline: Timeline,
+    config: Config,
+    sink: StreamSink,
+    dry_run: bool,
+    head_videos: Optional[List[Path]],
+    transparent_avatars: Optional[List[Path]],
+    subtitle_file: Optional[Path],
+    music_file: Optional[Path],
+    progress_callback: Optional[Callable[[float], None]],
+    time_range: Optional[Tuple[float, float]],
+) -> Optional[List[str]]:
+    """Render timeline to sink as fragmented MP4; see compose_video.
+
+    Always a single pass with no renditions or progressive copy, since
+    nothing is written next to an output file.
+    """
+    # Cache keys and probing see a regular .mp4 target
+    timeline = timeline.model_copy(update={"output_path": Path("stream.mp4")})
+    if time_range is not None:
+        timeline, head_videos, transparent_avatars = _clip_inputs(
+            timeline, *time_range, head_videos, transparent_avatars
+        )
+    if config.preview.enabled:
+        from ugckit.preview import preview_config
+
+        config = preview_config(config)
+    config = config.model_copy(deep=True)
+    config.output.renditions = []
+    config.output.progressive = None
+    config.render.chunked = False
+    config.render.jobs = 1
+
+    if isinstance(sink, int):
+        sink = os.fdopen(sink, "wb", closefd=False)
+    write = getattr(sink, "write", sink)
+    try:
+        return _stream_render(
+            timeline,
+            config,
+            write,
+            dry_run,
+            head_videos,
+            transparent_avatars,
+            subtitle_file,
+            music_file,
+            progress_callback,
+        )
+    finally:
+        if hasattr(sink, "flush"):
+            sink.flush()
 
-    avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
-    screencast_entries = [e for e in timeline.entries if e.type == "screencast"]
 
-    inputs = []
-    audio_presence = []
-    for entry in avatar_entries:
-        inputs.extend(["-i", str(entry.file)])
-        audio_presence.append(has_audio_stream(entry.file))
-    for entry in screencast_entries:
-        inputs.extend(["-i", str(entry.file)])
+def _stream_render(
+    timeline: Timeline,
+    config: Config,
+    write: Callable[[bytes], object],
+    dry_run: bool,
+    head_videos: Optional[List[Path]],
+    transparent_avatars: Optional[List[Path]],
+    subtitle_file: Optional[Path],
+    music_file: Optional[Path],
+    progress_callback: Optional[Callable[[float], None]],
+) -> Optional[List[str]]:
+    """Serve a streamed render from the output cache or FFmpeg."""
+    if config.cache.enabled and not dry_run:
+        validate_timeline_files(timeline)
+        effective_music = music_file or (config.music.file if config.music.enabled else None)
+        key = render_cache_key(
+            timeline,
+            config,
+            head_videos=head_videos,
+            transparent_avatars=transparent_avatars,
+            subtitle_file=subtitle_file,
+            music_file=Path(effective_music) if effective_music else None,
+        )
+        entry = output_cache(config).lookup(key)
+        if entry is not None:
+            with open(entry, "rb") as f:
+                while chunk := f.read(STREAM_CHUNK_SIZE):
+                    write(chunk)
+            if progress_callback:
+                progress_callback(1.0)
+            return None
+
+    result = _compose_video_uncached(
+        timeline,
+        config,
+        dry_run,
+        head_videos,
+        transparent_avatars,
+        subtitle_file,
+        music_file,
+        progress_callback,
+        sink=write,
+    )
+    return result if dry_run else None
+
+
+def output_cache(config: Config) -> FileCache:
+    """Cache of rendered outputs configured by config.cache."""
+    return FileCache("outputs", config.cache.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_version() -> str:
+    """First line of ``ffmpeg -version``, or "unknown" if FFmpeg cannot run."""
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return "unknown"
+    lines = result.stdout.splitlines()
+    return lines[0] if result.returncode == 0 and lines else "unknown"
+
+
+def renders_chunked(config: Config) -> bool:
+    """Whether compose_video splits the render per segment (see ugckit.chunked)."""
+    return config.render.chunked or config.render.jobs > 1
+
+
+# Config settings that never change the rendered file: parallelism, the
+# watchdog, cache sizes and locations, and input/output directories. Whether
+# the render is chunked does change it and is keyed as renders_chunked.
+_RUNTIME_ONLY_CONFIG = {
+    "cache": True,
+    "render": {"chunked", "work_dir", "jobs", "threads", "shared_decode_mb", "stall_timeout"},
+    "mezzanine": {"max_size_mb"},
+    "variants": {"max_size_mb"},
+    "preview": {"max_size_mb"},
+    "screencasts_path": True,
+    "output_path": True,
+}
+
+
+def render_cache_key(
+    timeline: Timeline,
+    config: Config,
+    head_videos: Optional[List[Path]] = None,
+    transparent_avatars: Optional[List[Path]] = None,
+    subtitle_file: Optional[Path] = None,
+    music_file: Optional[Path] = None,
+) -> str:
+    """Content-addressed key for a render's output.
+
+    Covers the timeline (with input files identified by content hash, not
+    path), every config setting that affects the output (not parallelism,
+    timeouts or cache settings), whether the render is chunked, every
+    auxiliary input and the FFmpeg and UGCKit versions.
+
+    Raises:
+        OSError: If an input file cannot be read.
+    """
+
+    def hashes(paths: Optional[List[Path]]) -> Optional[List[str]]:
+        return [file_hash(Path(p)) for p in paths] if paths else None
+
+    entries = timeline.model_dump(mode="json", exclude={"output_path"})
+    for entry, source in zip(entries["entries"], timeline.entries):
+        entry["file"] = file_hash(source.file)
+
+    return hash_payload(
+        {
+            "version": __version__,
+            "ffmpeg": ffmpeg_version(),
+            "timeline": entries,
+            "container": timeline.output_path.suffix.lower() if timeline.output_path else None,
+            "config": config.model_dump(mode="json", exclude=_RUNTIME_ONLY_CONFIG),
+            "chunked": renders_chunked(config),
+            "head_videos": hashes(head_videos),
+            "transparent_avatars": hashes(transparent_avatars),
+            "subtitles": file_hash(subtitle_file) if subtitle_file else None,
+            "music": file_hash(music_file) if music_file else None,
+        }
+    )
+
+
+def _compose_video_uncached(
+    timeline: Timeline,
+    config: Config,
+    dry_run: bool,
+    head_videos: Optional[List[Path]],
+    transparent_avatars: Optional[List[Path]],
+    subtitle_file: Optional[Path],
+    music_file: Optional[Path],
+    progress_callback: Optional[Callable[[float], None]],
+    sink: Optional[Callable[[bytes], object]] = None,
+) -> Union[Path, List[str]]:
+    """Build and (unless dry_run) run the render; see compose_video.
+
+    With sink the video is streamed to it instead of written to disk.
+    """
+    # A previous cache hit leaves the output hardlinked to a cache entry;
+    # unlink it so FFmpeg's in-place overwrite cannot corrupt the entry.
+    if not dry_run and sink is None:
+        for path in [timeline.output_path] + rendition_paths(timeline.output_path, config):
+            path.unlink(missing_ok=True)
+
+    # Swap inputs for cached normalized mezzanines or preview proxies
+    # (renders only; dry runs show the command for the original files)
+    normalized = (config.mezzanine.enabled or config.preview.enabled) and not dry_run
+    if normalized:
+        validate_timeline_files(timeline)
+        if config.preview.enabled:
+            from ugckit.preview import prepare_proxies
+
+            timeline = prepare_proxies(timeline, config)
+        else:
+            from ugckit.mezzanine import prepare_mezzanines
+
+            timeline = prepare_mezzanines(timeline, config)
+
+    if renders_chunked(config) and not dry_run:
+        from ugckit.chunked import compose_video_chunked
+
+        return compose_video_chunked(
+            timeline,
+            config,
+            head_videos=head_videos,
+            transparent_avatars=transparent_avatars,
+            subtitle_file=subtitle_file,
+            music_file=music_file,
+            progress_callback=progress_callback,
+            normalized=normalized,
+        )
+
+    validate_timeline_files(timeline)
+
+    avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
 
     mode = _detect_composition_mode(timeline)
+    effective_music = music_file or (config.music.file if config.music.enabled else None)
 
-    # Add extra inputs per mode
+    # Probe every input concurrently before assembling the command
+    extra_videos = []
     if mode == CompositionMode.PIP and head_videos:
-        for hv in head_videos:
-            inputs.extend(["-i", str(hv)])
+        extra_videos = head_videos
     elif mode == CompositionMode.GREENSCREEN and transparent_avatars:
-        for ta in transparent_avatars:
-            inputs.extend(["-i", str(ta)])
+        extra_videos = transparent_avatars
+    inputs = [e.file for e in timeline.entries] + list(extra_videos)
+    music = [Path(effective_music)] if effective_music else []
+    try:
+        media = probe_many(inputs + music)
+    except FFmpegError:
+        # A dry run only shows the command, so music that is not readable
+        # yet (e.g. a placeholder) is tolerated; the other inputs are not
+        if not (dry_run and music):
+            raise
+        media = probe_many(inputs)
 
-    # Music input
-    music_input_index = None
-    effective_music = music_file or (config.music.file if config.music.enabled else None)
-    if effective_music:
-        music_input_index = len(inputs) // 2  # count of -i pairs
-        inputs.extend(["-i", str(effective_music)])
+    audio_presence = [media[entry.file].has_audio for entry in avatar_entries]
 
-    # Build filter complex
+    # Build filter graph
     builder = _FILTER_BUILDERS[mode]
-    filter_complex = builder(
+    graph = builder(
         timeline,
         config,
         audio_presence,
         head_videos=head_videos,
         transparent_avatars=transparent_avatars,
+        normalized=normalized,
     )
 
+    # Render audio as a separate cached stage and mux it in by stream copy
+    # (renders only), so video-only changes do no audio work
+    audio_file = None
+    if config.audio.separate_track and not dry_run:
+        from ugckit.audio import render_audio
+
+        music = Path(effective_music) if effective_music else None
+        audio_file = render_audio(timeline, config, media, music, normalized)
+        del graph.outputs["aout"]
+        effective_music = None
+
     # Post-processing: subtitles + music
-    filter_complex = wrap_with_post_processing(
-        filter_complex,
+    wrap_with_post_processing(
+        graph,
         subtitle_file=subtitle_file,
-        music_input_index=music_input_index,
+        music_file=effective_music,
         music_config=config.music if effective_music else None,
         total_duration=timeline.total_duration,
+        subtitle_offset=timeline.offset,
+        music_offset=timeline.offset,
+        full_duration=timeline.full_duration,
     )
 
+    # Read screencasts from cached pre-scaled variants (renders only)
+    if config.variants.enabled and not dry_run:
+        from ugckit.mezzanine import use_screencast_variants
+
+        screencasts = [e.file for e in timeline.entries if e.type == "screencast"]
+        media.update(probe_many(use_screencast_variants(graph, screencasts, config)))
+
+    # Replace dynamic loudnorm with a gain from measured clip loudness (renders only)
+    if config.audio.normalize and config.audio.two_pass and audio_file is None and not dry_run:
+        from ugckit.loudness import apply_gain, timeline_gain
+
+        gain = timeline_gain(timeline, media, config)
+        if gain is not None:
+            apply_gain(graph, gain)
+    optimize(graph, media, config.render.shared_decode_mb)
+
+    input_args = graph.input_args()
+    if audio_file is not None:
+        audio: Union[Pad, str] = f"{len(graph.inputs)}:a"
+        input_args += ["-i", str(audio_file)]
+        audio_args = ["-map", "[vout]", "-map", audio, "-c:a", "copy"]
+    else:
+        audio = graph.outputs["aout"]
+        audio_args = ["-map", "[vout]", "-map", "[aout]"] + _audio_encode_args(config)
+    if sink is not None:
+        target = _fragmented_mp4_args(config) + ["-y", "pipe:1"]
+    else:
+        target = _main_output_args(timeline.output_path, config)
+    output_args = audio_args + _video_encode_args(config) + target
+    # Extra renditions encode from the same composite in this process
+    output_args += _rendition_outputs(
+        graph, graph.outputs["vout"], audio, timeline.output_path, config
+    )
+
+    cmd = ["ffmpeg"] + input_args + ["-filter_complex", graph.to_string()] + output_args
+
+    if dry_run:
+        return cmd
+    stall_timeout = config.render.stall_timeout
+    if sink is not None:
+        stream_ffmpeg(
+            cmd, sink, timeline.total_duration, progress_callback, stall_timeout=stall_timeout
+        )
+        return timeline.output_path
+
+    timeline.output_path.parent.mkdir(parents=True, exist_ok=True)
+    live = progressive_path(timeline.output_path, config)
+    if live is None:
+        run_ffmpeg(cmd, timeline.total_duration, progress_callback, stall_timeout)
+        return timeline.output_path
+
+    _remove_progressive(live, config)
+    live.parent.mkdir(parents=True, exist_ok=True)
+    run_ffmpeg(cmd, timeline.total_duration, progress_callback, stall_timeout)
+    remux = build_remux_cmd(live, timeline.output_path)
+    run_ffmpeg(remux, timeline.total_duration, stall_timeout=stall_timeout)
+    _remove_progressive(live, config)
+    return timeline.output_path
+
+
+def _video_encode_args(config: Config, rendition: Optional[RenditionConfig] = None) -> List[str]:
+    """Video encoder arguments shared by every render path.
+
+    A rendition's own codec, preset and CRF override the output's.
+    """
     output_cfg = config.output
-    output_args = [
-        "-map",
-        "[vout]",
-        "-map",
-        "[aout]",
+    crf = output_cfg.crf if rendition is None or rendition.crf is None else rendition.crf
+    return [
         "-c:v",
-        output_cfg.codec,
+        (rendition and rendition.codec) or output_cfg.codec,
         "-preset",
-        output_cfg.preset,
+        (rendition and rendition.preset) or output_cfg.preset,
         "-crf",
-        str(output_cfg.crf),
+        str(crf),
         "-pix_fmt",
         "yuv420p",
         "-r",
         str(output_cfg.fps),
-        "-c:a",
-        config.audio.codec,
-        "-b:a",
-        config.audio.bitrate,
+    ]
+
+
+def rendition_paths(output_path: Path, config: Config) -> List[Path]:
+    """Files the configured output renditions are written to, next to output_path."""
+    return [
+        output_path.with_name(f"{output_path.stem}_{r.name}.{r.format}")
+        for r in config.output.renditions
+    ]
+
+
+def _rendition_outputs(
+    graph: FilterGraph,
+    video: Pad,
+    audio: Union[Pad, str],
+    output_path: Path,
+    config: Config,
+) -> List[str]:
+    """Add an output per rendition to graph and return their output options.
+
+    Every rendition reads the final video pad, which the serializer splits
+    once, so all of them share a single decode and composite. audio is
+    either the final audio pad (encoded per rendition) or an input stream
+    specifier such as "2:a" to stream-copy. Image renditions get a single
+    frame at their poster_time.
+    """
+    args: List[str] = []
+    for rendition, path in zip(config.output.renditions, rendition_paths(output_path, config)):
+        out = video
+        if rendition.is_image:
+            out = graph.chain(out, f"trim=start={rendition.poster_time:.3f}")
+        size = rendition.resolution
+        if size is not None and tuple(size) != tuple(config.output.resolution):
+            out = graph.chain(out, f"scale={size[0]}:{size[1]}", "setsar=1")
+        graph.set_output(f"vout_{rendition.name}", out)
+        args += ["-map", f"[vout_{rendition.name}]"]
+
+        if rendition.is_image:
+            args += ["-frames:v", "1", "-update", "1", "-y", str(path)]
+            continue
+        if isinstance(audio, Pad):
+            graph.set_output(f"aout_{rendition.name}", audio)
+            args += ["-map", f"[aout_{rendition.name}]"] + _audio_encode_args(config)
+        else:
+            args += ["-map", audio, "-c:a", "copy"]
+        args += _video_encode_args(config, rendition)
+        args += ["-movflags", "+faststart", "-y", str(path)]
+    return args
+
+
+def build_renditions_cmd(source: Path, output_path: Path, config: Config) -> List[str]:
+    """Build one FFmpeg pass encoding every output rendition from a rendered file.
+
+    Used when the composite is not available as a filter graph (chunked
+    renders); the source's audio is stream-copied.
+    """
+    graph = FilterGraph()
+    inp = graph.add_input(source)
+    args = _rendition_outputs(graph, inp.video, "0:a", output_path, config)
+    optimize(graph)
+    return ["ffmpeg"] + graph.input_args() + ["-filter_complex", graph.to_string()] + args
+
+
+def progressive_path(output_path: Path, config: Config) -> Optional[Path]:
+    """File a progressive render of output_path can be read from while encoding.
+
+    <stem>_live.mp4 (fragmented MP4) or <stem>_hls/index.m3u8 (HLS event
+    playlist) next to the output, or None unless config.output.progressive
+    is set.
+    """
+    mode = config.output.progressive
+    if mode == "fmp4":
+        return output_path.with_name(f"{output_path.stem}_live.mp4")
+    if mode == "hls":
+        return output_path.with_name(f"{output_path.stem}_hls") / "index.m3u8"
+    return None
+
+
+def _main_output_args(output_path: Path, config: Config) -> List[str]:
+    """Muxer options and target of a render's main output.
+
+    Normally a faststart MP4 at output_path. A progressive render writes
+    to progressive_path instead, with keyframes forced every
+    fragment_seconds so fragments (HLS segments) are complete, and is
+    remuxed to output_path afterwards (see build_remux_cmd).
+    """
+    live = progressive_path(output_path, config)
+    if live is None:
+        return ["-movflags", "+faststart", "-y", str(output_path)]
+
+    frag = config.output.fragment_seconds
+    if config.output.progressive == "hls":
+        return _forced_keyframe_args(config) + [
+            "-f",
+            "hls",
+            "-hls_time",
+            f"{frag:g}",
+            "-hls_playlist_type",
+            "event",
+            "-hls_segment_type",
+            "fmp4",
+            "-hls_segment_filename",
+            str(live.parent / "seg_%05d.m4s"),
+            "-y",
+            str(live),
+        ]
+    return _fragmented_mp4_args(config) + ["-y", str(live)]
+
+
+def _forced_keyframe_args(config: Config) -> List[str]:
+    """Force a keyframe every fragment_seconds, so each fragment starts with one."""
+    return ["-force_key_frames", f"expr:gte(t,n_forced*{config.output.fragment_seconds:g})"]
+
+
+def _fragmented_mp4_args(config: Config) -> List[str]:
+    """Fragmented MP4 muxer options: playable from the first fragment, no seek back."""
+    return _forced_keyframe_args(config) + [
+        "-movflags",
+        "+frag_keyframe+empty_moov+default_base_moof",
+        "-frag_duration",
+        str(round(config.output.fragment_seconds * 1_000_000)),
+        "-f",
+        "mp4",
+    ]
+
+
+def build_remux_cmd(source: Path, output_path: Path) -> List[str]:
+    """Build the FFmpeg command remuxing a progressive render to a faststart MP4."""
+    return [
+        "ffmpeg",
+        "-i",
+        str(source),
+        "-map",
+        "0",
+        "-c",
+        "copy",
         "-movflags",
         "+faststart",
         "-y",
-        str(timeline.output_path),
+        str(output_path),
     ]
 
-    cmd = ["ffmpeg"] + inputs + ["-filter_complex", filter_complex] + output_args
 
-    if dry_run:
-        return cmd
+def _remove_progressive(live: Path, config: Config) -> None:
+    """Delete a progressive render (HLS: its whole segment directory)."""
+    if config.output.progressive == "hls":
+        shutil.rmtree(live.parent, ignore_errors=True)
+    else:
+        live.unlink(missing_ok=True)
 
-    timeline.output_path.parent.mkdir(parents=True, exist_ok=True)
 
+def frame_cache(config: Config) -> FileCache:
+    """Cache of rendered layout snapshots, sized like the output cache."""
+    return FileCache("frames", config.cache.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+def build_frame_cmd(
+    timeline: Timeline,
+    config: Config,
+    output_path: Path,
+    head_videos: Optional[List[Path]] = None,
+    transparent_avatars: Optional[List[Path]] = None,
+    subtitle_file: Optional[Path] = None,
+) -> List[str]:
+    """Build the FFmpeg command writing the first composited frame of timeline.
+
+    The timeline is normally a clip_timeline cut starting at the wanted
+    time, so every input is opened with a seek to it. The image format
+    follows output_path's suffix (e.g. .png, .jpg).
+    """
+    mode = _detect_composition_mode(timeline)
+    extra_videos = []
+    if mode == CompositionMode.PIP and head_videos:
+        extra_videos = head_videos
+    elif mode == CompositionMode.GREENSCREEN and transparent_avatars:
+        extra_videos = transparent_avatars
+    media = probe_many([e.file for e in timeline.entries] + list(extra_videos))
+    audio_presence = [media[e.file].has_audio for e in timeline.entries if e.type == "avatar"]
+
+    graph = _FILTER_BUILDERS[mode](
+        timeline,
+        config,
+        audio_presence,
+        head_videos=head_videos,
+        transparent_avatars=transparent_avatars,
+    )
+    del graph.outputs["aout"]
+    wrap_with_post_processing(graph, subtitle_file=subtitle_file, subtitle_offset=timeline.offset)
+    optimize(graph, media, config.render.shared_decode_mb)
+    return (
+        ["ffmpeg"]
+        + graph.input_args()
+        + ["-filter_complex", graph.to_string(), "-map", "[vout]"]
+        + ["-frames:v", "1", "-update", "1", "-y", str(output_path)]
+    )
+
+
+def render_frame(
+    timeline: Timeline,
+    config: Config,
+    t: float,
+    output_path: Optional[Path] = None,
+    head_videos: Optional[List[Path]] = None,
+    transparent_avatars: Optional[List[Path]] = None,
+    subtitle_file: Optional[Path] = None,
+    prepare_avatars: Optional[AvatarPrep] = None,
+) -> Path:
+    """Render the composited frame at time t to an image (layout snapshot).
+
+    Only the inputs visible at t are opened, each seeked to t, and the
+    frame goes through the same filter builders as a full render. With
+    ``config.cache.enabled`` snapshots are cached by timeline content,
+    config and t, so an unchanged layout is served without FFmpeg. With
+    ``prepare_avatars`` the per-avatar inputs are derived on a cache miss,
+    and only for the avatars visible at t.
+
+    Args:
+        timeline: Composition timeline.
+        config: UGCKit configuration.
+        t: Frame time in seconds.
+        output_path: Image file to write (default: <output stem>_<t>s.png
+            next to the timeline's output).
+        head_videos: Pre-processed head video files for PiP mode.
+        transparent_avatars: Transparent avatar videos for green screen mode.
+        subtitle_file: ASS subtitle file for overlay.
+        prepare_avatars: Derives head_videos and transparent_avatars from
+            the visible avatar files; replaces both arguments. The cache
+            key then covers the avatars and config they are derived from.
+
+    Returns:
+        Path to the image.
+
+    Raises:
+        ValueError: If t is outside the timeline, or neither output_path nor
+            the timeline's output_path is set.
+        FFmpegError: If files are missing or FFmpeg fails.
+    """
+    if output_path is None:
+        if not timeline.output_path:
+            raise ValueError("Timeline must have output_path set")
+        stem = f"{timeline.output_path.stem}_{t:g}s"
+        output_path = timeline.output_path.with_name(f"{stem}.png")
+    if not 0 <= t < timeline.total_duration:
+        raise ValueError(f"Frame time {t:.2f}s is outside the timeline")
+
+    end = min(t + 1.0 / config.output.fps, timeline.total_duration)
+    clip, head_videos, transparent_avatars = _clip_inputs(
+        timeline, t, end, head_videos, transparent_avatars
+    )
+    validate_timeline_files(clip)
+
+    key = None
+    cache = frame_cache(config)
+    if config.cache.enabled:
+        render_key = render_cache_key(
+            clip,
+            config,
+            head_videos=head_videos,
+            transparent_avatars=transparent_avatars,
+            subtitle_file=subtitle_file,
+        )
+        key = hash_payload(
+            {
+                "frame": render_key,
+                "format": output_path.suffix.lower(),
+                "prepared": prepare_avatars is not None,
+            }
+        )
+        if cache.fetch(key, output_path):
+            return output_path
+
+    if prepare_avatars is not None:
+        avatars = [e.file for e in clip.entries if e.type == "avatar"]
+        head_videos, transparent_avatars = prepare_avatars(avatars)
+
+    # Never overwrite a hardlinked cache entry in place
+    output_path.unlink(missing_ok=True)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = build_frame_cmd(
+        clip, config, output_path, head_videos, transparent_avatars, subtitle_file
+    )
+    run_ffmpeg(cmd, clip.total_duration, stall_timeout=config.render.stall_timeout)
+    if key is not None:
+        cache.store(key, output_path)
+    return output_path
+
+
+def _audio_encode_args(config: Config) -> List[str]:
+    """Final audio encoder arguments."""
+    return ["-c:a", config.audio.codec, "-b:a", config.audio.bitrate]
+
+
+class _ProgressWatch:
+    """Follows FFmpeg's -progress reports and decides when a run has stalled.
+
+    A run stalls when out_time_us stops advancing for longer than its
+    window: stall_timeout, or for long renders a quarter of the expected
+    encode time (duration over the speed measured so far), which covers
+    steps without output time such as the faststart moov rewrite.
+    """
+
+    def __init__(
+        self,
+        duration: float,
+        stall_timeout: float,
+        progress_callback: Optional[Callable[[float], None]],
+    ):
+        self.duration = duration
+        self.stall_timeout = stall_timeout
+        self.progress_callback = progress_callback
+        self.started = self.last_active = time.monotonic()
+        self.out_us = 0
+
+    def feed(self, line: str) -> bool:
+        """Process one line of FFmpeg output; False if it is not a progress line."""
+        key, sep, value = line.partition("=")
+        if not sep or not key or " " in key:
+            return False
+        if key == "out_time_us":
+            try:
+                out_us = int(value)
+            except ValueError:
+                return True  # N/A before the first frame
+            if out_us > self.out_us:
+                self.out_us = out_us
+                self.last_active = time.monotonic()
+            if self.progress_callback and self.duration > 0:
+                self.progress_callback(min(out_us / (self.duration * 1_000_000), 1.0))
+        elif line == "progress=end" and self.progress_callback:
+            self.progress_callback(1.0)
+        return True
+
+    def touch(self) -> None:
+        """Count time spent outside FFmpeg (e.g. in a stream sink) as activity."""
+        self.last_active = time.monotonic()
+
+    def window(self) -> float:
+        """Seconds without advancing output time tolerated right now."""
+        elapsed = self.last_active - self.started
+        if self.out_us <= 0 or elapsed <= 0 or self.duration <= 0:
+            return self.stall_timeout
+        speed = self.out_us / 1_000_000 / elapsed
+        return max(self.stall_timeout, _STALL_SCALE * self.duration / speed)
+
+    def stalled(self) -> bool:
+        return time.monotonic() - self.last_active > self.window()
+
+
+def _run_watched(
+    cmd: List[str],
+    duration: float,
+    progress_callback: Optional[Callable[[float], None]],
+    stall_timeout: float,
+    sink: Optional[Callable[[bytes], object]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """Run FFmpeg under a stall watchdog; see run_ffmpeg and stream_ffmpeg.
+
+    Background threads forward stderr lines and (with sink) stdout chunks
+    through a small bounded queue; callbacks and the watchdog run on the
+    calling thread. Returns FFmpeg's log output.
+    """
+    cmd = [cmd[0], "-progress", "pipe:2", "-nostats"] + cmd[1:]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if sink is not None else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    events: queue.Queue = queue.Queue(maxsize=8)
+
+    def forward_lines() -> None:
+        for raw in proc.stderr:
+            events.put(("line", raw.decode(errors="replace").strip()))
+        events.put(("line", None))
+
+    def forward_chunks() -> None:
+        while chunk := proc.stdout.read1(chunk_size):
+            events.put(("chunk", chunk))
+        events.put(("chunk", None))
+
+    readers = [threading.Thread(target=forward_lines, daemon=True)]
+    if sink is not None:
+        readers.append(threading.Thread(target=forward_chunks, daemon=True))
+    for reader in readers:
+        reader.start()
+
+    watch = _ProgressWatch(duration, stall_timeout, progress_callback)
+    log: List[str] = []
+    open_streams = len(readers)
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-    except subprocess.TimeoutExpired:
-        raise FFmpegError("FFmpeg rendering timed out (5 min limit)")
-    if result.returncode != 0:
-        raise FFmpegError(f"FFmpeg failed: {result.stderr}")
+        while open_streams:
+            try:
+                kind, data = events.get(timeout=_WATCHDOG_POLL)
+            except queue.Empty:
+                kind, data = None, None
+            if kind is not None and data is None:
+                open_streams -= 1
+            elif kind == "chunk":
+                sink(data)
+                watch.touch()
+            elif kind == "line" and not watch.feed(data):
+                log.append(data)
+            if cancel is not None and cancel.is_set():
+                raise FFmpegError("FFmpeg cancelled")
+            if watch.stalled():
+                raise FFmpegError(
+                    f"FFmpeg stalled: no progress for {watch.window():.0f}s "
+                    f"(at {watch.out_us / 1_000_000:.1f}s of {duration:.1f}s)"
+                )
+        proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        # Unblock readers waiting on the full queue so they can exit
+        while any(reader.is_alive() for reader in readers):
+            try:
+                events.get(timeout=_WATCHDOG_POLL)
+            except queue.Empty:
+                pass
+        raise
 
-    return timeline.output_path
+    stderr = "\n".join(log)
+    if proc.returncode != 0:
+        raise FFmpegError(f"FFmpeg failed: {stderr}")
+    return stderr
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    duration: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """Run an FFmpeg command under a stall watchdog, optionally reporting progress.
+
+    FFmpeg's -progress output is parsed for every run. There is no fixed
+    time limit: the run is aborted only when its output time stops
+    advancing for stall_timeout seconds (longer for long renders, see
+    _ProgressWatch), or once cancel is set (e.g. by a failed sibling
+    job). With a progress_callback, progress is reported as a fraction of
+    duration.
+
+    Returns:
+        FFmpeg's log output (stderr without progress reports).
+
+    Raises:
+        FFmpegError: If FFmpeg fails, stalls or is cancelled.
+    """
+    return _run_watched(cmd, duration, progress_callback, stall_timeout, cancel=cancel)
+
+
+def stream_ffmpeg(
+    cmd: List[str],
+    sink: Callable[[bytes], object],
+    duration: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+) -> None:
+    """Run an FFmpeg command writing to pipe:1, passing its output to sink.
+
+    sink is called with each chunk (at most chunk_size bytes) as soon as
+    FFmpeg writes it. While sink blocks, the pipe fills up and FFmpeg
+    stalls, so a slow consumer throttles the encoder instead of the output
+    piling up in memory; time spent in sink does not count towards the
+    stall watchdog (see run_ffmpeg).
+
+    Raises:
+        FFmpegError: If FFmpeg fails or stalls.
+    """
+    _run_watched(cmd, duration, progress_callback, stall_timeout, sink, chunk_size)
 
 
 def build_ffmpeg_cmd(
@@ -879,53 +2144,15 @@ def compose_video_with_progress(
 ) -> Path:
     """Compose video with progress reporting.
 
-    Uses ffmpeg -progress pipe:1 to parse progress and report via callback.
+    Progress is parsed from ffmpeg -progress pipe:2 (see run_ffmpeg) and
+    reported via callback as a fraction of the timeline duration.
     """
-    cmd = build_ffmpeg_cmd(
+    return compose_video(
         timeline,
         config,
         head_videos=head_videos,
         transparent_avatars=transparent_avatars,
         subtitle_file=subtitle_file,
         music_file=music_file,
+        progress_callback=progress_callback,
     )
-
-    # Insert progress flags before output path
-    # Replace -y with progress args + -y
-    idx = cmd.index("-y")
-    cmd[idx:idx] = ["-progress", "pipe:1", "-nostats"]
-
-    timeline.output_path.parent.mkdir(parents=True, exist_ok=True)
-
-    total_us = timeline.total_duration * 1_000_000
-
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-
-    try:
-        for line in proc.stdout:
-            line = line.strip()
-            if line.startswith("out_time_us="):
-                try:
-                    current_us = int(line.split("=", 1)[1])
-                    progress = min(current_us / total_us, 1.0) if total_us > 0 else 0.0
-                    progress_callback(progress)
-                except (ValueError, ZeroDivisionError):
-                    pass
-            elif line == "progress=end":
-                progress_callback(1.0)
-
-        proc.wait()
-    except Exception:
-        proc.kill()
-        raise
-
-    if proc.returncode != 0:
-        stderr = proc.stderr.read() if proc.stderr else ""
-        raise FFmpegError(f"FFmpeg failed: {stderr}")
-
-    return timeline.output_path
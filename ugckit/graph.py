@@ -0,0 +1,500 @@
+"""FFmpeg filter graph intermediate representation for UGCKit.
+
+Filter builders assemble a FilterGraph of filter nodes connected by pads
+instead of concatenating filter_complex strings. Optimization passes
+rewrite the graph; to_string() serializes it into FFmpeg's filter_complex
+syntax, labelling pads, chaining single-use links with commas and
+inserting split/asplit wherever a stream feeds several consumers.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    from ugckit.composer import MediaInfo
+
+NOOP_FILTERS = frozenset({"copy", "null", "anull"})
+
+# Filters that never change frame size; skip_matching_scales looks through them
+_SIZE_PRESERVING = frozenset({"copy", "null", "setpts", "trim", "fps", "setsar", "format"})
+_SCALE_SIZE = re.compile(r"(-?\d+):(-?\d+)")
+# Filters acting on each frame alone; running them before trim/setpts changes nothing
+_PER_FRAME = frozenset({"scale", "setsar", "crop", "format"})
+_PLACEMENT = re.compile(r"PTS-STARTPTS\+\d+(?:\.\d+)?/TB")
+
+
+@dataclass(eq=False)
+class Input:
+    """An input file opened with -i, preceded by its input options."""
+
+    path: Path
+    options: Tuple[str, ...] = ()
+    offset: float = 0.0  # Timeline position of the input's first frame
+    pads: Dict[str, "Pad"] = field(default_factory=dict, repr=False)
+
+    def stream(self, kind: str) -> "Pad":
+        """The input's first video ("v") or audio ("a") stream."""
+        if kind not in self.pads:
+            self.pads[kind] = Pad(self, kind)
+        return self.pads[kind]
+
+    @property
+    def video(self) -> "Pad":
+        return self.stream("v")
+
+    @property
+    def audio(self) -> "Pad":
+        return self.stream("a")
+
+    def args(self) -> List[str]:
+        return [*self.options, "-i", str(self.path)]
+
+
+@dataclass(eq=False)
+class Node:
+    """A filter instance reading its input pads into a single output pad."""
+
+    name: str
+    args: str = ""
+    inputs: List["Pad"] = field(default_factory=list)
+    output: Optional["Pad"] = None
+
+    def __str__(self) -> str:
+        return f"{self.name}={self.args}" if self.args else self.name
+
+
+@dataclass(eq=False)
+class Pad:
+    """A stream: an input file's stream or a filter node's output."""
+
+    source: Union[Input, Node]
+    kind: str  # "v" or "a"
+    label: Optional[str] = None  # Preferred label; labelled pads are never comma-chained
+
+
+class FilterGraph:
+    """Inputs, filter nodes and named outputs (mapped with -map "[name]")."""
+
+    def __init__(self) -> None:
+        self.inputs: List[Input] = []
+        self.nodes: List[Node] = []
+        self.outputs: Dict[str, Pad] = {}
+
+    def add_input(self, path: Path, options: Sequence[str] = (), offset: float = 0.0) -> Input:
+        """Register an input file; inputs keep their registration order."""
+        inp = Input(Path(path), tuple(options), offset)
+        self.inputs.append(inp)
+        return inp
+
+    def filter(
+        self,
+        name: str,
+        args: str = "",
+        inputs: Sequence[Pad] = (),
+        kind: Optional[str] = None,
+        label: Optional[str] = None,
+    ) -> Pad:
+        """Add a filter node and return its output pad.
+
+        kind defaults to the first input's kind and is required for
+        source filters without inputs.
+        """
+        if kind is None:
+            if not inputs:
+                raise ValueError(f"Source filter {name} needs an explicit kind")
+            kind = inputs[0].kind
+        node = Node(name, args, list(inputs))
+        node.output = Pad(node, kind, label)
+        self.nodes.append(node)
+        return node.output
+
+    def chain(self, pad: Pad, *filters: str, label: Optional[str] = None) -> Pad:
+        """Apply single-input filters given as "name=args" in order.
+
+        label is attached to the last filter's output.
+        """
+        for i, spec in enumerate(filters):
+            name, _, args = spec.partition("=")
+            last = i == len(filters) - 1
+            pad = self.filter(name, args, [pad], label=label if last else None)
+        return pad
+
+    def set_output(self, name: str, pad: Pad) -> None:
+        self.outputs[name] = pad
+
+    def input_args(self) -> List[str]:
+        """Command-line arguments opening every input, in index order."""
+        return [arg for inp in self.inputs for arg in inp.args()]
+
+    def readers(self, pad: Pad) -> List[Node]:
+        """Nodes reading pad (once per input slot)."""
+        return [node for node in self.nodes for p in node.inputs if p is pad]
+
+    def uses(self, pad: Pad) -> int:
+        """Number of node inputs and graph outputs reading pad."""
+        count = sum(p is pad for node in self.nodes for p in node.inputs)
+        return count + sum(p is pad for p in self.outputs.values())
+
+    def replace(self, old: Pad, new: Pad) -> None:
+        """Rewire every reader of old to read new instead."""
+        for node in self.nodes:
+            node.inputs = [new if p is old else p for p in node.inputs]
+        for name, pad in self.outputs.items():
+            if pad is old:
+                self.outputs[name] = new
+
+    def to_string(self) -> str:
+        """Serialize into an FFmpeg filter_complex string."""
+        return _Serializer(self).run()
+
+    __str__ = to_string
+
+
+class _Serializer:
+    """Assigns labels and emits filter_complex statements for a graph."""
+
+    def __init__(self, graph: FilterGraph) -> None:
+        self.graph = graph
+        self.index = {id(inp): i for i, inp in enumerate(graph.inputs)}
+        self.nodes = _topological(graph.nodes)
+        self.readers: Dict[int, List[Tuple[Optional[Node], Union[int, str]]]] = {}
+        for node in self.nodes:
+            for slot, pad in enumerate(node.inputs):
+                self.readers.setdefault(id(pad), []).append((node, slot))
+        for name, pad in graph.outputs.items():
+            self.readers.setdefault(id(pad), []).append((None, name))
+        self.taken = set(graph.outputs)
+        self.auto = 0
+        # Label read by each (node, slot) or graph output name
+        self.edges: Dict[Tuple[int, Union[int, str]], str] = {}
+        self.statements: List[str] = []
+
+    def run(self) -> str:
+        # Input streams first: fan-out and streams mapped straight to outputs
+        for inp in self.graph.inputs:
+            for pad in inp.pads.values():
+                if self.readers.get(id(pad)):
+                    self._distribute(pad, f"{self.index[id(inp)]}:{pad.kind}", is_input=True)
+
+        for node in self.nodes:
+            if any(self._chained(p) for p in node.inputs):
+                continue  # Emitted as part of its producer's chain
+            head = "".join(f"[{self.edges[id(node), slot]}]" for slot in range(len(node.inputs)))
+            chain = [node]
+            while self._chained(chain[-1].output):
+                chain.append(self.readers[id(chain[-1].output)][0][0])
+            pad = chain[-1].output
+            statement = head + ",".join(str(n) for n in chain)
+            if not self.readers.get(id(pad)):
+                self.statements.append(statement)
+                continue
+            readers = self.readers[id(pad)]
+            if len(readers) == 1 and readers[0][0] is None:
+                label = readers[0][1]
+            else:
+                label = self._unique(pad.label or self._auto())
+            self.statements.append(f"{statement}[{label}]")
+            self._distribute(pad, label, is_input=False)
+        return ";".join(self.statements)
+
+    def _chained(self, pad: Pad) -> bool:
+        """Whether pad links two filters that can be joined with a comma."""
+        if not isinstance(pad.source, Node) or pad.label is not None:
+            return False
+        readers = self.readers.get(id(pad), [])
+        return len(readers) == 1 and readers[0][0] is not None and len(readers[0][0].inputs) == 1
+
+    def _distribute(self, pad: Pad, label: str, is_input: bool) -> None:
+        """Hand the stream labelled label to each of pad's readers."""
+        readers = self.readers[id(pad)]
+        if len(readers) == 1:
+            node, slot = readers[0]
+            if node is None and is_input:
+                # Outputs must come from a filter, not straight from an input
+                noop = "null" if pad.kind == "v" else "anull"
+                self.statements.append(f"[{label}]{noop}[{slot}]")
+            elif node is not None:
+                self.edges[id(node), slot] = label
+            return
+
+        base = f"in{label.replace(':', '')}" if is_input else label
+        names = []
+        for k, (node, slot) in enumerate(readers):
+            name = slot if node is None else self._unique(f"{base}_{k}")
+            if node is not None:
+                self.edges[id(node), slot] = name
+            names.append(f"[{name}]")
+        split = "split" if pad.kind == "v" else "asplit"
+        self.statements.append(f"[{label}]{split}={len(readers)}{''.join(names)}")
+
+    def _unique(self, hint: str) -> str:
+        name, n = hint, 0
+        while name in self.taken:
+            n += 1
+            name = f"{hint}_{n}"
+        self.taken.add(name)
+        return name
+
+    def _auto(self) -> str:
+        self.auto += 1
+        return f"s{self.auto}"
+
+
+def share_inputs(graph: FilterGraph) -> None:
+    """Open a file once when it is input several times identically.
+
+    Inputs with the same resolved path, options and timeline offset decode
+    the same frames at the same time, so their readers are fed from one
+    decoder (split by the serializer) without buffering.
+    """
+    seen: Dict[Tuple[Path, Tuple[str, ...], float], Input] = {}
+    for inp in list(graph.inputs):
+        key = (inp.path.resolve(), inp.options, round(inp.offset, 6))
+        first = seen.setdefault(key, inp)
+        if first is inp:
+            continue
+        for kind, pad in inp.pads.items():
+            graph.replace(pad, first.stream(kind))
+        graph.inputs.remove(inp)
+
+
+def drop_unused(graph: FilterGraph) -> None:
+    """Remove nodes and inputs whose output nothing reads.
+
+    Builders may prepare streams that end up unused (e.g. a screencast too
+    short to cover a single frame); FFmpeg rejects unconnected outputs.
+    """
+    changed = True
+    while changed:
+        changed = False
+        for node in list(graph.nodes):
+            if not graph.uses(node.output):
+                graph.nodes.remove(node)
+                changed = True
+    graph.inputs = [
+        inp for inp in graph.inputs if any(graph.uses(pad) for pad in inp.pads.values())
+    ]
+
+
+def share_decodes(graph: FilterGraph, media: Mapping[Path, "MediaInfo"], limit_mb: float) -> None:
+    """Decode a clip once for all of its time-placed uses.
+
+    Screencasts are opened with -t <length> and moved to their window with
+    setpts=PTS-STARTPTS+<start>/TB, so every use shows the file from its
+    first frame. Uses of the same file are fed from one input cut to the
+    longest length: per-frame filters they all apply (e.g. the same scale)
+    run once before the split, then each use gets its own trim and setpts.
+
+    Later uses hold the frames decoded for the first one until they are
+    shown, so a file is shared only if that buffer (longest length at the
+    source frame rate and the shared filters' frame size) fits in limit_mb.
+    """
+    groups: Dict[Path, List[Tuple[Input, Node, float]]] = {}
+    for inp in graph.inputs:
+        placement = _placement(graph, inp)
+        if placement is not None:
+            groups.setdefault(inp.path.resolve(), []).append((inp, *placement))
+
+    for uses in groups.values():
+        info = media.get(uses[0][0].path)
+        if len(uses) < 2 or not info or not info.width or not info.height:
+            continue
+        chains = [_per_frame_chain(graph, setpts) for _, setpts, _ in uses]
+        common = 0
+        while all(
+            len(chain) > common and str(chain[common]) == str(chains[0][common]) for chain in chains
+        ):
+            common += 1
+        size = frame_size((info.width, info.height), chains[0][:common])
+        length = max(length for *_, length in uses)
+        if size is None or length * (info.fps or 30.0) * size[0] * size[1] * 1.5 > limit_mb * 2**20:
+            continue
+
+        shared_input = uses[0][0]
+        shared_input.options = ("-t", f"{length:.3f}")
+        shared = shared_input.video
+        for node in chains[0][:common]:
+            shared = graph.filter(node.name, node.args, [shared])
+        for (inp, setpts, use_length), chain in zip(uses, chains):
+            source = shared
+            if use_length < length - 1e-6:
+                source = graph.filter("trim", f"duration={use_length:.3f}", [source])
+            setpts.inputs = [source]
+            if common:
+                last = chain[common - 1]
+                setpts.output.label = last.output.label
+                graph.replace(last.output, setpts.output)
+                for node in chain[:common]:
+                    graph.nodes.remove(node)
+            if inp is not shared_input:
+                graph.inputs.remove(inp)
+
+
+def clip_filters(graph: FilterGraph, inp: Input) -> List[Node]:
+    """Per-frame filters applied to a time-placed clip (see share_decodes).
+
+    Empty unless inp is a -t trimmed input placed with setpts.
+    """
+    placement = _placement(graph, inp)
+    return _per_frame_chain(graph, placement[0]) if placement else []
+
+
+def frame_size(size: Tuple[int, int], nodes: Sequence[Node]) -> Optional[Tuple[int, int]]:
+    """Frame size after applying per-frame filter nodes to frames of size.
+
+    None when a filter's output size cannot be told from its arguments.
+    """
+    w, h = size
+    for node in nodes:
+        if node.name in ("scale", "crop"):
+            match = _SCALE_SIZE.match(node.args)
+            if not match:
+                return None
+            tw, th = int(match[1]), int(match[2])
+            if tw <= 0 and th <= 0:
+                return None
+            w, h = (tw if tw > 0 else round(w * th / h), th if th > 0 else round(h * tw / w))
+    return w, h
+
+
+def substitute_input(graph: FilterGraph, inp: Input, path: Path, nodes: Sequence[Node]) -> None:
+    """Read inp from path, a file with nodes (a filter chain on inp) already applied."""
+    inp.path = Path(path)
+    if not nodes:
+        return
+    before, last = nodes[0].inputs[0], nodes[-1].output
+    before.label = before.label or last.label
+    graph.replace(last, before)
+    for node in nodes:
+        graph.nodes.remove(node)
+
+
+def drop_noops(graph: FilterGraph) -> None:
+    """Remove copy/null/anull nodes, reading their input directly."""
+    for node in list(graph.nodes):
+        if node.name in NOOP_FILTERS and len(node.inputs) == 1:
+            graph.nodes.remove(node)
+            graph.replace(node.output, node.inputs[0])
+
+
+def merge_scales(graph: FilterGraph) -> None:
+    """Drop a scale whose only reader is a scale to an explicit size."""
+    for node in list(graph.nodes):
+        if node.name != "scale" or _explicit_size(node.args) is None:
+            continue
+        prev = node.inputs[0].source
+        if isinstance(prev, Node) and prev.name == "scale" and graph.uses(prev.output) == 1:
+            node.inputs = list(prev.inputs)
+            graph.nodes.remove(prev)
+
+
+def skip_matching_scales(graph: FilterGraph, media: Mapping[Path, "MediaInfo"]) -> None:
+    """Remove scale nodes whose probed input already has the target size."""
+    for node in list(graph.nodes):
+        if node.name != "scale":
+            continue
+        match = _SCALE_SIZE.fullmatch(node.args)
+        inp = _source_input(node.inputs[0])
+        info = media.get(inp.path) if inp else None
+        if not match or not info or not info.width or not info.height:
+            continue
+        w, h = int(match[1]), int(match[2])
+        if w <= 0 and h <= 0:
+            continue
+        # -1/-2 keep the aspect ratio, so the size matches only if the other side does
+        target_w = w if w > 0 else info.width * h / info.height
+        target_h = h if h > 0 else info.height * w / info.width
+        if target_w == info.width and target_h == info.height:
+            graph.nodes.remove(node)
+            graph.replace(node.output, node.inputs[0])
+
+
+def optimize(
+    graph: FilterGraph,
+    media: Optional[Mapping[Path, "MediaInfo"]] = None,
+    shared_decode_mb: float = 0,
+) -> FilterGraph:
+    """Run all optimization passes in place and return the graph.
+
+    media maps input paths to probe results; without it, scales are kept
+    even when the input already has the target size and reused clips are
+    decoded once per use. shared_decode_mb bounds the frames buffered for
+    a clip decoded once for several uses (0 disables sharing).
+    """
+    drop_unused(graph)
+    share_inputs(graph)
+    if media and shared_decode_mb > 0:
+        share_decodes(graph, media, shared_decode_mb)
+    drop_noops(graph)
+    merge_scales(graph)
+    if media:
+        skip_matching_scales(graph, media)
+    return graph
+
+
+def _topological(nodes: Sequence[Node]) -> List[Node]:
+    """Nodes ordered so producers precede readers, otherwise keeping list order."""
+    order: List[Node] = []
+    seen = set()
+
+    def visit(node: Node) -> None:
+        if id(node) in seen:
+            return
+        seen.add(id(node))
+        for pad in node.inputs:
+            if isinstance(pad.source, Node):
+                visit(pad.source)
+        order.append(node)
+
+    for node in nodes:
+        visit(node)
+    return order
+
+
+def _placement(graph: FilterGraph, inp: Input) -> Optional[Tuple[Node, float]]:
+    """The setpts node placing a length-trimmed video-only input, and its length."""
+    if len(inp.options) != 2 or inp.options[0] != "-t" or "v" not in inp.pads:
+        return None
+    if any(graph.uses(pad) for kind, pad in inp.pads.items() if kind != "v"):
+        return None
+    readers = graph.readers(inp.video)
+    if len(readers) != 1 or graph.uses(inp.video) != 1:
+        return None
+    setpts = readers[0]
+    if setpts.name != "setpts" or not _PLACEMENT.fullmatch(setpts.args):
+        return None
+    return setpts, float(inp.options[1])
+
+
+def _per_frame_chain(graph: FilterGraph, node: Node) -> List[Node]:
+    """The per-frame filters applied right after node, in order."""
+    chain: List[Node] = []
+    pad = node.output
+    while graph.uses(pad) == 1:
+        readers = graph.readers(pad)
+        if len(readers) != 1 or readers[0].name not in _PER_FRAME or len(readers[0].inputs) != 1:
+            break
+        chain.append(readers[0])
+        pad = readers[0].output
+    return chain
+
+
+def _explicit_size(args: str) -> Optional[Tuple[int, int]]:
+    match = _SCALE_SIZE.fullmatch(args)
+    if not match or int(match[1]) <= 0 or int(match[2]) <= 0:
+        return None
+    return int(match[1]), int(match[2])
+
+
+def _source_input(pad: Pad) -> Optional[Input]:
+    """The input a pad's frames come from, looking through size-preserving filters."""
+    while isinstance(pad.source, Node):
+        node = pad.source
+        if node.name not in _SIZE_PRESERVING or len(node.inputs) != 1:
+            return None
+        pad = node.inputs[0]
+    return pad.source
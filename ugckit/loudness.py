@@ -0,0 +1,155 @@
+"""Two-pass loudness normalization for UGCKit.
+
+The first pass measures each avatar clip's audio once with FFmpeg's
+loudnorm analysis (integrated loudness, true peak, loudness range) and
+caches the result on disk, keyed like probe results by path, size and
+mtime. The render then applies one fixed gain to the mixed track,
+computed from the cached measurements, instead of dynamic single-pass
+loudnorm: cheaper, and without its audible pumping.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional
+
+from ugckit.cache import JsonCache, file_fingerprint
+from ugckit.composer import DEFAULT_STALL_TIMEOUT, FFmpegError, MediaInfo, run_ffmpeg
+from ugckit.graph import FilterGraph
+from ugckit.models import Config, Timeline
+
+# True-peak ceiling, as in the single-pass loudnorm of _finalize_audio
+TRUE_PEAK = -1.5
+
+# Bump when LoudnessStats fields or the measurement change
+_LOUDNESS_CACHE_VERSION = 1
+_loudness_cache = JsonCache("loudness")
+_LOUDNORM_JSON = re.compile(r"\{[^{}]*\}")
+
+
+@dataclass
+class LoudnessStats:
+    """EBU R128 measurement of a file's first audio stream."""
+
+    integrated: float  # LUFS
+    true_peak: float  # dBTP
+    lra: float  # LU
+    threshold: float  # LUFS, relative gate
+
+    @property
+    def silent(self) -> bool:
+        return not math.isfinite(self.integrated)
+
+
+def _parse_loudnorm(stderr: str) -> LoudnessStats:
+    """Parse the JSON block loudnorm prints with print_format=json."""
+    blocks = _LOUDNORM_JSON.findall(stderr)
+    if not blocks:
+        raise ValueError("no loudnorm summary")
+    data = json.loads(blocks[-1])
+    return LoudnessStats(
+        integrated=float(data["input_i"]),
+        true_peak=float(data["input_tp"]),
+        lra=float(data["input_lra"]),
+        threshold=float(data["input_thresh"]),
+    )
+
+
+def measure_loudness(path: Path, stall_timeout: float = DEFAULT_STALL_TIMEOUT) -> LoudnessStats:
+    """Measure a file's audio loudness, cached by path, size and mtime.
+
+    stall_timeout bounds the analysis as in ugckit.composer.run_ffmpeg.
+
+    Raises:
+        FFmpegError: If the file is missing or the analysis fails.
+    """
+    if not path.exists():
+        raise FFmpegError(f"Audio file not found: {path}")
+
+    key = file_fingerprint(path)
+    cached = _loudness_cache.get(key)
+    if cached and cached.pop("version", None) == _LOUDNESS_CACHE_VERSION:
+        try:
+            return LoudnessStats(**cached)
+        except TypeError:
+            pass
+
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", str(path), "-map", "0:a:0"]
+    cmd += ["-af", "loudnorm=print_format=json", "-f", "null", "-"]
+    try:
+        stderr = run_ffmpeg(cmd, 0.0, stall_timeout=stall_timeout)
+    except FFmpegError as e:
+        raise FFmpegError(f"Loudness analysis failed for {path}: {e}") from e
+    try:
+        stats = _parse_loudnorm(stderr)
+    except (ValueError, KeyError) as e:
+        raise FFmpegError(f"Invalid loudness analysis for {path}") from e
+
+    _loudness_cache.set(key, {"version": _LOUDNESS_CACHE_VERSION, **asdict(stats)})
+    return stats
+
+
+def measure_many(
+    paths: Iterable[Path],
+    max_workers: int = 8,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+) -> Dict[Path, LoudnessStats]:
+    """Measure several files concurrently; duplicate paths are measured once.
+
+    Raises:
+        FFmpegError: For the first path (in input order) that fails.
+    """
+    unique = list(dict.fromkeys(paths))
+    if not unique:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = {path: pool.submit(measure_loudness, path, stall_timeout) for path in unique}
+    return {path: future.result() for path, future in futures.items()}
+
+
+def timeline_gain(
+    timeline: Timeline, media: Mapping[Path, MediaInfo], config: Config
+) -> Optional[float]:
+    """Gain in dB bringing the concatenated avatar audio to the target loudness.
+
+    The integrated loudness of the concatenation is the duration-weighted
+    energy mean of the clips' levels (silent clips are gated out, as in
+    R128). The gain is capped so the loudest true peak stays at TRUE_PEAK.
+
+    Returns:
+        None if no avatar clip has audible sound.
+
+    Raises:
+        FFmpegError: If a clip cannot be measured.
+    """
+    clips = [e for e in timeline.entries if e.type == "avatar" and media[e.file].has_audio]
+    stats = measure_many((e.file for e in clips), stall_timeout=config.render.stall_timeout)
+
+    energy = duration = 0.0
+    peak = -math.inf
+    for entry in clips:
+        clip = stats[entry.file]
+        if clip.silent:
+            continue
+        length = entry.end - entry.start
+        energy += length * 10 ** (clip.integrated / 10)
+        duration += length
+        peak = max(peak, clip.true_peak)
+    if energy <= 0:
+        return None
+
+    integrated = 10 * math.log10(energy / duration)
+    return min(config.audio.target_loudness - integrated, TRUE_PEAK - peak)
+
+
+def apply_gain(graph: FilterGraph, gain_db: float) -> None:
+    """Replace the graph's dynamic loudnorm with a fixed gain of gain_db."""
+    for node in graph.nodes:
+        if node.name == "loudnorm":
+            node.name, node.args = "volume", f"{gain_db:.2f}dB"
@@ -0,0 +1,280 @@
+"""Normalized mezzanine inputs for UGCKit.
+
+Avatar clips are transcoded once to the output resolution, frame rate and
+pixel format, with 48 kHz stereo PCM audio and a short GOP. Screencasts
+are normalized to the output frame rate and pixel format; their geometry
+depends on the composition mode and is left to the filter graph.
+
+Mezzanines live in a content-addressed FileCache, so a clip reused across
+scripts is transcoded only once, and the render graph concatenates
+avatars without per-input scaling or resampling.
+
+Screencast variants go one step further: each screencast is encoded once
+per filter chain the render graph applies to it (e.g. the overlay scale),
+and the graph reads the variant with that chain removed.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from ugckit.cache import FileCache, cached_transcode, file_hash, hash_payload
+from ugckit.composer import MediaInfo, probe_many
+from ugckit.graph import FilterGraph, Input, Node, clip_filters, frame_size, substitute_input
+from ugckit.models import Config, Timeline
+
+# Bump when mezzanine or variant commands change in ways the keys do not capture
+_MEZZANINE_VERSION = 1
+_VARIANT_VERSION = 1
+# Audio layout of normalized avatars (mezzanines and preview proxies)
+MEZZANINE_AUDIO_ARGS = ["-c:a", "pcm_s16le", "-ar", "48000", "-ac", "2"]
+
+
+def mezzanine_cache(config: Config) -> FileCache:
+    """Cache of normalized inputs configured by config.mezzanine."""
+    return FileCache("mezzanine", config.mezzanine.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+def mezzanine_key(path: Path, kind: str, config: Config) -> str:
+    """Content-addressed key of a file's mezzanine.
+
+    Args:
+        path: Source media file.
+        kind: "avatar" or "screencast".
+        config: UGCKit configuration.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    mz_cfg = config.mezzanine
+    payload = {
+        "version": _MEZZANINE_VERSION,
+        "kind": kind,
+        "file": file_hash(path),
+        "fps": config.output.fps,
+        "crf": mz_cfg.crf,
+        "preset": mz_cfg.preset,
+        "gop_seconds": mz_cfg.gop_seconds,
+    }
+    if kind == "avatar":
+        payload["resolution"] = list(config.output.resolution)
+    return hash_payload(payload)
+
+
+def build_mezzanine_cmd(
+    src: Path,
+    dest: Path,
+    kind: str,
+    config: Config,
+    info: MediaInfo,
+) -> List[str]:
+    """Build the FFmpeg command normalizing one input.
+
+    Avatars always get an audio track (silence if the source has none), so
+    the render graph can treat every normalized clip alike.
+    """
+    mz_cfg = config.mezzanine
+    w, h = config.output.resolution
+    fps = config.output.fps
+    gop = max(1, round(fps * mz_cfg.gop_seconds))
+
+    inputs = ["-i", str(src)]
+    if kind == "avatar":
+        vf = f"scale={w}:{h},setsar=1,fps={fps},format=yuv420p"
+        if info.has_audio:
+            audio = ["-map", "0:a:0"] + MEZZANINE_AUDIO_ARGS
+        else:
+            inputs += ["-f", "lavfi", "-i", "anullsrc=r=48000:cl=stereo"]
+            audio = ["-map", "1:a"] + MEZZANINE_AUDIO_ARGS
+    else:
+        vf = f"fps={fps},format=yuv420p"
+        audio = ["-an"]
+
+    return (
+        ["ffmpeg"]
+        + inputs
+        + ["-map", "0:v:0", "-vf", vf]
+        + ["-c:v", "libx264", "-preset", mz_cfg.preset, "-crf", str(mz_cfg.crf)]
+        + ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+        + audio
+        + ["-t", f"{info.duration:.3f}", "-f", "mov", "-y", str(dest)]
+    )
+
+
+def prepare_mezzanines(timeline: Timeline, config: Config) -> Timeline:
+    """Return a copy of timeline whose entries point at normalized mezzanines.
+
+    Missing mezzanines are transcoded in parallel (config.render.jobs
+    workers); cached ones are reused. Eviction runs once at the end and
+    never removes the mezzanines this timeline uses.
+
+    Args:
+        timeline: Composition timeline with original input files.
+        config: UGCKit configuration.
+
+    Returns:
+        Timeline with the same timing and entry files replaced.
+
+    Raises:
+        FFmpegError: If an input is missing or cannot be transcoded.
+    """
+    return transcode_inputs(
+        timeline,
+        config,
+        mezzanine_cache(config),
+        lambda src, kind: mezzanine_key(src, kind, config),
+        lambda src, dest, kind, info: build_mezzanine_cmd(src, dest, kind, config, info),
+        "mezzanine",
+    )
+
+
+def transcode_inputs(
+    timeline: Timeline,
+    config: Config,
+    cache: FileCache,
+    key: Callable[[Path, str], str],
+    build_cmd: Callable[[Path, Path, str, MediaInfo], List[str]],
+    what: str,
+) -> Timeline:
+    """Return a copy of timeline whose entries point at cached transcodes.
+
+    Each distinct (file, entry type) pair is transcoded once with
+    build_cmd(src, dest, kind, info) and stored in cache under
+    key(src, kind). Misses run in parallel (config.render.jobs workers);
+    eviction runs once at the end and never removes the entries this
+    timeline uses.
+
+    Raises:
+        FFmpegError: If an input is missing or cannot be transcoded.
+    """
+    jobs: List[Tuple[Path, str]] = list(dict.fromkeys((e.file, e.type) for e in timeline.entries))
+    media = probe_many(path for path, _ in jobs)
+    keys = {job: key(*job) for job in jobs}
+
+    def build(job: Tuple[Path, str]) -> Path:
+        src, kind = job
+        return cached_transcode(
+            cache,
+            keys[job],
+            lambda dest: build_cmd(src, dest, kind, media[src]),
+            media[src].duration,
+            f"{what} for {src}",
+            config.render.stall_timeout,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, min(config.render.jobs, len(jobs)))) as pool:
+        results: Dict[Tuple[Path, str], Path] = dict(zip(jobs, pool.map(build, jobs)))
+    cache.evict(keep=keys.values())
+
+    entries = [
+        entry.model_copy(update={"file": results[(entry.file, entry.type)]})
+        for entry in timeline.entries
+    ]
+    return timeline.model_copy(update={"entries": entries})
+
+
+def variant_cache(config: Config) -> FileCache:
+    """Cache of screencast variants configured by config.variants."""
+    return FileCache("variants", config.variants.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+def variant_key(path: Path, filters: str, pix_fmt: str, config: Config) -> str:
+    """Content-addressed key of a screencast variant.
+
+    Args:
+        path: Source screencast.
+        filters: Per-frame filter chain baked into the variant (its geometry).
+        pix_fmt: Pixel format of the variant.
+        config: UGCKit configuration.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    return hash_payload(
+        {
+            "version": _VARIANT_VERSION,
+            "file": file_hash(path),
+            "filters": filters,
+            "fps": config.output.fps,
+            "pix_fmt": pix_fmt,
+            "crf": config.variants.crf,
+            "preset": config.variants.preset,
+        }
+    )
+
+
+def build_variant_cmd(
+    src: Path, dest: Path, filters: str, pix_fmt: str, config: Config, info: MediaInfo
+) -> List[str]:
+    """Build the FFmpeg command encoding one screencast variant (video only)."""
+    vr_cfg = config.variants
+    vf = f"{filters},fps={config.output.fps},format={pix_fmt}"
+    return (
+        ["ffmpeg", "-i", str(src), "-map", "0:v:0", "-vf", vf]
+        + ["-c:v", "libx264", "-preset", vr_cfg.preset, "-crf", str(vr_cfg.crf), "-an"]
+        + ["-t", f"{info.duration:.3f}", "-f", "mov", "-y", str(dest)]
+    )
+
+
+def use_screencast_variants(
+    graph: FilterGraph, screencasts: Iterable[Path], config: Config
+) -> List[Path]:
+    """Point screencast inputs of graph at pre-scaled variants.
+
+    Each screencast input's per-frame filter chain (e.g. scale=432:-1) is
+    baked into a cached variant, encoded on a miss, and removed from the
+    graph. Variants of odd frame sizes use yuv444p, since 4:2:0 needs even
+    dimensions.
+
+    Returns:
+        The variant files the graph now reads.
+
+    Raises:
+        FFmpegError: If a variant cannot be encoded.
+    """
+    files = set(screencasts)
+    requests: List[Tuple[Input, List[Node], str]] = []
+    for inp in graph.inputs:
+        nodes = clip_filters(graph, inp) if inp.path in files else []
+        if nodes:
+            requests.append((inp, nodes, ",".join(str(node) for node in nodes)))
+    if not requests:
+        return []
+
+    media = probe_many({inp.path for inp, _, _ in requests})
+    formats: Dict[Tuple[Path, str], str] = {}
+    for inp, nodes, filters in requests:
+        info = media[inp.path]
+        size = frame_size((info.width, info.height), nodes) if info.width and info.height else None
+        if size is not None:
+            even = size[0] % 2 == 0 and size[1] % 2 == 0
+            formats[inp.path, filters] = "yuv420p" if even else "yuv444p"
+
+    cache = variant_cache(config)
+    keys = {job: variant_key(job[0], job[1], fmt, config) for job, fmt in formats.items()}
+
+    def build(job: Tuple[Path, str]) -> Path:
+        src, filters = job
+        return cached_transcode(
+            cache,
+            keys[job],
+            lambda dest: build_variant_cmd(src, dest, filters, formats[job], config, media[src]),
+            media[src].duration,
+            f"variant of {src}",
+            config.render.stall_timeout,
+        )
+
+    jobs = list(formats)
+    with ThreadPoolExecutor(max_workers=max(1, min(config.render.jobs, len(jobs)))) as pool:
+        results: Dict[Tuple[Path, str], Path] = dict(zip(jobs, pool.map(build, jobs)))
+    cache.evict(keep=keys.values())
+
+    used = []
+    for inp, nodes, filters in requests:
+        variant = results.get((inp.path, filters))
+        if variant is not None:
+            substitute_input(graph, inp, variant, nodes)
+            used.append(variant)
+    return used
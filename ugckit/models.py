@@ -66,6 +66,7 @@ class TimelineEntry(BaseModel):
     file: Path
     parent_segment: Optional[int] = None  # For screencasts, which segment they belong to
     composition_mode: CompositionMode = CompositionMode.OVERLAY
+    source_start: Optional[float] = None  # Seek into file; set, the input is cut to the entry
 
 
 class Timeline(BaseModel):
@@ -75,6 +76,8 @@ class Timeline(BaseModel):
     total_duration: float
     entries: List[TimelineEntry] = Field(default_factory=list)
     output_path: Optional[Path] = None
+    offset: float = 0.0  # Position of t=0 in the full script timeline (partial renders)
+    full_duration: Optional[float] = None  # Full script duration when this is a partial range
 
 
 class OverlayConfig(BaseModel):
@@ -131,6 +134,22 @@ class MusicConfig(BaseModel):
     loop: bool = True
 
 
+class RenditionConfig(BaseModel):
+    """An extra output encoded from the same composite as the main output."""
+
+    name: str = Field(pattern=r"^[\w-]+$")  # Written as <output stem>_<name>.<format>
+    format: str = "mp4"  # Container, or jpg/png/webp for a single poster frame
+    resolution: Optional[Tuple[int, int]] = None  # Default: output resolution
+    codec: Optional[str] = None  # Encoder settings default to the output's
+    preset: Optional[str] = None
+    crf: Optional[int] = Field(default=None, ge=0, le=51)
+    poster_time: float = Field(default=0.0, ge=0.0)  # Frame time for image formats
+
+    @property
+    def is_image(self) -> bool:
+        return self.format.lower() in ("jpg", "jpeg", "png", "webp")
+
+
 class OutputConfig(BaseModel):
     """Output video configuration."""
 
@@ -139,6 +158,17 @@ class OutputConfig(BaseModel):
     codec: str = "libx264"
     preset: str = "medium"
     crf: int = Field(default=23, ge=0, le=51)
+    renditions: List[RenditionConfig] = Field(default_factory=list)
+    # Also write the output progressively while encoding, remuxed to faststart MP4 at the end
+    progressive: Optional[Literal["fmp4", "hls"]] = None
+    fragment_seconds: float = Field(default=2.0, gt=0.0, le=10.0)  # Fragment/segment length
+
+    @model_validator(mode="after")
+    def unique_rendition_names(self) -> "OutputConfig":
+        names = [r.name for r in self.renditions]
+        if len(names) != len(set(names)):
+            raise ValueError("output rendition names must be unique")
+        return self
 
 
 class AudioConfig(BaseModel):
@@ -146,10 +176,64 @@ class AudioConfig(BaseModel):
 
     normalize: bool = True
     target_loudness: int = Field(default=-14, ge=-70, le=0)
+    two_pass: bool = True  # Fixed gain from cached per-clip measurements, not dynamic loudnorm
+    separate_track: bool = False  # Render audio as its own cached track, muxed in by stream copy
     codec: str = "aac"
     bitrate: str = "192k"
 
 
+class RenderConfig(BaseModel):
+    """Rendering strategy configuration."""
+
+    chunked: bool = False  # Render each segment separately, then stream-copy concat
+    work_dir: Optional[Path] = None  # Intermediate chunk files (default: next to output)
+    gop_seconds: float = Field(default=2.0, gt=0.0, le=10.0)  # Closed-GOP length in chunks
+    jobs: int = Field(default=1, ge=1)  # Parallel chunk encoders (>1 implies chunked)
+    threads: Optional[int] = Field(default=None, ge=1)  # Total CPU budget (default: all cores)
+    shared_decode_mb: int = Field(default=256, ge=0)  # Frame buffer to decode reused clips once
+    stream_copy: bool = True  # Copy chunks whose clip already matches the output, no re-encode
+    # Abort FFmpeg once its output time stops advancing this long (scaled up for long renders)
+    stall_timeout: float = Field(default=60.0, gt=0.0)
+
+
+class MezzanineConfig(BaseModel):
+    """Normalized intermediate (mezzanine) configuration."""
+
+    enabled: bool = False  # Transcode inputs once to output geometry/fps, 48 kHz stereo
+    crf: int = Field(default=12, ge=0, le=51)  # Near-transparent so re-encoding loses little
+    preset: str = "veryfast"
+    gop_seconds: float = Field(default=1.0, gt=0.0, le=10.0)  # Short GOP for cheap seeking
+    max_size_mb: int = Field(default=20480, ge=0)  # LRU eviction above this total size
+
+
+class VariantConfig(BaseModel):
+    """Pre-scaled screencast variant cache configuration."""
+
+    enabled: bool = False  # Encode each screencast once per target geometry, reuse across renders
+    crf: int = Field(default=12, ge=0, le=51)  # Near-transparent so re-encoding loses little
+    preset: str = "veryfast"
+    max_size_mb: int = Field(default=10240, ge=0)  # LRU eviction above this total size
+
+
+class PreviewConfig(BaseModel):
+    """Low-resolution preview render configuration."""
+
+    enabled: bool = False  # Render from cached low-res proxies with the settings below
+    resolution: Tuple[int, int] = (360, 640)
+    fps: int = Field(default=15, ge=1, le=120)
+    preset: str = "ultrafast"
+    crf: int = Field(default=30, ge=0, le=51)
+    max_size_mb: int = Field(default=5120, ge=0)  # LRU eviction of proxies above this total size
+
+
+class CacheConfig(BaseModel):
+    """Render output cache configuration."""
+
+    enabled: bool = True  # Reuse outputs of identical renders
+    dir: Optional[Path] = None  # Cache root (default: $UGCKIT_CACHE_DIR or ~/.cache/ugckit)
+    max_size_mb: int = Field(default=2048, ge=0)  # LRU eviction above this total size
+
+
 class CompositionConfig(BaseModel):
     """Full composition configuration."""
 
@@ -167,6 +251,11 @@ class Config(BaseModel):
     audio: AudioConfig = Field(default_factory=AudioConfig)
     subtitles: SubtitleConfig = Field(default_factory=SubtitleConfig)
     music: MusicConfig = Field(default_factory=MusicConfig)
+    render: RenderConfig = Field(default_factory=RenderConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    mezzanine: MezzanineConfig = Field(default_factory=MezzanineConfig)
+    variants: VariantConfig = Field(default_factory=VariantConfig)
+    preview: PreviewConfig = Field(default_factory=PreviewConfig)
     screencasts_path: Path = Path("./assets/screencasts")
     output_path: Path = Path("./assets/output")
 
@@ -186,9 +275,10 @@ class Config(BaseModel):
                 data["output_path"] = paths["output"]
 
         # Handle resolution as list -> tuple
-        if "output" in data and "resolution" in data["output"]:
-            res = data["output"]["resolution"]
-            if isinstance(res, list) and len(res) == 2:
-                data["output"]["resolution"] = tuple(res)
+        for section in ("output", "preview"):
+            if section in data and "resolution" in data[section]:
+                res = data[section]["resolution"]
+                if isinstance(res, list) and len(res) == 2:
+                    data[section]["resolution"] = tuple(res)
 
         return data
@@ -0,0 +1,384 @@
+"""Minimal MP4/MOV container reader for UGCKit.
+
+Reads duration and track layout straight from the ``moov`` box so plain
+MP4 inputs can be probed without spawning ffprobe. The file is memory
+mapped and only box headers and ``moov`` contents are touched, never
+media data.
+"""
+
+from __future__ import annotations
+
+import mmap
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+MP4_SUFFIXES = {".mp4", ".m4v", ".m4a", ".mov"}
+
+# Sample entry fourcc -> ffprobe codec_name
+_CODEC_NAMES = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "hvc1": "hevc",
+    "hev1": "hevc",
+    "vp09": "vp9",
+    "av01": "av1",
+    "mp4v": "mpeg4",
+    "mp4a": "aac",
+    "Opus": "opus",
+    "ac-3": "ac3",
+    "ec-3": "eac3",
+    "sowt": "pcm_s16le",
+    "twos": "pcm_s16be",
+}
+
+# H.264 profile_idc -> pixel format (profiles that only allow 8-bit 4:2:0 or 10-bit 4:2:0)
+_AVC_PIX_FMTS = {66: "yuv420p", 77: "yuv420p", 88: "yuv420p", 100: "yuv420p", 110: "yuv420p10le"}
+# Full-range counterparts, named as ffprobe reports them
+_FULL_RANGE_PIX_FMTS = {"yuv420p": "yuvj420p"}
+# H.264 profile_idc -> ffprobe profile name
+_AVC_PROFILES = {
+    66: "Baseline",
+    77: "Main",
+    88: "Extended",
+    100: "High",
+    110: "High 10",
+    122: "High 4:2:2",
+    244: "High 4:4:4 Predictive",
+}
+# H.264 profiles whose SPS carries chroma format and bit depth fields
+_AVC_HIGH_PROFILES = {44, 83, 86, 100, 110, 118, 122, 128, 134, 135, 138, 139, 244}
+# HEVC general_profile_idc -> pixel format (Main, Main 10)
+_HEVC_PIX_FMTS = {1: "yuv420p", 2: "yuv420p10le"}
+
+
+class Mp4ParseError(Exception):
+    """File is not a parseable MP4/MOV container."""
+
+    pass
+
+
+@dataclass
+class Mp4Track:
+    """One track from the moov box."""
+
+    handler: str  # "vide", "soun", ...
+    timescale: int = 0
+    duration: int = 0  # in timescale units
+    sample_count: int = 0
+    codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    pix_fmt: Optional[str] = None
+    sar: Optional[str] = None
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    color_range: Optional[str] = None  # "tv" (limited) or "pc" (full), None if unsignalled
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+    @property
+    def fps(self) -> Optional[float]:
+        """Average frame rate from sample count and media duration."""
+        if not self.sample_count or not self.duration or not self.timescale:
+            return None
+        return self.sample_count * self.timescale / self.duration
+
+
+@dataclass
+class Mp4Info:
+    """Container-level information from the moov box."""
+
+    duration: float
+    tracks: List[Mp4Track] = field(default_factory=list)
+
+
+def _iter_boxes(buf, start: int, end: int) -> Iterator[Tuple[str, int, int]]:
+    """Yield (type, payload_start, box_end) for boxes in buf[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, raw_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                raise Mp4ParseError("truncated 64-bit box header")
+            (size,) = struct.unpack_from(">Q", buf, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise Mp4ParseError(f"invalid box size {size} at offset {pos}")
+        yield raw_type.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def _find_box(buf, start: int, end: int, box_type: str) -> Optional[Tuple[int, int]]:
+    """Return (payload_start, box_end) of the first child box of box_type."""
+    for kind, payload, box_end in _iter_boxes(buf, start, end):
+        if kind == box_type:
+            return payload, box_end
+    return None
+
+
+def _find_path(buf, start: int, end: int, *path: str) -> Optional[Tuple[int, int]]:
+    """Descend through nested boxes, e.g. _find_path(buf, s, e, "mdia", "minf")."""
+    span: Optional[Tuple[int, int]] = (start, end)
+    for box_type in path:
+        span = _find_box(buf, span[0], span[1], box_type)
+        if span is None:
+            return None
+    return span
+
+
+def _parse_mvhd(buf, pos: int) -> float:
+    version = buf[pos]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", buf, pos + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", buf, pos + 12)
+    if not timescale:
+        raise Mp4ParseError("mvhd timescale is zero")
+    return duration / timescale
+
+
+def _parse_mdhd(buf, pos: int) -> Tuple[int, int]:
+    version = buf[pos]
+    if version == 1:
+        return struct.unpack_from(">IQ", buf, pos + 20)
+    return struct.unpack_from(">II", buf, pos + 12)
+
+
+def _parse_tkhd_size(buf, pos: int) -> Tuple[int, int]:
+    offset = pos + (88 if buf[pos] == 1 else 76)
+    width, height = struct.unpack_from(">II", buf, offset)
+    return width >> 16, height >> 16
+
+
+def _parse_stts(buf, pos: int, end: int) -> int:
+    (entries,) = struct.unpack_from(">I", buf, pos + 4)
+    total = 0
+    offset = pos + 8
+    for _ in range(entries):
+        if offset + 8 > end:
+            raise Mp4ParseError("truncated stts")
+        count, _delta = struct.unpack_from(">II", buf, offset)
+        total += count
+        offset += 8
+    return total
+
+
+class _BitReader:
+    """MSB-first reader for H.264 RBSP fields."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def u(self, bits: int) -> int:
+        value = 0
+        for _ in range(bits):
+            value = (value << 1) | (self.data[self.pos >> 3] >> (7 - (self.pos & 7)) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self) -> int:
+        zeros = 0
+        while not self.u(1):
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _skip_scaling_list(bits: _BitReader, size: int) -> None:
+    last = next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last + bits.se()) % 256
+        last = next_scale or last
+
+
+def _avc_color_range(sps: bytes) -> Optional[str]:
+    """Colour range signalled in an H.264 SPS NAL unit's VUI, or None if absent."""
+    # Drop emulation prevention bytes and the NAL header
+    bits = _BitReader(sps.replace(b"\0\0\3", b"\0\0")[1:])
+    try:
+        profile_idc = bits.u(8)
+        bits.u(16)  # constraint flags, level_idc
+        bits.ue()  # seq_parameter_set_id
+        if profile_idc in _AVC_HIGH_PROFILES:
+            chroma_format_idc = bits.ue()
+            if chroma_format_idc == 3:
+                bits.u(1)  # separate_colour_plane_flag
+            bits.ue()  # bit_depth_luma_minus8
+            bits.ue()  # bit_depth_chroma_minus8
+            bits.u(1)  # qpprime_y_zero_transform_bypass_flag
+            if bits.u(1):  # seq_scaling_matrix_present_flag
+                for i in range(8 if chroma_format_idc != 3 else 12):
+                    if bits.u(1):
+                        _skip_scaling_list(bits, 16 if i < 6 else 64)
+        bits.ue()  # log2_max_frame_num_minus4
+        poc_type = bits.ue()
+        if poc_type == 0:
+            bits.ue()  # log2_max_pic_order_cnt_lsb_minus4
+        elif poc_type == 1:
+            bits.u(1)  # delta_pic_order_always_zero_flag
+            bits.se()  # offset_for_non_ref_pic
+            bits.se()  # offset_for_top_to_bottom_field
+            for _ in range(bits.ue()):
+                bits.se()
+        bits.ue()  # max_num_ref_frames
+        bits.u(1)  # gaps_in_frame_num_value_allowed_flag
+        bits.ue()  # pic_width_in_mbs_minus1
+        bits.ue()  # pic_height_in_map_units_minus1
+        if not bits.u(1):  # frame_mbs_only_flag
+            bits.u(1)  # mb_adaptive_frame_field_flag
+        bits.u(1)  # direct_8x8_inference_flag
+        if bits.u(1):  # frame_cropping_flag
+            for _ in range(4):
+                bits.ue()
+        if not bits.u(1):  # vui_parameters_present_flag
+            return None
+        if bits.u(1):  # aspect_ratio_info_present_flag
+            if bits.u(8) == 255:  # Extended_SAR
+                bits.u(32)
+        if bits.u(1):  # overscan_info_present_flag
+            bits.u(1)
+        if not bits.u(1):  # video_signal_type_present_flag
+            return None
+        bits.u(3)  # video_format
+        return "pc" if bits.u(1) else "tv"
+    except IndexError:
+        return None
+
+
+def _parse_avcc(buf, track: Mp4Track, child: int, end: int) -> None:
+    profile_idc, constraints, level_idc = buf[child + 1], buf[child + 2], buf[child + 3]
+    track.pix_fmt = _AVC_PIX_FMTS.get(profile_idc)
+    track.profile = _AVC_PROFILES.get(profile_idc)
+    if profile_idc == 66 and constraints & 0x40:
+        track.profile = "Constrained Baseline"
+    track.level = level_idc
+    # First SPS: 6-byte header, then a 16-bit length and the NAL unit
+    if child + 8 <= end and buf[child + 5] & 0x1F:
+        (length,) = struct.unpack_from(">H", buf, child + 6)
+        sps = bytes(buf[child + 8 : min(child + 8 + length, end)])
+        track.color_range = track.color_range or _avc_color_range(sps)
+
+
+def _parse_visual_entry(buf, track: Mp4Track, payload: int, end: int) -> None:
+    width, height = struct.unpack_from(">HH", buf, payload + 24)
+    track.width = width or track.width
+    track.height = height or track.height
+    # Child boxes follow the 78-byte VisualSampleEntry body
+    for kind, child, child_end in _iter_boxes(buf, payload + 78, end):
+        if kind == "avcC" and child + 4 <= child_end:
+            _parse_avcc(buf, track, child, child_end)
+        elif kind == "colr" and child + 11 <= child_end and buf[child : child + 4] == b"nclx":
+            # Primaries, transfer and matrix (3 x uint16), then the full_range_flag bit
+            track.color_range = "pc" if buf[child + 10] & 0x80 else "tv"
+        elif kind == "hvcC" and child + 2 <= child_end:
+            track.pix_fmt = _HEVC_PIX_FMTS.get(buf[child + 1] & 0x1F)
+        elif kind == "pasp" and child + 8 <= child_end:
+            h_spacing, v_spacing = struct.unpack_from(">II", buf, child)
+            track.sar = f"{h_spacing}:{v_spacing}"
+    if track.color_range == "pc":
+        track.pix_fmt = _FULL_RANGE_PIX_FMTS.get(track.pix_fmt, track.pix_fmt)
+
+
+def _parse_audio_entry(buf, track: Mp4Track, payload: int) -> None:
+    (version,) = struct.unpack_from(">H", buf, payload + 8)
+    if version == 2:
+        (rate,) = struct.unpack_from(">d", buf, payload + 32)
+        (channels,) = struct.unpack_from(">I", buf, payload + 40)
+        track.sample_rate = int(rate)
+        track.channels = channels
+    else:
+        (channels,) = struct.unpack_from(">H", buf, payload + 16)
+        (rate,) = struct.unpack_from(">I", buf, payload + 24)
+        track.sample_rate = rate >> 16
+        track.channels = channels
+
+
+def _parse_trak(buf, start: int, end: int) -> Optional[Mp4Track]:
+    hdlr = _find_path(buf, start, end, "mdia", "hdlr")
+    mdhd = _find_path(buf, start, end, "mdia", "mdhd")
+    if hdlr is None or mdhd is None:
+        return None
+
+    track = Mp4Track(handler=bytes(buf[hdlr[0] + 8 : hdlr[0] + 12]).decode("latin-1"))
+    track.timescale, track.duration = _parse_mdhd(buf, mdhd[0])
+
+    tkhd = _find_box(buf, start, end, "tkhd")
+    if tkhd is not None and track.handler == "vide":
+        width, height = _parse_tkhd_size(buf, tkhd[0])
+        track.width = width or None
+        track.height = height or None
+
+    stbl = _find_path(buf, start, end, "mdia", "minf", "stbl")
+    if stbl is None:
+        return track
+
+    stts = _find_box(buf, stbl[0], stbl[1], "stts")
+    if stts is not None:
+        track.sample_count = _parse_stts(buf, stts[0], stts[1])
+
+    stsd = _find_box(buf, stbl[0], stbl[1], "stsd")
+    if stsd is not None:
+        for kind, payload, entry_end in _iter_boxes(buf, stsd[0] + 8, stsd[1]):
+            track.codec = _CODEC_NAMES.get(kind, kind.strip())
+            if track.handler == "vide":
+                _parse_visual_entry(buf, track, payload, entry_end)
+            elif track.handler == "soun":
+                _parse_audio_entry(buf, track, payload)
+            break
+    return track
+
+
+def read_mp4(path: Path) -> Mp4Info:
+    """Read duration and track layout from an MP4/MOV file.
+
+    Args:
+        path: Path to MP4/MOV file.
+
+    Returns:
+        Mp4Info with movie duration and per-track parameters.
+
+    Raises:
+        Mp4ParseError: If the file is not a complete, non-fragmented MP4/MOV.
+        OSError: If the file cannot be opened.
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:  # empty file
+            raise Mp4ParseError(str(e)) from e
+
+    try:
+        try:
+            moov = _find_box(buf, 0, len(buf), "moov")
+            if moov is None:
+                raise Mp4ParseError("no moov box")
+            if _find_box(buf, moov[0], moov[1], "mvex") is not None:
+                raise Mp4ParseError("fragmented MP4")
+            mvhd = _find_box(buf, moov[0], moov[1], "mvhd")
+            if mvhd is None:
+                raise Mp4ParseError("no mvhd box")
+
+            info = Mp4Info(duration=_parse_mvhd(buf, mvhd[0]))
+            for kind, payload, box_end in _iter_boxes(buf, moov[0], moov[1]):
+                if kind == "trak":
+                    track = _parse_trak(buf, payload, box_end)
+                    if track is not None:
+                        info.tracks.append(track)
+        except (struct.error, IndexError) as e:
+            raise Mp4ParseError(f"truncated box: {e}") from e
+    finally:
+        buf.close()
+
+    if info.duration <= 0 or not info.tracks:
+        raise Mp4ParseError("no duration or tracks")
+    return info
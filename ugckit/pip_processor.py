@@ -6,10 +6,10 @@ Two-tier approach: basic (FFmpeg-only) and enhanced (MediaPipe + rembg).
 
 from __future__ import annotations
 
-import subprocess
 import tempfile
 from pathlib import Path
 
+from ugckit.composer import DEFAULT_STALL_TIMEOUT, FFmpegError, run_ffmpeg
 from ugckit.models import PipConfig, Position
 
 
@@ -18,6 +18,7 @@ def create_head_video(
     output_path: Path,
     config: PipConfig,
     output_width: int = 1080,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> Path:
     """Create head-only video from avatar clip.
 
@@ -28,6 +29,7 @@ def create_head_video(
         output_path: Path for output head video (WebM with alpha).
         config: PiP configuration.
         output_width: Output video width for scaling head size.
+        stall_timeout: Abort FFmpeg after this many seconds without progress.
 
     Returns:
         Path to head video file.
@@ -36,9 +38,9 @@ def create_head_video(
         PipProcessingError: If head extraction fails.
     """
     try:
-        return _create_head_enhanced(avatar_path, output_path, config, output_width)
+        return _create_head_enhanced(avatar_path, output_path, config, output_width, stall_timeout)
     except (ImportError, PipProcessingError):
-        return _create_head_basic(avatar_path, output_path, config, output_width)
+        return _create_head_basic(avatar_path, output_path, config, output_width, stall_timeout)
 
 
 class PipProcessingError(Exception):
@@ -79,6 +81,7 @@ def _create_head_basic(
     output_path: Path,
     config: PipConfig,
     output_width: int,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> Path:
     """FFmpeg-only: crop center square, apply circular mask via geq filter.
 
@@ -122,12 +125,9 @@ def _create_head_basic(
     ]
 
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-    except subprocess.TimeoutExpired:
-        raise PipProcessingError(f"Head extraction timed out for {avatar_path}")
-
-    if result.returncode != 0:
-        raise PipProcessingError(f"Head extraction failed: {result.stderr[:500]}")
+        run_ffmpeg(cmd, 0.0, stall_timeout=stall_timeout)
+    except FFmpegError as e:
+        raise PipProcessingError(f"Head extraction failed for {avatar_path}: {str(e)[:500]}")
 
     return output_path.with_suffix(".webm")
 
@@ -137,6 +137,7 @@ def _create_head_enhanced(
     output_path: Path,
     config: PipConfig,
     output_width: int,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> Path:
     """MediaPipe face detection + rembg: detect face, crop, remove bg, circular mask.
 
@@ -288,15 +289,12 @@ def _create_head_enhanced(
     ]
 
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-    except subprocess.TimeoutExpired:
-        raise PipProcessingError("Enhanced head encoding timed out")
+        run_ffmpeg(cmd, len(frames) / fps, stall_timeout=stall_timeout)
+    except FFmpegError as e:
+        raise PipProcessingError(f"Enhanced head encoding failed: {str(e)[:500]}")
     finally:
         raw_path.unlink(missing_ok=True)
 
-    if result.returncode != 0:
-        raise PipProcessingError(f"Enhanced head encoding failed: {result.stderr[:500]}")
-
     return out_webm
 
 
@@ -305,6 +303,7 @@ def create_transparent_avatar(
     output_path: Path,
     scale: float = 0.8,
     output_width: int = 1080,
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> Path:
     """Remove avatar background and produce a WebM VP9 video with alpha.
 
@@ -316,6 +315,7 @@ def create_transparent_avatar(
         output_path: Output path (will use .webm extension).
         scale: Scale factor relative to output_width.
         output_width: Reference output width.
+        stall_timeout: Abort FFmpeg after this many seconds without progress.
 
     Returns:
         Path to transparent avatar WebM file.
@@ -389,13 +389,10 @@ def create_transparent_avatar(
     ]
 
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-    except subprocess.TimeoutExpired:
-        raise PipProcessingError("Transparent avatar encoding timed out")
+        run_ffmpeg(cmd, len(frames_rgba) / fps, stall_timeout=stall_timeout)
+    except FFmpegError as e:
+        raise PipProcessingError(f"Transparent avatar encoding failed: {str(e)[:500]}")
     finally:
         raw_path.unlink(missing_ok=True)
 
-    if result.returncode != 0:
-        raise PipProcessingError(f"Transparent avatar encoding failed: {result.stderr[:500]}")
-
     return out_webm
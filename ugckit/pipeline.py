@@ -22,7 +22,13 @@ def prepare_pip_videos(avatar_list: list[Path], config: Config) -> list[Path]:
     for i, avatar in enumerate(avatar_list):
         head_out = tmp_dir / f"head_{i}.webm"
         try:
-            head_path = create_head_video(avatar, head_out, config.composition.pip)
+            head_path = create_head_video(
+                avatar,
+                head_out,
+                config.composition.pip,
+                output_width=config.output.resolution[0],
+                stall_timeout=config.render.stall_timeout,
+            )
             head_videos.append(head_path)
         except PipProcessingError:
             return []
@@ -46,6 +52,7 @@ def prepare_greenscreen_videos(avatar_list: list[Path], config: Config) -> list[
                 out,
                 scale=gs_cfg.avatar_scale,
                 output_width=config.output.resolution[0],
+                stall_timeout=config.render.stall_timeout,
             )
             transparent_avatars.append(ta_path)
         except (ImportError, PipProcessingError):
@@ -54,12 +61,22 @@ def prepare_greenscreen_videos(avatar_list: list[Path], config: Config) -> list[
     return transparent_avatars
 
 
-def apply_sync(script: Script, avatar_list: list[Path], model_name: str) -> Script:
-    """Resolve keyword-based screencast timing via Whisper. Returns original on failure."""
+def apply_sync(
+    script: Script,
+    avatar_list: list[Path],
+    model_name: str,
+    config: Optional[Config] = None,
+) -> Script:
+    """Resolve keyword-based screencast timing via Whisper. Returns original on failure.
+
+    config, when given, supplies the FFmpeg stall timeout (render.stall_timeout).
+    """
+    from ugckit.composer import DEFAULT_STALL_TIMEOUT
     from ugckit.sync import SyncError, sync_screencast_timing
 
+    stall_timeout = config.render.stall_timeout if config else DEFAULT_STALL_TIMEOUT
     try:
-        return sync_screencast_timing(script, avatar_list, model_name)
+        return sync_screencast_timing(script, avatar_list, model_name, stall_timeout=stall_timeout)
     except SyncError:
         return script
 
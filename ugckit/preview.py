@@ -0,0 +1,153 @@
+"""Low-resolution preview renders for UGCKit.
+
+A preview runs the same filter graph as the final render, scaled down to
+config.preview (e.g. 360x640 at 15 fps, ultrafast). Inputs are replaced
+by proxies: avatars transcoded to the preview geometry with 48 kHz stereo
+PCM audio (the mezzanine layout, see ugckit.mezzanine), screencasts
+shrunk to fit the preview frame. Proxies are cached by source content
+hash, so repeated previews only pay for the composite itself.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List
+
+from ugckit.cache import FileCache, file_hash, hash_payload
+from ugckit.composer import MediaInfo
+from ugckit.mezzanine import MEZZANINE_AUDIO_ARGS, transcode_inputs
+from ugckit.models import Config, Timeline
+
+# Bump when proxy commands change in ways the keys do not capture
+_PROXY_VERSION = 1
+
+
+def preview_config(config: Config) -> Config:
+    """Derive the render configuration of a preview from config.
+
+    Output geometry, frame rate and encoder settings come from
+    config.preview; pixel margins of the composition shrink by the same
+    factor as the output width. Renditions are not produced for previews.
+    preview.enabled stays set, marking the config as already derived.
+    """
+    pv_cfg = config.preview
+    cfg = config.model_copy(deep=True)
+    factor = pv_cfg.resolution[0] / config.output.resolution[0]
+    cfg.output.resolution = tuple(pv_cfg.resolution)
+    cfg.output.fps = pv_cfg.fps
+    cfg.output.preset = pv_cfg.preset
+    cfg.output.crf = pv_cfg.crf
+    cfg.output.renditions = []
+
+    comp = cfg.composition
+    comp.overlay.margin = round(comp.overlay.margin * factor)
+    comp.pip.head_margin = round(comp.pip.head_margin * factor)
+    comp.greenscreen.avatar_margin = round(comp.greenscreen.avatar_margin * factor)
+
+    # Proxies replace mezzanines and screencast variants
+    cfg.mezzanine.enabled = False
+    cfg.variants.enabled = False
+    return cfg
+
+
+def proxy_cache(config: Config) -> FileCache:
+    """Cache of preview proxies configured by config.preview."""
+    return FileCache("proxies", config.preview.max_size_mb * 1024 * 1024, root=config.cache.dir)
+
+
+def proxy_key(path: Path, kind: str, config: Config) -> str:
+    """Content-addressed key of a file's preview proxy.
+
+    Args:
+        path: Source media file.
+        kind: "avatar" or "screencast".
+        config: UGCKit configuration.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    pv_cfg = config.preview
+    return hash_payload(
+        {
+            "version": _PROXY_VERSION,
+            "kind": kind,
+            "file": file_hash(path),
+            "resolution": list(pv_cfg.resolution),
+            "fps": pv_cfg.fps,
+            "preset": pv_cfg.preset,
+            "crf": pv_cfg.crf,
+        }
+    )
+
+
+def build_proxy_cmd(
+    src: Path,
+    dest: Path,
+    kind: str,
+    config: Config,
+    info: MediaInfo,
+) -> List[str]:
+    """Build the FFmpeg command transcoding one input to its preview proxy.
+
+    Avatars always get an audio track (silence if the source has none), as
+    mezzanines do, so the preview graph treats them as normalized inputs.
+    Screencasts larger than the preview frame are shrunk to fit inside it
+    (no composition shows a screencast larger than the frame); smaller ones
+    keep their size.
+    """
+    pv_cfg = config.preview
+    w, h = pv_cfg.resolution
+    inputs = ["-i", str(src)]
+    if kind == "avatar":
+        vf = f"scale={w}:{h},setsar=1,fps={pv_cfg.fps},format=yuv420p"
+        if info.has_audio:
+            audio = ["-map", "0:a:0"] + MEZZANINE_AUDIO_ARGS
+        else:
+            inputs += ["-f", "lavfi", "-i", "anullsrc=r=48000:cl=stereo"]
+            audio = ["-map", "1:a"] + MEZZANINE_AUDIO_ARGS
+    else:
+        vf = f"fps={pv_cfg.fps},format=yuv420p"
+        if info.width and info.height and (info.width > w or info.height > h):
+            fit = min(w / info.width, h / info.height)
+            size = (
+                max(2, round(info.width * fit / 2) * 2),
+                max(2, round(info.height * fit / 2) * 2),
+            )
+            vf = f"scale={size[0]}:{size[1]},setsar=1,{vf}"
+        audio = ["-an"]
+
+    return (
+        ["ffmpeg"]
+        + inputs
+        + ["-map", "0:v:0", "-vf", vf]
+        + ["-c:v", "libx264", "-preset", pv_cfg.preset, "-crf", str(pv_cfg.crf)]
+        + audio
+        + ["-t", f"{info.duration:.3f}", "-f", "mov", "-y", str(dest)]
+    )
+
+
+def prepare_proxies(timeline: Timeline, config: Config) -> Timeline:
+    """Return a copy of timeline whose entries point at preview proxies.
+
+    Missing proxies are transcoded in parallel (config.render.jobs
+    workers); cached ones are reused. Eviction runs once at the end and
+    never removes the proxies this timeline uses.
+
+    Args:
+        timeline: Composition timeline with original input files.
+        config: UGCKit configuration.
+
+    Returns:
+        Timeline with the same timing and entry files replaced.
+
+    Raises:
+        FFmpegError: If an input is missing or cannot be transcoded.
+    """
+    return transcode_inputs(
+        timeline,
+        config,
+        proxy_cache(config),
+        lambda src, kind: proxy_key(src, kind, config),
+        lambda src, dest, kind, info: build_proxy_cmd(src, dest, kind, config, info),
+        "preview proxy",
+    )
@@ -48,7 +48,9 @@ def generate_subtitle_file(
         return None
 
     avatar_entries = [e for e in timeline.entries if e.type == "avatar"]
-    words = _transcribe_all_clips(avatar_entries, avatar_clips, sub_cfg.whisper_model)
+    words = _transcribe_all_clips(
+        avatar_entries, avatar_clips, sub_cfg.whisper_model, config.render.stall_timeout
+    )
     if not words:
         return None
 
@@ -64,6 +66,7 @@ def _transcribe_all_clips(
     avatar_entries: list,
     avatar_clips: list[Path],
     model_name: str,
+    stall_timeout: float,
 ) -> list[WordTimestamp]:
     """Transcribe each avatar clip, offset timestamps by clip start in timeline."""
     from ugckit.sync import transcribe_audio
@@ -78,7 +81,7 @@ def _transcribe_all_clips(
         clip_offset = entry.start
 
         try:
-            clip_words = transcribe_audio(clip_path, model_name)
+            clip_words = transcribe_audio(clip_path, model_name, stall_timeout)
         except Exception:
             continue
 
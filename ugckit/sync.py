@@ -6,12 +6,12 @@ then matches keyword triggers to actual spoken timing.
 
 from __future__ import annotations
 
-import subprocess
 import tempfile
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
+from ugckit.composer import DEFAULT_STALL_TIMEOUT, FFmpegError, run_ffmpeg
 from ugckit.models import ScreencastOverlay, Script
 
 
@@ -47,12 +47,15 @@ def _get_whisper_model(model_name: str):
 def transcribe_audio(
     video_path: Path,
     model_name: str = "base",
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> list[WordTimestamp]:
     """Run Whisper on video audio, return word-level timestamps.
 
     Args:
         video_path: Path to video file.
         model_name: Whisper model size (tiny, base, small, medium, large).
+        stall_timeout: Seconds without FFmpeg progress before audio
+            extraction is aborted (see ugckit.composer.run_ffmpeg).
 
     Returns:
         List of WordTimestamp with per-word timing.
@@ -82,9 +85,10 @@ def transcribe_audio(
             "1",
             str(wav_path),
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        if result.returncode != 0:
-            raise SyncError(f"Audio extraction failed: {result.stderr[:300]}")
+        try:
+            run_ffmpeg(cmd, 0.0, stall_timeout=stall_timeout)
+        except FFmpegError as e:
+            raise SyncError(f"Audio extraction failed: {str(e)[:300]}")
         result = model.transcribe(
             str(wav_path),
             word_timestamps=True,
@@ -144,6 +148,7 @@ def sync_screencast_timing(
     script: Script,
     avatar_clips: list[Path],
     model_name: str = "base",
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
 ) -> Script:
     """Replace keyword-based screencast timing with actual timestamps from speech.
 
@@ -154,6 +159,7 @@ def sync_screencast_timing(
         script: Parsed script with keyword-based screencasts.
         avatar_clips: Avatar video files (one per segment).
         model_name: Whisper model size.
+        stall_timeout: See transcribe_audio.
 
     Returns:
         New Script with resolved screencast timings.
@@ -175,7 +181,7 @@ def sync_screencast_timing(
 
         if clip_key not in transcripts:
             try:
-                transcripts[clip_key] = transcribe_audio(clip_path, model_name)
+                transcripts[clip_key] = transcribe_audio(clip_path, model_name, stall_timeout)
             except SyncError:
                 updated_segments.append(segment)
                 continue